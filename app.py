@@ -1,98 +1,355 @@
 import streamlit as st
-import json
+import re
+import secrets
 import time
-import re   
-from PIL import Image
-from modules import ia_core, interfaz, temario, banco_preguntas
+import uuid
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from modules import almacen_preguntas, backend_modelo, banco_indexado, dominio, interfaz, temario, cache_fotos, cache_tutor, cliente_gemini, coalescencia, enrutador_modelos, esquemas, generador_parametrico, graficos, historial, imagen, latex_render, json_incremental, pool_quiz, telemetria, tutor_ia, tutor_lote, tutor_precalculado, verificador
 
 # --- 1. CONFIGURACIÓN INICIAL ---
+inicio_ejecucion = time.perf_counter()
 interfaz.configurar_pagina()
 
-if not ia_core.configurar_gemini():
+# Gemini real o el servidor simulado de las pruebas de carga (TUTOR_BACKEND).
+# Una sola instancia por proceso: los reruns no reconfiguran el cliente.
+modelo_backend = backend_modelo.obtener_modelo()
+if modelo_backend is None:
     st.stop()
 
-model, nombre_modelo = ia_core.iniciar_modelo()
+model, nombre_modelo = modelo_backend
 
 # =======================================================
 # FUNCIONES DE SEGURIDAD Y UTILIDADES
 # =======================================================
 
-def generar_contenido_seguro(prompt_parts, intentos_max=3):
+def reiniciar():
+    """ st.rerun() cronometrado: la ejecución que lo pide queda en la telemetría. """
+    telemetria.registrar_ejecucion(ruta, time.perf_counter() - inicio_ejecucion, "rerun")
+    st.rerun()
+
+# Identificadores generados: token de 128 bits o el formato anterior (12 hex aleatorios)
+_RE_ESTUDIANTE = re.compile(r"[A-Za-z0-9_-]{22,64}|[0-9a-f]{12}")
+
+def identificador_estudiante(valor):
+    """
+    Identificador del estudiante: el de la URL si tiene la forma de uno
+    generado, o uno nuevo e impredecible. NO es autenticación: es un token
+    al portador y quien tenga el enlace es ese estudiante. Solo impide
+    elegir a mano un nombre (?estudiante=maria) y dar con el de otro.
+    """
+    if valor and _RE_ESTUDIANTE.fullmatch(valor):
+        return valor
+    return secrets.token_urlsafe(16)
+
+def generar_contenido_seguro(prompt_parts, intentos_max=None, avisar=True, modelo=None):
     """
     Intenta llamar a la IA con texto o imágenes. 
     Soporta lista de partes (prompt + imagen) o solo texto.
+    La cuota, la concurrencia y los reintentos los gestiona el cliente
+    global (cliente_gemini), compartido por todas las sesiones.
+    Con avisar=False no toca la UI (para hilos en segundo plano).
+    modelo: (modelo, nombre) elegido por el enrutador; por defecto, el del backend.
     """
-    errores_recientes = ""
-    for i in range(intentos_max):
-        try:
-            return model.generate_content(prompt_parts)
-        except Exception as e:
-            errores_recientes = str(e)
-            if "429" in str(e):
-                tiempo_espera = 4 * (i + 1)
-                st.toast(f"🚦 Tráfico alto. Reintentando en {tiempo_espera}s...", icon="⏳")
-                time.sleep(tiempo_espera)
-            else:
-                time.sleep(1)
-    
-    st.error(f"❌ Error de conexión: {errores_recientes}")
-    return None
+    modelo_elegido, nombre_elegido = modelo or (model, nombre_modelo)
 
-def limpiar_json(texto):
+    def al_reintentar(tiempo_espera, error):
+        if avisar and cliente_gemini.es_error_cuota(error):
+            st.toast(f"🚦 Tráfico alto. Reintentando en {tiempo_espera:.0f}s...", icon="⏳")
+
+    def llamar(cancelar):
+        return cliente_gemini.generar(
+            modelo_elegido, prompt_parts, intentos_max=intentos_max, al_reintentar=al_reintentar, cancelar=cancelar
+        )
+
+    try:
+        # Prompts idénticos en vuelo (misma clase, mismo simulacro) comparten una sola llamada.
+        return coalescencia.ejecutar(coalescencia.clave_prompt(nombre_elegido, prompt_parts), llamar)
+    except cliente_gemini.ErrorIA as e:
+        if avisar:
+            st.error(f"❌ Error de conexión: {e}")
+        return None
+
+def generar_texto_streaming(prompt_parts, al_avanzar, modelo=None):
     """
-    Limpieza quirúrgica para respuestas con LaTeX.
+    Pide la respuesta en streaming y llama a al_avanzar(campos) cada vez que
+    se completa un campo del JSON. Devuelve el texto completo aunque no sea
+    JSON válido (lo analiza y valida el enrutador, que escala si hace falta)
+    o None si la IA no respondió. Solo si el modelo no admite streaming se
+    usa la vía normal. Comparte la llamada con los prompts idénticos en
+    vuelo, con la misma clave que `generar_contenido_seguro`.
     """
-    if not texto: return None
-    texto = texto.replace("```json", "").replace("```", "").strip()
-    
-    # Intento 1: Directo
+    modelo_elegido, nombre_elegido = modelo or (model, nombre_modelo)
+    parser = json_incremental.ParserIncremental()
+
+    def al_reiniciar():
+        # Corte a mitad del stream: el cliente lo pide de nuevo desde el principio
+        nonlocal parser
+        parser = json_incremental.ParserIncremental()
+
+    def llamar(cancelar):
+        fragmentos = cliente_gemini.generar(modelo_elegido, prompt_parts, stream=True, cancelar=cancelar,
+                                            al_reiniciar=al_reiniciar)
+        for fragmento in fragmentos:
+            try:
+                texto = fragmento.text
+            except ValueError:
+                # Fragmento sin texto (p. ej. bloqueado)
+                continue
+            if parser.alimentar(texto):
+                al_avanzar(dict(parser.campos))
+        return cliente_gemini.RespuestaAcumulada(parser.texto)
+
+    try:
+        respuesta = coalescencia.ejecutar(coalescencia.clave_prompt(nombre_elegido, prompt_parts), llamar)
+    except cliente_gemini.StreamNoSoportado as e:
+        print(f"Aviso: streaming no disponible {e}")
+        respuesta = generar_contenido_seguro(prompt_parts, modelo=modelo)
+        return respuesta.text if respuesta else None
+    except cliente_gemini.ErrorIA as e:
+        # Reintentos y plazo ya agotados: otra llamada entera solo alargaría la espera
+        st.error(f"❌ Error de conexión: {e}")
+        return None
+    texto = respuesta.text
+    if not parser.texto and texto:
+        # La pidió otra sesión: los campos llegan todos de una vez
+        parser.alimentar(texto)
+        if parser.campos:
+            al_avanzar(dict(parser.campos))
+    return texto or None
+
+def llamador_ia(prompt_parts, avisar=True, al_avanzar=None):
+    """ llamar(modelo, nombre) -> texto o None, para `enrutador_modelos.resolver`. """
+    def llamar(modelo_elegido, nombre_elegido):
+        if al_avanzar:
+            return generar_texto_streaming(prompt_parts, al_avanzar, (modelo_elegido, nombre_elegido))
+        respuesta = generar_contenido_seguro(prompt_parts, avisar=avisar, modelo=(modelo_elegido, nombre_elegido))
+        return respuesta.text if respuesta else None
+    return llamar
+
+def tutor_guardado(pregunta_texto, tema):
+    """
+    (tutoría precalculada o cacheada, o None; {modelo: clave de caché}).
+    Cada modelo de la ruta guarda con su clave; se lee primero la del fuerte.
+    """
+    claves = {nombre: cache_tutor.generar_clave(pregunta_texto, tema, nombre, tutor_ia.VERSION_PROMPT_TUTOR)
+              for _, _, nombre in reversed(enrutador_modelos.escalera("tutor"))}
+    datos_precalculados = tutor_precalculado.buscar(pregunta_texto, tema)
+    if datos_precalculados is not None:
+        return datos_precalculados, claves
+    return cache_tutor.obtener_alguna(list(claves.values())), claves
+
+def pedir_tutor(pregunta_texto, tema, avisar=True, al_avanzar=None, verificar=True):
+    """
+    Tutoría nueva de la IA (sin caché): (datos, modelo que la dio) o
+    (None, None). Con verificar=False solo se exige el esquema.
+    """
+    prompt = tutor_ia.construir_prompt_tutor(pregunta_texto, tema)
+
+    def validar(datos):
+        if not tutor_ia.validar_tutor(datos):
+            return "esquema"
+        if verificar and verificador.verificar_tutor(pregunta_texto, datos) == verificador.INVALIDO:
+            print(f"Aviso: tutoría rechazada por verificación simbólica [{tema}]")
+            return "verificacion"
+        return None
+
+    # Modelo rápido primero; si su tutoría no sirve, se regenera con el fuerte
+    return enrutador_modelos.resolver("tutor", prompt, llamador_ia(prompt, avisar, al_avanzar), validar, con_modelo=True)
+
+@telemetria.instrumentar("generar_tutor_paso_a_paso")
+def generar_tutor_paso_a_paso(pregunta_texto, tema, avisar=True, al_avanzar=None):
+    """
+    Genera la tutoría para el modo Entrenamiento (Banco/IA), ya verificada.
+    Espera a SymPy: desde la pantalla solo se usa si el alumno pidió otra
+    tutoría porque la primera resultó incorrecta.
+    """
+    datos, claves = tutor_guardado(pregunta_texto, tema)
+    if datos is not None:
+        return datos
+    datos, modelo_tutor = pedir_tutor(pregunta_texto, tema, avisar, al_avanzar)
+    if datos is not None:
+        cache_tutor.guardar(claves[modelo_tutor], datos)
+    return datos
+
+@telemetria.instrumentar("generar_tutor_en_vivo")
+def generar_tutor_en_vivo(pregunta_texto, tema, al_avanzar=None):
+    """
+    Tutoría pedida desde la pantalla del Dojo: se muestra en cuanto cumple
+    el esquema y la verificación simbólica corre en segundo plano.
+    Devuelve (datos, Future del veredicto o None si ya estaba guardada).
+    Solo va a la caché si la verificación no la declara INVALIDA.
+    """
+    datos, claves = tutor_guardado(pregunta_texto, tema)
+    if datos is not None:
+        return datos, None
+    datos, modelo_tutor = pedir_tutor(pregunta_texto, tema, al_avanzar=al_avanzar, verificar=False)
+    if datos is None:
+        return None, None
+    futuro = verificador.verificar_tutor_en_fondo(pregunta_texto, datos)
+
+    def guardar(futuro):
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        if futuro.result() == verificador.INVALIDO:
+            print(f"Aviso: tutoría rechazada por verificación simbólica [{tema}]")
+        else:
+            cache_tutor.guardar(claves[modelo_tutor], datos)
+    futuro.add_done_callback(guardar)
+    return datos, futuro
+
+def generar_tutor_prefetch(pregunta_texto, tema):
+    """ Tutoría de un ejercicio en segundo plano, con sus fórmulas ya dibujadas. """
+    datos = generar_tutor_paso_a_paso(pregunta_texto, tema, avisar=False)
+    latex_render.preparar_tutor(datos)
+    return datos
+
+def generar_tutores_lote(ejercicios):
+    """ Tutorías de varios ejercicios [(pregunta, tema)] en una sola llamada (sin tocar la UI). """
+    # El lote va al primer modelo de la ruta y los ejercicios rechazados, al último (el fuerte)
+    pasos = enrutador_modelos.escalera("tutor_lote")
+    llamadas = [
+        enrutador_modelos.medido("tutor_lote", nivel, nombre,
+                                 lambda prompt, m=(modelo_elegido, nombre): generar_contenido_seguro(prompt, avisar=False, modelo=m))
+        for nivel, modelo_elegido, nombre in pasos
+    ]
+    if not llamadas:
+        return [None] * len(ejercicios)
+    tutores = tutor_lote.generar(ejercicios, llamadas[0], pasos[0][2], llamar_reintento=llamadas[-1],
+                                 nombre_reintento=pasos[-1][2])
+    for datos in tutores:
+        latex_render.preparar_tutor(datos)
+    return tutores
+
+def iniciar_prefetch_tutor(lista):
+    """
+    Lanza en segundo plano la tutoría de todos los ejercicios de la serie:
+    el primero solo (para mostrarlo cuanto antes) y el resto en un único
+    lote. Los futuros quedan en la sesión indexados por posición del ejercicio.
+    """
+    detener_prefetch_tutor()
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch_tutor")
+    dueno = uuid.uuid4().hex
+    # Si la sesión se cierra sin detenerlo, al liberarse el executor se cancela lo que solo esperaba ella
+    weakref.finalize(executor, coalescencia.cancelar_dueno, dueno)
+    st.session_state.entrenamiento_executor = executor
+    st.session_state.entrenamiento_dueno = dueno
+    ejercicios = [(ej['pregunta'], ej.get('tema', 'Cálculo')) for ej in lista]
+    futuros = {0: executor.submit(coalescencia.con_dueno, dueno, generar_tutor_prefetch, *ejercicios[0])} if ejercicios else {}
+    if len(ejercicios) > 1:
+        lote = executor.submit(coalescencia.con_dueno, dueno, generar_tutores_lote, ejercicios[1:])
+        futuros.update({i: Future() for i in range(1, len(ejercicios))})
+
+        def repartir(futuro_lote):
+            for i in range(1, len(ejercicios)):
+                if futuro_lote.cancelled():
+                    futuros[i].cancel()
+                elif futuro_lote.exception() is not None:
+                    futuros[i].set_exception(futuro_lote.exception())
+                else:
+                    futuros[i].set_result(futuro_lote.result()[i - 1])
+        lote.add_done_callback(repartir)
+    st.session_state.entrenamiento_prefetch = futuros
+
+def detener_prefetch_tutor():
+    """ Cancela lo pendiente y lo que ya está en vuelo solo para esta sesión, y libera sus hilos. """
+    executor = st.session_state.get("entrenamiento_executor")
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        coalescencia.cancelar_dueno(st.session_state.get("entrenamiento_dueno"))
+    st.session_state.entrenamiento_executor = None
+    st.session_state.entrenamiento_dueno = None
+    st.session_state.entrenamiento_prefetch = {}
+
+def obtener_tutor_prefetch(idx):
+    """
+    Tutoría precargada del ejercicio idx (espera si sigue en curso).
+    Devuelve None si no hubo prefetch o falló: se usa la vía síncrona.
+    """
+    futuro = st.session_state.get("entrenamiento_prefetch", {}).pop(idx, None)
+    if futuro is None or futuro.cancelled():
+        return None
     try:
-        return json.loads(texto)
-    except json.JSONDecodeError:
-        pass
+        return futuro.result()
+    except Exception as e:
+        print(f"Aviso: prefetch del ejercicio {idx} falló {e}")
+        return None
+
+def mostrar_formula(latex, estilo="neutro"):
+    """
+    Fórmula destacada (paso intermedio, resultado, enunciado): el SVG ya
+    dibujado en el servidor, en un recuadro con los colores de st.info /
+    st.success. Si mathtext no la entiende, la dibuja el navegador como antes.
+    """
+    fondo = {"info": "#e8f0fb", "exito": "#e6f4ea", "neutro": "#f4f5f7"}[estilo]
+    imagen_formula = latex_render.imagen_html(latex, bloque=True)
+    if imagen_formula is None:
+        st.markdown(f"$$ {latex_render.normalizar(latex)} $$")
+    else:
+        st.markdown(f'<div style="background:{fondo};border-radius:0.5rem;padding:0.5rem 1rem;margin-bottom:1rem">'
+                    f'{imagen_formula}</div>', unsafe_allow_html=True)
+
+# Cada cuánto se re-ejecuta el fragmento que espera un trabajo de fondo
+INTERVALO_SONDEO = 1
 
-    # Intento 2: Reparación Regex para LaTeX
+@st.fragment(run_every=INTERVALO_SONDEO)
+def esperar_futuro(futuro):
+    """
+    Espera un trabajo de fondo sin bloquear la pantalla: mientras sigue en
+    curso solo se re-ejecuta este fragmento; al terminar, un rerun completo
+    muestra el resultado y el fragmento deja de llamarse.
+    """
+    if futuro.done():
+        st.rerun()
+
+def mostrar_grafico(zona, futuro):
+    """
+    Rellena la zona reservada con la región/sólido del problema si ya está
+    dibujada. No espera: si sigue en curso, un fragmento sondea el Future
+    y al terminar pide el rerun que la muestra (mismo Future).
+    """
+    if not futuro.done():
+        esperar_futuro(futuro)
+        return
     try:
-        # Escapa barras invertidas que no sean de control JSON
-        texto_reparado = re.sub(r'\\(?!["\\/bfnrtu])', r'\\\\', texto)
-        return json.loads(texto_reparado)
+        png = futuro.result()
     except Exception:
-        # Intento 3: Fuerza bruta si falla regex
-        try:
-             return json.loads(texto.replace("\\", "\\\\"))
-        except:
-             return None
-
-def generar_tutor_paso_a_paso(pregunta_texto, tema):
-    """ Genera la tutoría para el modo Entrenamiento (Banco/IA) """
-    prompt = f"""
-    Actúa como un profesor experto de cálculo. Para el siguiente ejercicio de {tema}:
-    "{pregunta_texto}"
-    
-    Genera un objeto JSON estricto.
-    REGLAS LATEX (CRÍTICO):
-    1. Escribe la fórmula pura. NO incluyas signos "$$" dentro del JSON.
-    2. Usa DOBLE BARRA para comandos: \\\\frac, \\\\int.
-    
-    Estructura JSON:
-    {{
-        "estrategias": ["Estrategia Correcta", "Estrategia Incorrecta 1", "Estrategia Incorrecta 2"],
-        "indice_correcta": 0,
-        "feedback_estrategia": "Explicación breve.",
-        "paso_intermedio": "Ecuación LaTeX PURA (sin $$) del hito",
-        "resultado_final": "Ecuación LaTeX PURA (sin $$) del resultado"
-    }}
-    Orden aleatorio en estrategias.
+        return
+    if png:
+        zona.image(png, caption="Región del problema", use_container_width=True)
+
+@telemetria.instrumentar("generar_preguntas_pool")
+def generar_preguntas_pool(tema, cantidad):
+    """ Generador del pool de Quiz: corre en el hilo de fondo, sin UI. """
+    if generador_parametrico.plantilla_para_tema(tema):
+        return generador_parametrico.generar(tema, cantidad)
+    return generar_preguntas_ia([tema], cantidad, avisar=False)
+
+def generar_preguntas_ia(temas, cantidad, avisar=True):
     """
-    response = generar_contenido_seguro(prompt)
-    if response:
-        return limpiar_json(response.text)
-    return None
+    Preguntas de opción múltiple de la IA (ruta "quiz" del enrutador), ya
+    filtradas por la verificación; se sube al modelo fuerte si el rápido no
+    deja ninguna válida. None si no se obtuvo nada.
+    """
+    prompt = temario.generar_prompt_quiz(temas, cantidad)
+    filtradas = []
+
+    def validar(preguntas):
+        if not isinstance(preguntas, list):
+            return "esquema"
+        filtradas[:] = verificador.filtrar_preguntas_quiz(preguntas)
+        return None if filtradas else "verificacion"
+
+    if enrutador_modelos.resolver("quiz", prompt, llamador_ia(prompt, avisar), validar) is None:
+        return None
+    return filtradas
 
-def analizar_problema_usuario(texto_usuario, imagen_usuario=None):
+@telemetria.instrumentar("analizar_problema_usuario")
+def analizar_problema_usuario(texto_usuario, imagen_usuario=None, al_avanzar=None):
     """
     Analiza un problema subido por el alumno (Texto o Imagen).
     Distingue entre Integrales/EDO (Rígido) y Aplicaciones (Flexible).
+    Con al_avanzar, los campos se entregan en streaming según se completan.
     """
     prompt_base = """
     Actúa como un Tutor Experto de Matemáticas III.
@@ -130,16 +387,66 @@ def analizar_problema_usuario(texto_usuario, imagen_usuario=None):
         contenido.append(imagen_usuario)
         contenido.append("Transcribe y resuelve.")
 
-    response = generar_contenido_seguro(contenido)
-    if response:
-        return limpiar_json(response.text)
-    return None
+    def validar(datos):
+        if not tutor_ia.validar_analisis(datos):
+            return "esquema"
+        if verificador.verificar_analisis(datos) == verificador.INVALIDO:
+            print("Aviso: análisis rechazado por verificación simbólica")
+            return "verificacion"
+        return None
+
+    # Enunciados cortos de texto: modelo rápido y, si falla, el fuerte. Fotos y problemas largos: directo al fuerte.
+    ruta_modelo = enrutador_modelos.ruta_analisis(texto_usuario, bool(imagen_usuario))
+    return enrutador_modelos.resolver(ruta_modelo, contenido, llamador_ia(contenido, al_avanzar=al_avanzar), validar)
+
+def transcribir_enunciado(img_blob):
+    """ Solo el enunciado de la foto, con el modelo rápido: la caché de fotos lo compara con el guardado. """
+    contenido = [tutor_ia.construir_prompt_transcripcion(), img_blob]
+
+    def validar(datos):
+        return None if isinstance(datos, dict) and isinstance(datos.get("enunciado_latex"), str) else "esquema"
+
+    datos = enrutador_modelos.resolver("transcripcion", contenido, llamador_ia(contenido, avisar=False), validar)
+    return datos["enunciado_latex"] if datos else None
+
+def id_consulta(datos):
+    """ Identificador del problema consultado (hash del enunciado, como los ítems del pool). """
+    return pool_quiz.id_pregunta({'pregunta': datos.get('enunciado_latex', '')})
+
+def mostrar_avance_parcial(zona, campos):
+    """ Pinta lo que ya llegó del JSON mientras el resto se sigue generando. """
+    with zona.container():
+        if campos.get('tema_detectado'):
+            st.markdown(f"**Tema Detectado:** `{campos['tema_detectado']}`")
+        if campos.get('enunciado_latex'):
+            st.markdown(f"**Problema Identificado:**\n$$ {campos['enunciado_latex'].replace('$', '')} $$")
+        if campos.get('estrategias'):
+            st.write("Caminos posibles:")
+            for estrategia in campos['estrategias']:
+                st.markdown(f"- {estrategia}")
+
+# Métricas Prometheus en /metrics si se define TUTOR_METRICAS_PUERTO
+telemetria.iniciar_servidor_metricas()
+
+# Pool de preguntas IA precalentado (un único hilo por proceso)
+# Los temas con plantilla paramétrica se generan al vuelo: no hace falta precalentarlos.
+pool_quiz.iniciar(generar_preguntas_pool, [
+    t for t in list(temario.TEMAS_PARCIAL_1) + list(temario.TEMAS_PARCIAL_2)
+    if not generador_parametrico.plantilla_para_tema(t)
+])
 
 # --- 2. GESTIÓN DE ESTADO ---
+# Identificador estable del estudiante (va en la URL: sobrevive a recargas).
+# No autentica: el progreso es de quien tenga el enlace, no hay cuentas.
+if "estudiante" not in st.session_state:
+    st.session_state.estudiante = identificador_estudiante(st.query_params.get("estudiante"))
+    st.query_params["estudiante"] = st.session_state.estudiante
 if "quiz_activo" not in st.session_state: st.session_state.quiz_activo = False
-if "preguntas_quiz" not in st.session_state: st.session_state.preguntas_quiz = []
+if "quiz_ids" not in st.session_state: st.session_state.quiz_ids = []  # IDs en almacen_preguntas
+if "quiz_respaldo" not in st.session_state: st.session_state.quiz_respaldo = {}  # referencias por si el almacén las expulsa
 if "indice_pregunta" not in st.session_state: st.session_state.indice_pregunta = 0
-if "respuestas_usuario" not in st.session_state: st.session_state.respuestas_usuario = [] 
+if "respuestas_usuario" not in st.session_state: st.session_state.respuestas_usuario = []  # (id, letra, puntos)
+if "quiz_vistas" not in st.session_state: st.session_state.quiz_vistas = set()
 
 # Estados para Respuesta Guiada (Modo B)
 if "consulta_step" not in st.session_state: st.session_state.consulta_step = 0
@@ -148,6 +455,9 @@ if "consulta_validada" not in st.session_state: st.session_state.consulta_valida
 
 # --- 3. INTERFAZ PRINCIPAL ---
 ruta, tema_actual = interfaz.mostrar_sidebar()
+# El prefetch del Dojo solo sirve dentro del Dojo: al cambiar de modo se liberan sus hilos
+if ruta != "a) Entrenamiento (Temario)" and st.session_state.get("entrenamiento_executor") is not None:
+    detener_prefetch_tutor()
 interfaz.mostrar_bienvenida()
 
 # =======================================================
@@ -173,39 +483,44 @@ if ruta == "a) Entrenamiento (Temario)":
                 st.error("⚠️ Selecciona al menos un tema.")
             else:
                 cargar_exito = False
-                with st.spinner("Preparando tu serie de ejercicios..."):
+                with st.spinner("Preparando tu serie de ejercicios..."), telemetria.span("preparar_serie_dojo"):
                     try:
                         import random
                         lista_entrenamiento = []
                         
-                        # 1. Banco de Preguntas (Protegido)
-                        try:
-                            preguntas_banco = banco_preguntas.obtener_preguntas_fijas(temas_entrenamiento, 2)
-                            if preguntas_banco:
-                                lista_entrenamiento.extend(preguntas_banco)
-                        except Exception as e:
-                            print(f"Aviso: Banco no disponible {e}")
-
-                        # 2. Generación IA (Protegida)
+                        # 1. Repasos vencidos y banco, según el dominio del estudiante
+                        planificados = dominio.elegir_ejercicios(st.session_state.estudiante, temas_entrenamiento, 2)
+                        lista_entrenamiento.extend(planificados)
+                        # Lo que falta se reparte entre los temas aún no dominados
+                        temas_entrenamiento = dominio.temas_prioritarios(st.session_state.estudiante, temas_entrenamiento)
+
+                        # 2. Plantillas paramétricas (locales, sin IA) para los temas que las tienen
                         faltantes = 5 - len(lista_entrenamiento)
+                        temas_ia = [t for t in temas_entrenamiento if not generador_parametrico.plantilla_para_tema(t)]
                         if faltantes > 0:
-                            prompt_train = temario.generar_prompt_quiz(temas_entrenamiento, faltantes)
-                            respuesta_ia = generar_contenido_seguro(prompt_train)
-                            
-                            if respuesta_ia:
-                                preguntas_ia = limpiar_json(respuesta_ia.text)
-                                if preguntas_ia: 
-                                    lista_entrenamiento.extend(preguntas_ia)
+                            cuota_local = faltantes if not temas_ia else round(faltantes * (1 - len(temas_ia) / len(temas_entrenamiento)))
+                            lista_entrenamiento.extend(generador_parametrico.generar_para_temas(temas_entrenamiento, cuota_local))
+
+                        # 3. Generación IA (Protegida)
+                        faltantes = 5 - len(lista_entrenamiento)
+                        if faltantes > 0 and temas_ia:
+                            preguntas_ia = generar_preguntas_ia(temas_ia, faltantes)
+                            if preguntas_ia:
+                                lista_entrenamiento.extend(preguntas_ia)
                         
                         if not lista_entrenamiento:
                             st.error("No se encontraron preguntas. Intenta con otro tema.")
                         else:
-                            random.shuffle(lista_entrenamiento)
-                            st.session_state.entrenamiento_lista = lista_entrenamiento[:5]
+                            resto = lista_entrenamiento[len(planificados):]
+                            random.shuffle(resto)
+                            lista_entrenamiento = planificados + resto
+                            st.session_state.entrenamiento_ids = almacen_preguntas.guardar_lista(lista_entrenamiento[:5])
+                            iniciar_prefetch_tutor(lista_entrenamiento[:5])
                             st.session_state.entrenamiento_idx = 0
                             st.session_state.entrenamiento_step = 1
-                            st.session_state.entrenamiento_data_ia = None
+                            st.session_state.entrenamiento_tutor_id = None
                             st.session_state.entrenamiento_validado = False 
+                            st.session_state.entrenamiento_registrados = set()
                             st.session_state.entrenamiento_activo = True
                             cargar_exito = True
 
@@ -213,35 +528,72 @@ if ruta == "a) Entrenamiento (Temario)":
                         st.error(f"Error técnico al iniciar: {e}")
                 
                 if cargar_exito:
-                    st.rerun()
+                    reiniciar()
 
     # --- PANTALLA DE EJERCICIOS (El Dojo) ---
     else:
         idx = st.session_state.entrenamiento_idx
-        lista = st.session_state.entrenamiento_lista
+        ids = st.session_state.entrenamiento_ids
         
-        if idx < len(lista):
-            ejercicio = lista[idx]
+        if idx < len(ids):
+            ejercicio = almacen_preguntas.obtener(ids[idx])
+            if ejercicio is None:
+                # Expulsado del almacén compartido (sesión inactiva mucho tiempo)
+                st.session_state.entrenamiento_idx += 1
+                reiniciar()
             
             st.progress((idx + 1) / 5, text=f"Ejercicio {idx + 1} de 5")
             st.markdown(f"**Tema:** `{ejercicio.get('tema', 'General')}`")
             st.markdown(f"### {ejercicio['pregunta']}")
+            zona_grafico = st.empty()
+            futuro_grafico = graficos.solicitar(ejercicio['pregunta'], ejercicio.get('tema', ''))
             st.divider()
 
             # --- LLAMADA A LA IA TUTOR ---
-            if st.session_state.entrenamiento_data_ia is None:
+            if st.session_state.entrenamiento_tutor_id is None:
                 with st.spinner("🧠 El profesor está analizando el mejor camino de resolución..."):
-                    datos_tutor = generar_tutor_paso_a_paso(ejercicio['pregunta'], ejercicio.get('tema', 'Cálculo'))
-                    if datos_tutor:
-                        st.session_state.entrenamiento_data_ia = datos_tutor
-                        st.rerun()
+                    st.session_state.entrenamiento_verificacion = None
+                    # Tras una tutoría incorrecta se pide otra ya verificada (se espera a SymPy)
+                    estricta = st.session_state.pop("entrenamiento_tutor_estricto", False)
+                    datos_tutor = None if estricta else obtener_tutor_prefetch(idx)
+                    if not datos_tutor:
+                        zona_parcial = st.empty()
+                        avance = lambda campos: mostrar_avance_parcial(zona_parcial, campos)
+                        if estricta:
+                            datos_tutor = generar_tutor_paso_a_paso(ejercicio['pregunta'], ejercicio.get('tema', 'Cálculo'),
+                                                                    al_avanzar=avance)
+                        else:
+                            datos_tutor, st.session_state.entrenamiento_verificacion = generar_tutor_en_vivo(
+                                ejercicio['pregunta'], ejercicio.get('tema', 'Cálculo'), al_avanzar=avance
+                            )
+                    # Precalculadas y cacheadas también pasan el esquema: la pantalla no lee campos que falten
+                    if tutor_ia.validar_tutor(datos_tutor):
+                        st.session_state.entrenamiento_tutor_id = almacen_preguntas.guardar(datos_tutor)
+                        reiniciar()
                     else:
                         st.error("Error conectando con el tutor IA. Saltando ejercicio.")
                         st.session_state.entrenamiento_idx += 1
                         time.sleep(2)
-                        st.rerun()
+                        reiniciar()
             
-            tutor = st.session_state.entrenamiento_data_ia
+            tutor = almacen_preguntas.obtener_como(st.session_state.entrenamiento_tutor_id, esquemas.Tutoria)
+            if tutor is None:
+                st.session_state.entrenamiento_tutor_id = None
+                reiniciar()
+
+            # La verificación simbólica de una tutoría recién generada llega después de mostrarla
+            verificacion = st.session_state.get("entrenamiento_verificacion")
+            if verificacion is not None and not verificacion.done():
+                esperar_futuro(verificacion)
+            elif (verificacion is not None and not verificacion.cancelled() and verificacion.exception() is None
+                  and verificacion.result() == verificador.INVALIDO):
+                st.warning("⚠️ La verificación automática encontró un error en el resultado de esta tutoría.")
+                if st.button("🔁 Pedir otra tutoría", key=f"btn_otra_tutoria_{idx}"):
+                    st.session_state.entrenamiento_tutor_id = None
+                    st.session_state.entrenamiento_tutor_estricto = True
+                    st.session_state.entrenamiento_step = 1
+                    st.session_state.entrenamiento_validado = False
+                    reiniciar()
             step = st.session_state.entrenamiento_step
 
             # PASO 1: ESTRATEGIA
@@ -249,47 +601,58 @@ if ruta == "a) Entrenamiento (Temario)":
                 st.markdown("#### 1️⃣ Paso 1: Selección de Estrategia")
                 st.write("Antes de calcular, ¿cuál crees que es el camino correcto?")
                 
-                opcion_estrategia = st.radio("Selecciona el método:", tutor['estrategias'], index=None, key=f"radio_estrat_{idx}")
+                opcion_estrategia = st.radio("Selecciona el método:", tutor.estrategias, index=None, key=f"radio_estrat_{idx}")
                 
                 if st.button("Validar Estrategia", key=f"btn_val_{idx}"):
                     if opcion_estrategia:
-                        idx_seleccionado = tutor['estrategias'].index(opcion_estrategia)
-                        if idx_seleccionado == tutor['indice_correcta']:
+                        acierto = tutor.es_correcta(opcion_estrategia)
+                        historial.registrar_intento(
+                            st.session_state.estudiante, "dojo", ejercicio.get('tema', ''), pool_quiz.id_pregunta(ejercicio),
+                            opcion_estrategia, acierto, paso=1
+                        )
+                        # Solo el primer intento de cada ejercicio cuenta para el dominio
+                        registrados = st.session_state.setdefault("entrenamiento_registrados", set())
+                        if idx not in registrados:
+                            registrados.add(idx)
+                            dominio.registrar(st.session_state.estudiante, ejercicio, acierto)
+                        if acierto:
                             st.session_state.entrenamiento_validado = True 
                         else:
                             st.error("❌ Mmm, no es el mejor camino.")
-                            st.warning(f"Pista: {tutor['feedback_estrategia']}")
+                            st.warning(f"Pista: {tutor.feedback_estrategia}")
                     else:
                         st.warning("Debes seleccionar una opción.")
 
                 if st.session_state.get("entrenamiento_validado", False):
                     st.success("✅ ¡Exacto! Esa es la ruta.")
-                    st.info(f"👨‍🏫 **Feedback:** {tutor['feedback_estrategia']}")
+                    st.info(f"👨‍🏫 **Feedback:** {tutor.feedback_estrategia}")
                     
                     if st.button("Ir al Paso Intermedio ➡️", type="primary", key=f"btn_go_step2_{idx}"):
                         st.session_state.entrenamiento_step = 2
                         st.session_state.entrenamiento_validado = False
-                        st.rerun()
+                        reiniciar()
 
             # PASO 2: HITO INTERMEDIO
             if step == 2:
-                st.success(f"✅ Estrategia: {tutor['estrategias'][tutor['indice_correcta']]}")
+                st.success(f"✅ Estrategia: {tutor.estrategia_correcta}")
                 st.markdown("#### 2️⃣ Paso 2: Ejecución Intermedia")
                 st.write("Aplica la estrategia seleccionada. Deberías llegar a una expresión similar a esta:")
                 
-                # CORRECCIÓN LATEX: Limpiamos por seguridad
-                latex_limpio = tutor['paso_intermedio'].replace('$', '')
-                st.info(f"$${latex_limpio}$$")
+                mostrar_formula(tutor.paso_intermedio, "info")
                 
                 st.write("¿Lograste llegar a este punto o algo equivalente?")
                 
                 col_si, col_no = st.columns(2)
                 with col_si:
                     if st.button("👍 Sí, lo tengo", key=f"btn_si_{idx}"):
+                        historial.registrar_intento(st.session_state.estudiante, "dojo", ejercicio.get('tema', ''),
+                                                    pool_quiz.id_pregunta(ejercicio), acierto=True, paso=2)
                         st.session_state.entrenamiento_step = 3
-                        st.rerun()
+                        reiniciar()
                 with col_no:
                     if st.button("👎 No, necesito ayuda", key=f"btn_no_{idx}"):
+                        historial.registrar_intento(st.session_state.estudiante, "dojo", ejercicio.get('tema', ''),
+                                                    pool_quiz.id_pregunta(ejercicio), acierto=False, paso=2)
                         st.error("Revisa tus derivadas/integrales básicas o el álgebra.")
 
             # PASO 3: FINAL
@@ -298,9 +661,7 @@ if ruta == "a) Entrenamiento (Temario)":
                 st.markdown("#### 3️⃣ Paso 3: Resolución Final")
                 st.write("El resultado definitivo es:")
                 
-                # CORRECCIÓN LATEX
-                latex_final = tutor['resultado_final'].replace('$', '')
-                st.success(f"$$ {latex_final} $$")
+                mostrar_formula(tutor.resultado_final, "exito")
                 
                 with st.expander("Ver explicación completa"):
                     st.write(ejercicio.get('explicacion', 'Procedimiento estándar aplicado correctamente.'))
@@ -308,16 +669,21 @@ if ruta == "a) Entrenamiento (Temario)":
                 if st.button("Siguiente Ejercicio ➡️", type="primary", key=f"btn_next_{idx}"):
                     st.session_state.entrenamiento_idx += 1
                     st.session_state.entrenamiento_step = 1
-                    st.session_state.entrenamiento_data_ia = None 
+                    st.session_state.entrenamiento_tutor_id = None 
                     st.session_state.entrenamiento_validado = False
-                    st.rerun()
+                    reiniciar()
+
+            mostrar_grafico(zona_grafico, futuro_grafico)
 
         else:
+            # Serie terminada: ya no queda nada que precargar
+            detener_prefetch_tutor()
             st.success("🎉 ¡Entrenamiento completado!")
             if st.button("🔄 Volver al Inicio", key="btn_reset_entrenamiento"):
                 st.session_state.entrenamiento_activo = False
                 st.session_state.entrenamiento_idx = 0
-                st.rerun()
+                detener_prefetch_tutor()
+                reiniciar()
 
 # =======================================================
 # LÓGICA B: RESPUESTA GUIADA (Consultas) - TUTOR PERSONALIZADO
@@ -341,13 +707,35 @@ elif ruta == "b) Respuesta Guiada (Consultas)":
                 exito_analisis = False
                 with st.spinner("🤖 Analizando el tipo de problema..."):
                     try:
-                        # Procesar imagen si existe
-                        img_pil = Image.open(imagen_subida) if imagen_subida else None
+                        # Procesar imagen si existe (orientación, grises, recorte y compresión)
+                        img_blob, metricas_img = imagen.preprocesar_imagen(imagen_subida) if imagen_subida else (None, None)
                         
-                        # Llamada a la IA con la función de análisis
-                        datos_problema = analizar_problema_usuario(texto_subido, img_pil)
+                        # Llamada a la IA en streaming: lo que llega se muestra enseguida
+                        # La misma foto, o una parecida con el mismo enunciado, ya analizada: se reutiliza
+                        datos_problema = cache_fotos.buscar(img_blob, texto_subido, transcribir_enunciado) if img_blob else None
+                        zona_parcial = st.empty()
+                        inicio_ia = time.perf_counter()
+                        if datos_problema is None:
+                            datos_problema = analizar_problema_usuario(
+                                texto_subido, img_blob,
+                                al_avanzar=lambda campos: mostrar_avance_parcial(zona_parcial, campos)
+                            )
+                            if img_blob:
+                                cache_fotos.guardar(img_blob, texto_subido, datos_problema)
+                        if metricas_img:
+                            print(
+                                f"[consulta] imagen {metricas_img['bytes_originales'] // 1024} KB {metricas_img['tamano_original']}"
+                                f" -> {metricas_img['bytes_finales'] // 1024} KB {metricas_img['tamano_final']}"
+                                f" | preproceso {metricas_img['ms_preproceso']} ms"
+                                f" | IA {(time.perf_counter() - inicio_ia) * 1000:.0f} ms"
+                                f" | caché fotos {cache_fotos.estadisticas()['tasa_acierto']:.0%}"
+                            )
                         
-                        if datos_problema:
+                        if tutor_ia.validar_analisis(datos_problema):
+                            # El gráfico empieza a dibujarse antes del rerun.
+                            graficos.solicitar(datos_problema.get('enunciado_latex', ''), datos_problema.get('tema_detectado', ''))
+                            historial.registrar_intento(st.session_state.estudiante, "consulta",
+                                                        datos_problema.get('tema_detectado', ''), id_consulta(datos_problema))
                             st.session_state.consulta_data = datos_problema
                             st.session_state.consulta_step = 1
                             st.session_state.consulta_validada = False
@@ -358,32 +746,39 @@ elif ruta == "b) Respuesta Guiada (Consultas)":
                         st.error(f"Error técnico: {e}")
                 
                 if exito_analisis:
-                    st.rerun()
+                    reiniciar()
 
     # 2. INTERACCIÓN (Similar al Dojo pero para el problema del usuario)
     else:
         datos = st.session_state.consulta_data
+        consulta = esquemas.Analisis.desde_dict(datos)
         step = st.session_state.consulta_step
+        if consulta is None:
+            st.error("El análisis guardado no es válido. Vuelve a enviar el problema.")
+            st.session_state.consulta_step = 0
+            st.session_state.consulta_data = None
+            reiniciar()
 
         # Botón para cancelar/reiniciar arriba
         if st.button("🔄 Nueva Consulta", key="btn_new_query_top"):
             st.session_state.consulta_step = 0
             st.session_state.consulta_data = None
-            st.rerun()
+            reiniciar()
 
         st.divider()
-        st.markdown(f"**Tema Detectado:** `{datos.get('tema_detectado', 'Matemáticas')}`")
-        if datos.get('enunciado_latex'):
-            # CORRECCIÓN LATEX
-            enunciado_limpio = datos['enunciado_latex'].replace('$', '')
-            st.markdown(f"**Problema Identificado:**\n$$ {enunciado_limpio} $$")
+        st.markdown(f"**Tema Detectado:** `{consulta.tema_detectado}`")
+        if consulta.enunciado_latex:
+            st.markdown("**Problema Identificado:**")
+            mostrar_formula(consulta.enunciado_latex)
+        zona_grafico = st.empty()
+        futuro_grafico = graficos.solicitar(consulta.enunciado_latex, consulta.tema_detectado)
         
         # PASO 1: Identificar Técnica/Tipo o Planteamiento
         if step == 1:
             st.subheader("1️⃣ Paso 1: Planteamiento")
             
             # Lógica dinámica para el mensaje
-            tema_lower = datos.get('tema_detectado', '').lower()
+            tema_lower = consulta.tema_detectado.lower()
             if "integral" in tema_lower and "área" not in tema_lower and "volumen" not in tema_lower:
                 st.write("¿Qué **técnica de integración** usarías?")
             elif "ecuación diferencial" in tema_lower and "aplicación" not in tema_lower:
@@ -392,54 +787,59 @@ elif ruta == "b) Respuesta Guiada (Consultas)":
                 # Caso Áreas, Volúmenes, Excedentes, etc.
                 st.write("¿Cuál es el **planteamiento o enfoque** correcto?")
 
-            opcion = st.radio("Selecciona:", datos['estrategias'], index=None, key="rad_cons")
+            opcion = st.radio("Selecciona:", consulta.estrategias, index=None, key="rad_cons")
             
             if st.button("Validar Estrategia", type="primary"):
-                if opcion and datos['estrategias'].index(opcion) == datos['indice_correcta']:
+                if opcion:
+                    historial.registrar_intento(st.session_state.estudiante, "consulta", consulta.tema_detectado,
+                                                id_consulta(datos), opcion, consulta.es_correcta(opcion), paso=1)
+                if opcion and consulta.es_correcta(opcion):
                     st.session_state.consulta_validada = True
-                    st.rerun()
+                    reiniciar()
                 else:
                     st.error("❌ No es lo más eficiente.")
-                    st.warning(datos['feedback_estrategia'])
+                    st.warning(consulta.feedback_estrategia)
             
             if st.session_state.consulta_validada:
                 st.success("✅ ¡Correcto! Vamos a desarrollarlo.")
                 if st.button("Ver Paso Intermedio ➡️"):
                     st.session_state.consulta_step = 2
                     st.session_state.consulta_validada = False
-                    st.rerun()
+                    reiniciar()
 
         # PASO 2: Hito Intermedio
         if step == 2:
-            st.success(f"✅ Estrategia: {datos['estrategias'][datos['indice_correcta']]}")
+            st.success(f"✅ Estrategia: {consulta.estrategia_correcta}")
             st.subheader("2️⃣ Paso 2: Desarrollo")
             st.write("Aplicando la técnica, deberías llegar a esta expresión intermedia:")
             
-            # CORRECCIÓN LATEX
-            intermedio_limpio = datos['paso_intermedio'].replace('$', '')
-            st.info(f"$$ {intermedio_limpio} $$")
+            mostrar_formula(consulta.paso_intermedio, "info")
             
             c1, c2 = st.columns(2)
             if c1.button("👍 Llegué a eso"):
+                historial.registrar_intento(st.session_state.estudiante, "consulta", consulta.tema_detectado,
+                                            id_consulta(datos), acierto=True, paso=2)
                 st.session_state.consulta_step = 3
-                st.rerun()
+                reiniciar()
             if c2.button("👎 Me perdí, explícame"):
-                st.info(f"💡 Pista: {datos.get('feedback_estrategia', 'Revisa las operaciones algebraicas.')}")
+                historial.registrar_intento(st.session_state.estudiante, "consulta", consulta.tema_detectado,
+                                            id_consulta(datos), acierto=False, paso=2)
+                st.info(f"💡 Pista: {consulta.feedback_estrategia}")
 
         # PASO 3: Solución Final
         if step == 3:
             st.success("✅ Desarrollo intermedio correcto")
             st.subheader("3️⃣ Solución Final")
             
-            # CORRECCIÓN LATEX
-            final_limpio = datos['resultado_final'].replace('$', '')
-            st.success(f"### $$ {final_limpio} $$")
+            mostrar_formula(consulta.resultado_final, "exito")
             
             st.balloons()
             if st.button("🏁 Terminar ejercicio"):
                 st.session_state.consulta_step = 0
                 st.session_state.consulta_data = None
-                st.rerun()
+                reiniciar()
+
+        mostrar_grafico(zona_grafico, futuro_grafico)
 
 # =======================================================
 # LÓGICA C: AUTOEVALUACIÓN (Quiz)
@@ -457,13 +857,23 @@ elif ruta == "c) Autoevaluación (Quiz)":
                 st.session_state.config_temas = temario.TEMAS_PARCIAL_1
                 st.session_state.config_cant = 5 
                 st.session_state.trigger_quiz = True
-                st.rerun()
+                reiniciar()
         with col2:
             if st.button("🏆 Generar Segundo Parcial (Simulacro)", use_container_width=True):
                 st.session_state.config_temas = temario.TEMAS_PARCIAL_2
                 st.session_state.config_cant = 5
                 st.session_state.trigger_quiz = True
-                st.rerun()
+                reiniciar()
+
+        examenes_previos = historial.examenes_de(st.session_state.estudiante)
+        if examenes_previos:
+            with st.expander(f"📚 Tus exámenes anteriores ({len(examenes_previos)})"):
+                st.dataframe([
+                    {"Fecha": time.strftime("%d/%m/%Y %H:%M", time.localtime(e["momento"])),
+                     "Nota": f"{e['nota']} / 20", "Aciertos": f"{e['aciertos']} / {e['preguntas']}",
+                     "Temas": ", ".join(e["temas"])}
+                    for e in examenes_previos
+                ], use_container_width=True, hide_index=True)
 
         with st.expander("⚙️ Personalizado"):
             temas_custom = st.multiselect("Temas:", temario.LISTA_TEMAS)
@@ -474,12 +884,12 @@ elif ruta == "c) Autoevaluación (Quiz)":
                     st.session_state.config_temas = temas_custom
                     st.session_state.config_cant = 5
                     st.session_state.trigger_quiz = True
-                    st.rerun()
+                    reiniciar()
 
         # --- LÓGICA DE GENERACIÓN ---
         if st.session_state.get("trigger_quiz"):
             quiz_generado = False
-            with st.spinner("Compilando examen (Balanceando 50% Banco Oficial / 50% IA)..."):
+            with st.spinner("Compilando examen (Balanceando 50% Banco Oficial / 50% IA)..."), telemetria.span("generar_quiz"):
                 try:
                     import random
                     lista_final_preguntas = []
@@ -490,30 +900,39 @@ elif ruta == "c) Autoevaluación (Quiz)":
                     cuota_ia = cantidad_total - cuota_banco
 
                     # 1. Banco
-                    try:
-                        preguntas_banco = banco_preguntas.obtener_preguntas_fijas(temas, cuota_banco)
-                        if preguntas_banco:
-                            lista_final_preguntas.extend(preguntas_banco)
-                    except: pass
+                    lista_final_preguntas.extend(banco_indexado.obtener_preguntas_fijas(temas, cuota_banco))
                     
-                    # 2. IA
+                    # 2. Plantillas paramétricas: los temas formulaicos no pasan por la IA
                     falta = cantidad_total - len(lista_final_preguntas)
+                    temas_ia = [t for t in temas if not generador_parametrico.plantilla_para_tema(t)]
                     if falta > 0:
-                        prompt_quiz = temario.generar_prompt_quiz(temas, falta)
-                        respuesta = generar_contenido_seguro(prompt_quiz)
-                        if respuesta:
-                            preguntas_ia = limpiar_json(respuesta.text)
-                            if preguntas_ia:
-                                lista_final_preguntas.extend(preguntas_ia)
+                        cuota_local = falta if not temas_ia else round(falta * (1 - len(temas_ia) / len(temas)))
+                        lista_final_preguntas.extend(generador_parametrico.generar_para_temas(temas, cuota_local))
+
+                    # 3. IA (del pool precalentado: sin llamada a la IA)
+                    falta = cantidad_total - len(lista_final_preguntas)
+                    if falta > 0 and temas_ia:
+                        lista_final_preguntas.extend(pool_quiz.tomar(temas_ia, falta, st.session_state.quiz_vistas))
+
+                    # 4. IA síncrona solo si el pool aún está frío
+                    falta = cantidad_total - len(lista_final_preguntas)
+                    if falta > 0 and temas_ia:
+                        preguntas_ia = generar_preguntas_ia(temas_ia, falta)
+                        if preguntas_ia:
+                            lista_final_preguntas.extend(preguntas_ia)
                     
                     random.shuffle(lista_final_preguntas)
                     lista_final_preguntas = lista_final_preguntas[:cantidad_total]
+                    st.session_state.quiz_vistas.update(pool_quiz.id_pregunta(p) for p in lista_final_preguntas)
 
                     if not lista_final_preguntas:
                          st.error("No se pudieron generar preguntas.")
                          st.session_state.trigger_quiz = False
                     else:
-                        st.session_state.preguntas_quiz = lista_final_preguntas
+                        st.session_state.quiz_ids = almacen_preguntas.guardar_lista(lista_final_preguntas)
+                        st.session_state.quiz_respaldo = almacen_preguntas.respaldar(st.session_state.quiz_ids)
+                        st.session_state.quiz_examen = uuid.uuid4().hex[:12]
+                        st.session_state.quiz_guardado = False
                         st.session_state.indice_pregunta = 0
                         st.session_state.respuestas_usuario = []
                         st.session_state.quiz_activo = True
@@ -525,20 +944,32 @@ elif ruta == "c) Autoevaluación (Quiz)":
                     st.session_state.trigger_quiz = False
             
             if quiz_generado:
-                st.rerun()
+                reiniciar()
 
     # --- PANTALLA 2 (RESPONDER) y 3 (RESULTADOS) ---
     else:
-        total = len(st.session_state.preguntas_quiz)
+        total = len(st.session_state.quiz_ids)
         actual = st.session_state.indice_pregunta
         
         if actual < total:
-            pregunta_data = st.session_state.preguntas_quiz[actual]
+            qid = st.session_state.quiz_ids[actual]
+            # Si el almacén la expulsó, vuelve desde el respaldo de la sesión: la nota no depende de la memoria del servidor
+            pregunta_data = almacen_preguntas.obtener(qid, st.session_state.quiz_respaldo)
+            pregunta = almacen_preguntas.obtener_como(qid, esquemas.PreguntaQuiz, st.session_state.quiz_respaldo)
+            if pregunta is None:
+                # Sin el esquema del quiz (no se puede corregir): se anula sin puntos
+                if len(st.session_state.respuestas_usuario) <= actual:
+                    st.session_state.respuestas_usuario.append((qid, None, 0))
+                st.session_state.indice_pregunta += 1
+                reiniciar()
             
             st.progress((actual) / total, text=f"Pregunta {actual + 1} de {total}")
             
+            # Enunciado y opciones ya partidos y con las fórmulas dibujadas (LRU compartido)
+            vista = latex_render.preparar_pregunta(pregunta_data)
+
             # 1. RENDERIZADO DE LA PREGUNTA
-            st.markdown(f"#### {pregunta_data['pregunta']}")
+            st.markdown(f"#### {vista['enunciado']}", unsafe_allow_html=True)
             st.divider()
             
             # 2. RENDERIZADO DE LAS OPCIONES (VISUAL)
@@ -546,18 +977,10 @@ elif ruta == "c) Autoevaluación (Quiz)":
             # Mostramos las opciones formateadas con Markdown primero.
             st.write("Opciones:")
             col_ops = st.columns(2)
-            opciones_completas = pregunta_data['opciones']
             
-            for i, opcion_texto in enumerate(opciones_completas):
-                # Extraemos la letra si existe formato "A) ..." para negrita
-                if ")" in opcion_texto:
-                    letra, resto = opcion_texto.split(")", 1)
-                    texto_mostrar = f"**{letra})** {resto}"
-                else:
-                    texto_mostrar = opcion_texto
-
+            for i, (_, texto_mostrar) in enumerate(vista['opciones']):
                 with col_ops[i % 2]:
-                    st.markdown(texto_mostrar)
+                    st.markdown(texto_mostrar, unsafe_allow_html=True)
             
             st.divider()
 
@@ -567,7 +990,7 @@ elif ruta == "c) Autoevaluación (Quiz)":
             if not ya_respondido:
                 # Creamos opciones simplificadas (Solo A, B, C, D) para el selector
                 # Así evitamos que Streamlit intente renderizar LaTeX crudo en el widget
-                opciones_radio = [op.split(")")[0] + ")" for op in opciones_completas]
+                opciones_radio = [f"{letra})" for letra, _ in vista['opciones']]
                 
                 seleccion_letra = st.radio(
                     "Selecciona tu respuesta:", 
@@ -579,49 +1002,41 @@ elif ruta == "c) Autoevaluación (Quiz)":
 
                 if st.button("Responder", type="primary"):
                     if seleccion_letra:
-                        # Recuperamos la opción completa original basada en la letra seleccionada
                         letra_elegida = seleccion_letra.split(")")[0] # Ej: "A"
-                        # Buscamos la opción original que empieza con esa letra
-                        opcion_elegida_completa = next(op for op in opciones_completas if op.startswith(letra_elegida))
-                        
-                        letra_correcta = pregunta_data['respuesta_correcta'].strip()[0].upper()
-                        es_correcta = (letra_elegida == letra_correcta)
+                        es_correcta = pregunta.es_correcta(letra_elegida)
                         pts = round(20 / total, 2) if es_correcta else 0
+                        dominio.registrar(st.session_state.estudiante, pregunta_data, es_correcta)
+                        historial.registrar_intento(st.session_state.estudiante, "quiz", pregunta_data.get('tema', ''), qid,
+                                                    letra_elegida, es_correcta, pts, examen=st.session_state.quiz_examen)
                         
-                        st.session_state.respuestas_usuario.append({
-                            "pregunta": pregunta_data['pregunta'],
-                            "elegida": opcion_elegida_completa, # Guardamos la completa para el reporte final
-                            "correcta": pregunta_data['respuesta_correcta'],
-                            "explicacion": pregunta_data['explicacion'],
-                            "puntos": pts,
-                            "es_correcta": es_correcta
-                        })
-                        st.rerun()
+                        # Solo la referencia: el texto de la pregunta vive en el almacén compartido
+                        st.session_state.respuestas_usuario.append((qid, letra_elegida, pts))
+                        reiniciar()
                     else:
                         st.warning("⚠️ Selecciona una opción.")
             
             else:
                 # FEEDBACK INMEDIATO (Si ya respondió pero no ha pasado a la siguiente)
-                ultimo_dato = st.session_state.respuestas_usuario[actual]
+                _, letra_elegida, _ = st.session_state.respuestas_usuario[actual]
                 
                 # Renderizamos la elección del usuario de forma bonita
-                st.info(f"Tu respuesta: **{ultimo_dato['elegida']}**")
+                st.info(f"Tu respuesta: **{pregunta.opcion(letra_elegida)}**")
                 
-                if ultimo_dato['es_correcta']:
+                if pregunta.es_correcta(letra_elegida):
                     st.success("✅ ¡Correcto!")
                 else:
-                    st.error(f"❌ Incorrecto. La correcta era: {ultimo_dato['correcta']}")
+                    st.error(f"❌ Incorrecto. La correcta era: {pregunta.respuesta_correcta}")
                 
                 with st.expander("💡 Ver Explicación", expanded=True):
-                    st.write(ultimo_dato['explicacion'])
+                    st.write(pregunta.explicacion)
                 
                 if st.button("Siguiente Pregunta ➡️", type="primary"):
                     st.session_state.indice_pregunta += 1
-                    st.rerun()
+                    reiniciar()
 
         else:
             # PANTALLA 3: RESULTADOS
-            suma_puntos = sum(r['puntos'] for r in st.session_state.respuestas_usuario)
+            suma_puntos = sum(pts for _, _, pts in st.session_state.respuestas_usuario)
             nota_final = round(suma_puntos, 2)
 
             if nota_final >= 10:
@@ -629,32 +1044,48 @@ elif ruta == "c) Autoevaluación (Quiz)":
             else:
                 st.warning(f"⚠️ Examen Finalizado - Nota: {nota_final}")
             
+            # Una sola vez por examen: los reruns de esta pantalla no lo duplican
+            if not st.session_state.get("quiz_guardado"):
+                respuestas = st.session_state.respuestas_usuario
+                historial.registrar_examen(
+                    st.session_state.quiz_examen, st.session_state.estudiante, st.session_state.get("config_temas", []),
+                    len(respuestas), sum(1 for _, _, pts in respuestas if pts > 0), nota_final
+                )
+                st.session_state.quiz_guardado = True
+
             col_nota_top, col_info_top = st.columns([1, 2])
             with col_nota_top:
                 st.metric("Calificación Final", f"{nota_final} / 20 pts")
             with col_info_top:
-                st.info("💡 **Recordatorio:** Presiona `Ctrl + P` para guardar.")
+                st.info("💾 Resultado guardado en tu historial (el enlace de esta página lo conserva). "
+                        "Presiona `Ctrl + P` para imprimirlo.")
 
             st.divider()
             st.subheader("📄 Detalle del Examen")
 
-            for i, r in enumerate(st.session_state.respuestas_usuario):
-                st.markdown(f"#### 🔹 Pregunta {i+1} ({r['puntos']} pts)")
-                st.markdown(r['pregunta']) 
+            for i, (qid, letra_elegida, pts) in enumerate(st.session_state.respuestas_usuario):
+                pregunta_data = almacen_preguntas.obtener(qid, st.session_state.quiz_respaldo)
+                pregunta = almacen_preguntas.obtener_como(qid, esquemas.PreguntaQuiz, st.session_state.quiz_respaldo)
+                if pregunta is None:
+                    continue
+                es_correcta = pregunta.es_correcta(letra_elegida)
+                elegida = pregunta.opcion(letra_elegida)
+                st.markdown(f"#### 🔹 Pregunta {i+1} ({pts} pts)")
+                st.markdown(latex_render.preparar_pregunta(pregunta_data)['enunciado'], unsafe_allow_html=True)
                 
                 col_res1, col_res2 = st.columns(2)
                 with col_res1:
-                    if r['es_correcta']:
-                        st.success(f"✅ **Tu respuesta:** {r['elegida']}")
+                    if es_correcta:
+                        st.success(f"✅ **Tu respuesta:** {elegida}")
                     else:
-                        st.error(f"❌ **Tu respuesta:** {r['elegida']}")
+                        st.error(f"❌ **Tu respuesta:** {elegida}")
                 
                 with col_res2:
-                    if not r['es_correcta']:
-                        st.warning(f"✔ **Correcta:** {r['correcta']}")
+                    if not es_correcta:
+                        st.warning(f"✔ **Correcta:** {pregunta.respuesta_correcta}")
 
                 st.markdown("**📝 Explicación:**")
-                st.write(r['explicacion']) 
+                st.write(pregunta.explicacion) 
                 st.markdown("---")
 
             st.markdown("### 🏁 Resumen Final")
@@ -668,4 +1099,7 @@ elif ruta == "c) Autoevaluación (Quiz)":
                 st.session_state.quiz_activo = False
                 st.session_state.indice_pregunta = 0
                 st.session_state.respuestas_usuario = []
-                st.rerun()
\ No newline at end of file
+                st.session_state.quiz_respaldo = {}
+                reiniciar()
+
+telemetria.registrar_ejecucion(ruta, time.perf_counter() - inicio_ejecucion, "fin")
@@ -0,0 +1,113 @@
+"""
+Benchmark: arranque en frío y coste fijo de cada rerun.
+
+Uso:
+    python -m benchmarks.bench_arranque [--reruns 200] [--app]
+
+1. Importar los módulos de la app en un proceso nuevo: tiempo total y qué
+   librerías pesadas (SymPy, NumPy, PIL, matplotlib) quedan cargadas.
+   Ahora se cargan en su primer uso; se informa cuánto cuesta cada una,
+   que es lo que antes pagaba cualquier ruta al arrancar.
+2. Configurar + construir el modelo en cada rerun frente al modelo
+   compartido del proceso (`backend_modelo.obtener_modelo`).
+3. Con --app, la duración de reruns reales de app.py con AppTest.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from modules import backend_modelo
+
+MODULOS_APP = [
+    "almacen_preguntas", "backend_modelo", "banco_indexado", "dominio", "cache_fotos", "cache_tutor",
+    "cliente_gemini", "coalescencia", "generador_parametrico", "graficos", "imagen", "json_incremental",
+    "pool_quiz", "telemetria", "tutor_ia", "tutor_precalculado", "verificador",
+]
+PESADAS = ["sympy", "numpy", "PIL.Image", "matplotlib"]
+
+_SONDA = """
+import sys, time
+inicio = time.perf_counter()
+from modules import {modulos}
+print(round((time.perf_counter() - inicio) * 1000, 1))
+print(",".join(m for m in {pesadas!r} if m in sys.modules))
+"""
+
+
+def importar_en_frio(repeticiones=3):
+    codigo = _SONDA.format(modulos=", ".join(MODULOS_APP), pesadas=PESADAS)
+    tiempos, cargadas = [], ""
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True).stdout.split("\n")
+        tiempos.append(float(salida[0]))
+        cargadas = salida[1]
+    return min(tiempos), cargadas
+
+
+def coste_libreria(nombre):
+    codigo = f"import time; t = time.perf_counter(); import {nombre}; print((time.perf_counter() - t) * 1000)"
+    return float(subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True).stdout)
+
+
+def por_rerun(reruns):
+    inicio = time.perf_counter()
+    for _ in range(reruns):
+        if backend_modelo.configurar():
+            backend_modelo.iniciar_modelo()
+    cada_vez = (time.perf_counter() - inicio) / reruns * 1e6
+    backend_modelo.obtener_modelo()
+    inicio = time.perf_counter()
+    for _ in range(reruns):
+        backend_modelo.obtener_modelo()
+    compartido = (time.perf_counter() - inicio) / reruns * 1e6
+    return cada_vez, compartido
+
+
+def reruns_app(reruns):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py"),
+                           default_timeout=60)
+    tiempos = []
+    for _ in range(reruns):
+        inicio = time.perf_counter()
+        at.run()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=200)
+    parser.add_argument("--app", action="store_true", help="mide reruns reales de app.py (AppTest)")
+    args = parser.parse_args()
+
+    ms, cargadas = importar_en_frio()
+    print(f"importar módulos de la app en frío: {ms:.0f} ms | librerías pesadas cargadas: {cargadas or 'ninguna'}")
+    for nombre in PESADAS:
+        print(f"  {nombre:12s} en su primer uso: {coste_libreria(nombre):6.0f} ms")
+
+    try:
+        cada_vez, compartido = por_rerun(args.reruns)
+    except ImportError as e:
+        print(f"Aviso: backend '{backend_modelo.BACKEND}' no disponible ({e}); pruebe con TUTOR_BACKEND=simulado")
+    else:
+        print(f"modelo ({backend_modelo.BACKEND}): construir en cada rerun {cada_vez:.1f} µs | compartido {compartido:.2f} µs")
+
+    if args.app:
+        os.environ.setdefault("TUTOR_BACKEND", "simulado")
+        try:
+            tiempos = reruns_app(min(args.reruns, 30))
+        except Exception as e:
+            print(f"Aviso: no se pudo ejecutar app.py con AppTest: {e}")
+        else:
+            print(f"rerun de app.py: primero {tiempos[0]:.0f} ms, mediana del resto {statistics.median(tiempos[1:]):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
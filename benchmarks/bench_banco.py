@@ -0,0 +1,76 @@
+"""
+Benchmark: banco indexado (mmap + alias) frente a recorrer la lista.
+
+Uso:
+    python -m benchmarks.bench_banco [--preguntas 50000] [--temas 40] [--muestreos 5000]
+
+Compila un banco sintético en una carpeta temporal y mide: compilación,
+arranque (abrir el índice con mmap), muestreo de 5 preguntas entre 3
+temas (índice vs. filtrar la lista completa, como hace un banco en
+memoria) y la recarga en caliente tras recompilar.
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from modules import banco_indexado, generador_parametrico
+
+BASE = ["Integración por partes", "Fracciones parciales", "EDO de variables separables", "EDO lineales de primer orden"]
+
+
+def banco_sintetico(n, n_temas):
+    plantillas = generador_parametrico.generar_para_temas(BASE, 400, semilla=5)
+    azar = random.Random(1)
+    return [
+        dict(plantillas[i % len(plantillas)], tema=f"Tema {i % n_temas:03d}",
+             pregunta=f"{plantillas[i % len(plantillas)]['pregunta']} (#{i})",
+             dificultad=azar.randint(1, 3), etiquetas=azar.sample(["calculo", "edo", "parcial1", "parcial2"], 2))
+        for i in range(n)
+    ]
+
+
+def cronometrar(fn, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preguntas", type=int, default=50000)
+    parser.add_argument("--temas", type=int, default=40)
+    parser.add_argument("--muestreos", type=int, default=5000)
+    args = parser.parse_args()
+
+    preguntas = banco_sintetico(args.preguntas, args.temas)
+    elegidos = [f"Tema {t:03d}" for t in (0, 7, 19)]
+    with tempfile.TemporaryDirectory() as carpeta:
+        banco_indexado.RUTA_BANCO = carpeta
+        inicio = time.perf_counter()
+        banco_indexado.compilar(preguntas, carpeta)
+        print(f"compilar {args.preguntas} preguntas: {time.perf_counter() - inicio:.2f} s")
+
+        inicio = time.perf_counter()
+        indice = banco_indexado.indice_vigente()
+        print(f"arranque (abrir mmap):  {(time.perf_counter() - inicio) * 1000:.2f} ms")
+
+        us_indice = cronometrar(lambda: banco_indexado.muestrear(indice, elegidos, 5), args.muestreos)
+        us_completo = cronometrar(lambda: banco_indexado.obtener_preguntas_fijas(elegidos, 5), args.muestreos)
+        us_lista = cronometrar(
+            lambda: random.sample([p for p in preguntas if p["tema"] in elegidos], 5), max(1, args.muestreos // 50)
+        )
+        print(f"muestrear 5 de 3 temas: índice {us_indice:.1f} µs | con decodificar {us_completo:.1f} µs | "
+              f"recorrer lista {us_lista:.1f} µs")
+
+        banco_indexado.compilar(preguntas[: args.preguntas // 2], carpeta)
+        banco_indexado.recargar()
+        inicio = time.perf_counter()
+        nuevo = banco_indexado.indice_vigente()
+        print(f"recarga en caliente:    {(time.perf_counter() - inicio) * 1000:.2f} ms "
+              f"({len(indice)} -> {len(nuevo)} preguntas)")
+
+
+if __name__ == "__main__":
+    main()
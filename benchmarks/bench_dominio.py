@@ -0,0 +1,94 @@
+"""
+Benchmark: planificador adaptativo frente a la serie aleatoria del Dojo.
+
+Uso:
+    python -m benchmarks.bench_dominio [--estudiantes 30] [--temas 4] [--max-series 40]
+
+1. Coste de `dominio.registrar` con historiales de distinto tamaño (debe
+   ser constante: O(1) por respuesta).
+2. Simulación: estudiantes con una habilidad real por tema que mejora al
+   practicar (más cuanto más cerca de su nivel está el ejercicio). Cada
+   serie son 5 ejercicios del banco; se cuenta cuántos hacen falta hasta
+   dominar todos los temas (P(acierto) >= UMBRAL_DOMINIO en dificultad
+   media), eligiendo al azar o con `dominio.elegir_ejercicios`. Cada
+   ejercicio es una tutoría que, fuera del banco, costaría una llamada a la IA.
+"""
+import argparse
+import math
+import random
+import tempfile
+import time
+
+from modules import banco_indexado, dominio
+
+GANANCIA = 0.2
+
+
+def banco_simulado(n_temas, por_tema, azar):
+    return [
+        {"tema": f"Tema {t}", "pregunta": f"Ejercicio {t}-{i}", "opciones": ["A) 1", "B) 2"],
+        "respuesta_correcta": "A) 1", "explicacion": "", "dificultad": azar.choice([1, 2, 3])}
+        for t in range(n_temas) for i in range(por_tema)
+    ]
+
+
+def medir_registro(n_historial):
+    pregunta = {"tema": "Tema 0", "pregunta": "x", "dificultad": 2}
+    for i in range(n_historial):
+        dominio.registrar("historial", dict(pregunta, pregunta=f"x{i}"), i % 2 == 0)
+    inicio = time.perf_counter()
+    for i in range(200):
+        dominio.registrar("historial", dict(pregunta, pregunta=f"y{i}"), i % 3 == 0)
+    return (time.perf_counter() - inicio) / 200 * 1e6
+
+
+def simular(estudiante, temas, adaptativo, max_series, azar):
+    # Habilidad real: unos temas ya se dominan y otros no
+    real = {t: azar.choice([-1.5, -0.5, 0.5, 2.5]) for t in temas}
+    ejercicios = 0
+    for _ in range(max_series):
+        if all(dominio.dominado(real[t]) for t in temas):
+            return ejercicios
+        if adaptativo:
+            serie = dominio.elegir_ejercicios(estudiante, temas, 5, azar)
+        else:
+            serie = banco_indexado.obtener_preguntas_fijas(temas, 5)
+        for p in serie:
+            ejercicios += 1
+            b = dominio.DIFICULTAD_INICIAL[p["dificultad"]]
+            acierto = azar.random() < dominio.probabilidad(real[p["tema"]], b)
+            dominio.registrar(estudiante, p, acierto)
+            # Se aprende más con ejercicios de dificultad cercana al nivel actual
+            real[p["tema"]] += GANANCIA * math.exp(-abs(real[p["tema"]] - b))
+    return ejercicios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estudiantes", type=int, default=30)
+    parser.add_argument("--temas", type=int, default=4)
+    parser.add_argument("--max-series", type=int, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        dominio.RUTA_DOMINIO = f"{carpeta}/dominio.sqlite3"
+        banco_indexado.RUTA_BANCO = f"{carpeta}/banco"
+        azar = random.Random(7)
+        banco_indexado.compilar(banco_simulado(args.temas, 300, azar))
+
+        for n in (0, 1000, 10000):
+            print(f"registrar con {n:6d} respuestas previas: {medir_registro(n):7.1f} µs")
+
+        temas = [f"Tema {t}" for t in range(args.temas)]
+        for adaptativo in (False, True):
+            totales = [
+                simular(f"{'ad' if adaptativo else 'al'}{e}", temas, adaptativo, args.max_series, random.Random(e))
+                for e in range(args.estudiantes)
+            ]
+            totales.sort()
+            print(f"{'adaptativo' if adaptativo else 'aleatorio':10s}: ejercicios hasta dominar todo "
+                  f"media {sum(totales) / len(totales):.1f}, mediana {totales[len(totales) // 2]}, máx {totales[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: todas las llamadas al modelo fuerte frente al enrutador (rápido
+primero y el fuerte solo si la respuesta no sirve), contra el Gemini
+simulado en este mismo proceso.
+
+Uso:
+    GEMINI_RPM=6000 GEMINI_RAFAGA=50 python -m benchmarks.bench_enrutador \\
+        [--peticiones 60] [--concurrencia 6] [--latencia-ms 900] [--factor-rapido 0.35] [--fotos]
+
+Una mezcla de tutorías, preguntas de quiz y análisis de consultas de
+texto (y, con --fotos, consultas largas que van directas al fuerte), con
+la misma validación que la app (JSON, esquema y verificación simbólica).
+Por estrategia: latencia media y p95 por petición, peticiones al modelo,
+tasa de escalado, respuestas válidas y coste estimado con los precios de
+`enrutador_modelos.PRECIOS_MTOK`.
+
+El simulador hace que el modelo rápido tarde --factor-rapido veces lo
+normal y devuelva también las respuestas rotas del corpus; el fuerte solo
+las reparables. Los números dependen de esas dos suposiciones: con el
+modelo real conviene mirar la tabla del enrutador en la página de
+administración. Con la cuota por defecto (GEMINI_RPM=15) el limitador
+domina los tiempos; subiéndola se mide la latencia y no la cuota.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import backend_modelo, cliente_gemini, enrutador_modelos, tutor_ia, verificador
+
+from benchmarks.servidor_gemini_simulado import iniciar_en_hilo
+
+PROMPT_ANALISIS = ("Analiza el problema del estudiante. Estructura JSON requerida: "
+                   '{"tema_detectado": "", "enunciado_latex": "", "estrategias": [], "indice_correcta": 0}\n')
+PROMPT_QUIZ = "Genera {n} preguntas de opción múltiple de {tema} en un array JSON.\n"
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def llamar(prompt):
+    def llamada(modelo, nombre):
+        try:
+            return cliente_gemini.generar(modelo, prompt).text
+        except cliente_gemini.ErrorIA:
+            return None
+    return llamada
+
+
+def validar_tutor(enunciado):
+    def validar(datos):
+        if not tutor_ia.validar_tutor(datos):
+            return "esquema"
+        return "verificacion" if verificador.verificar_tutor(enunciado, datos) == verificador.INVALIDO else None
+    return validar
+
+
+def validar_analisis(datos):
+    if not tutor_ia.validar_analisis(datos):
+        return "esquema"
+    return "verificacion" if verificador.verificar_analisis(datos) == verificador.INVALIDO else None
+
+
+def validar_quiz(preguntas):
+    if not isinstance(preguntas, list):
+        return "esquema"
+    return None if verificador.filtrar_preguntas_quiz(preguntas) else "verificacion"
+
+
+def peticion(i, fotos):
+    """ (ruta, prompt, validar) de la i-ésima petición de la mezcla. """
+    tipo = i % (4 if fotos else 3)
+    if tipo == 0:
+        enunciado = f"Calcule la integral del ejercicio {i} por partes."
+        return "tutor", tutor_ia.construir_prompt_tutor(enunciado, "Integración por partes"), validar_tutor(enunciado)
+    if tipo == 1:
+        return "quiz", PROMPT_QUIZ.format(n=3, tema=f"Tema {i}"), validar_quiz
+    texto = f"Problema {i}: halle el área entre dos curvas."
+    if tipo == 3:
+        # Problema de aplicación largo: va directo al fuerte
+        texto += " Datos del enunciado: " + "la curva y = x^2 y la recta y = 2x. " * 30
+    return enrutador_modelos.ruta_analisis(texto, False), PROMPT_ANALISIS + texto, validar_analisis
+
+
+def ejecutar(peticiones, concurrencia, fotos, enrutado):
+    enrutador_modelos.ACTIVO = enrutado
+    with enrutador_modelos._lock:
+        enrutador_modelos._stats.clear()
+
+    def una(i):
+        ruta, prompt, validar = peticion(i, fotos)
+        inicio = time.perf_counter()
+        datos = enrutador_modelos.resolver(ruta, prompt, llamar(prompt), validar)
+        return time.perf_counter() - inicio, datos is not None
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concurrencia) as ex:
+        resultados = list(ex.map(una, range(peticiones)))
+    total = time.perf_counter() - inicio
+    filas = enrutador_modelos.estadisticas()
+    llamadas = sum(f["llamadas"] for f in filas)
+    primeras = sum(f["llamadas"] for f in filas if f["escalado"] is None)
+    return {
+        "media": statistics.mean(t for t, _ in resultados),
+        "p95": percentil([t for t, _ in resultados], 0.95),
+        "total": total,
+        "llamadas": llamadas,
+        "escalado": (llamadas - primeras) / primeras if primeras else 0.0,
+        "validas": sum(ok for _, ok in resultados),
+        "coste": sum(f["coste_usd"] for f in filas),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=60)
+    parser.add_argument("--concurrencia", type=int, default=6)
+    parser.add_argument("--puerto", type=int, default=8772)
+    parser.add_argument("--latencia-ms", type=float, default=900)
+    parser.add_argument("--factor-rapido", type=float, default=0.35)
+    parser.add_argument("--fotos", action="store_true", help="incluir consultas largas (directas al fuerte)")
+    args = parser.parse_args()
+
+    _, simulador = iniciar_en_hilo(args.puerto, latencia_ms=args.latencia_ms, jitter_ms=150, ms_por_token=2,
+                                   semilla=7, factor_rapido=args.factor_rapido)
+    url = f"http://127.0.0.1:{args.puerto}"
+    backend_modelo.BACKEND = "simulado"
+    backend_modelo._modelo = (backend_modelo.ModeloHTTP(url), backend_modelo.MODELO_SIMULADO)
+    backend_modelo._nombrados[backend_modelo.MODELO_SIMULADO_RAPIDO] = backend_modelo.ModeloHTTP(
+        url, backend_modelo.MODELO_SIMULADO_RAPIDO)
+
+    print(f"{'estrategia':12s}{'media (s)':>10s}{'p95 (s)':>9s}{'total (s)':>11s}{'llamadas':>10s}"
+          f"{'escalado':>10s}{'válidas':>9s}{'coste (USD)':>13s}")
+    for nombre, enrutado in (("solo fuerte", False), ("enrutado", True)):
+        r = ejecutar(args.peticiones, args.concurrencia, args.fotos, enrutado)
+        print(f"{nombre:12s}{r['media']:10.2f}{r['p95']:9.2f}{r['total']:11.1f}{r['llamadas']:10d}"
+              f"{r['escalado']:10.1%}{r['validas']:6d}/{args.peticiones:<3d}{r['coste']:12.6f}")
+    print(f"peticiones por modelo en el simulador: {simulador.estadisticas()['por_modelo']}")
+
+
+if __name__ == "__main__":
+    main()
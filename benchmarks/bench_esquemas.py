@@ -0,0 +1,198 @@
+"""
+Benchmark: validadores por diccionario anteriores vs. los compilados de
+`esquemas`, búsqueda de la respuesta del quiz y memoria por objeto.
+
+Uso:
+    python -m benchmarks.bench_esquemas [--items 20000] [--repeticiones 5]
+
+Las preguntas salen de `generador_parametrico` y las tutorías son
+sintéticas con la forma del prompt del Dojo; una de cada cinco se
+estropea (campo que falta, índice fuera de rango, opciones sin letra o
+con la letra repetida) para medir también el camino de rechazo. Se
+informa de:
+
+- validación: µs por ítem con `validar_*` anteriores (copiados tal cual),
+  los compilados y `desde_dict` (validar y construir el objeto), y
+  cuántos ítems acepta cada uno;
+- respuesta: µs por consulta de "¿es correcta la letra X?" recorriendo
+  las opciones (`letra_correcta` + `opcion_de_letra` anteriores) frente al
+  índice por letra de `PreguntaQuiz`;
+- memoria: bytes residentes por ítem (tracemalloc) con N diccionarios de
+  `json.loads` frente a N objetos con `__slots__` construidos a partir de
+  ellos, una vez soltados los diccionarios.
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from modules import esquemas, generador_parametrico
+
+TEMAS = ("Integración por partes", "Fracciones parciales", "EDO separables", "EDO lineales")
+CAMPOS_TUTOR = ("estrategias", "indice_correcta", "feedback_estrategia", "paso_intermedio", "resultado_final")
+
+
+# --- Versiones anteriores, copiadas tal cual para comparar ---
+
+def validar_tutor_legado(datos, campos=CAMPOS_TUTOR):
+    if not isinstance(datos, dict) or any(c not in datos for c in campos):
+        return False
+    estrategias = datos["estrategias"]
+    if not isinstance(estrategias, list) or len(estrategias) < 2:
+        return False
+    indice = datos["indice_correcta"]
+    return isinstance(indice, int) and 0 <= indice < len(estrategias)
+
+
+def validar_pregunta_quiz_legado(pregunta):
+    if not isinstance(pregunta, dict):
+        return False
+    opciones = pregunta.get("opciones")
+    correcta = pregunta.get("respuesta_correcta")
+    if not isinstance(pregunta.get("pregunta"), str) or not isinstance(opciones, list) or len(opciones) < 2:
+        return False
+    if not isinstance(correcta, str) or not correcta.strip():
+        return False
+    letra = correcta.strip()[0].upper()
+    return any(isinstance(op, str) and op.strip().upper().startswith(letra) for op in opciones)
+
+
+def letra_correcta_legado(pregunta):
+    return pregunta['respuesta_correcta'].strip()[0].upper()
+
+
+def opcion_de_letra_legado(pregunta, letra):
+    if not letra:
+        return "(sin respuesta)"
+    return next((op for op in pregunta['opciones'] if op.startswith(letra)), letra)
+
+
+# --- Datos ---
+
+def tutoria(i, rng):
+    estrategias = [f"Estrategia {k} para el ejercicio {i}: sustitución u = x^{k}" for k in range(rng.randint(2, 4))]
+    return {
+        "estrategias": estrategias,
+        "indice_correcta": rng.randrange(len(estrategias)),
+        "feedback_estrategia": f"Conviene derivar el polinomio del ejercicio {i}.",
+        "paso_intermedio": f"$\\int x e^{{{i % 7}x}} dx = \\frac{{x}}{{{i % 7 + 1}}} e^x - \\dots$",
+        "resultado_final": f"$\\frac{{x e^x}}{{{i % 9 + 1}}} + C$",
+    }
+
+
+def estropear_tutoria(datos, rng):
+    datos = dict(datos)
+    if rng.random() < 0.5:
+        del datos["feedback_estrategia"]
+    else:
+        datos["indice_correcta"] = len(datos["estrategias"])
+    return datos
+
+
+def estropear_pregunta(datos, rng):
+    datos = dict(datos)
+    if rng.random() < 0.5:
+        datos["opciones"] = [o.split(")", 1)[1].strip() for o in datos["opciones"]]
+    else:
+        datos["opciones"] = ["A) " + o.split(")", 1)[1] for o in datos["opciones"]]
+    return datos
+
+
+def muestras(n, semilla=11):
+    rng = random.Random(semilla)
+    preguntas = []
+    while len(preguntas) < n:
+        # Cada plantilla da un número limitado de ejercicios distintos por semilla
+        preguntas += generador_parametrico.generar_para_temas(list(TEMAS), n // len(TEMAS) + 1,
+                                                              semilla=semilla + len(preguntas))
+    preguntas = preguntas[:n]
+    tutorias = [tutoria(i, rng) for i in range(n)]
+    # Como llegan de la IA: cada ítem es un diccionario propio, no uno compartido
+    preguntas = [json.loads(json.dumps(p)) for p in preguntas]
+    tutorias = [json.loads(json.dumps(t)) for t in tutorias]
+    rotas_p = [estropear_pregunta(p, rng) if i % 5 == 4 else p for i, p in enumerate(preguntas)]
+    rotas_t = [estropear_tutoria(t, rng) if i % 5 == 4 else t for i, t in enumerate(tutorias)]
+    return preguntas, tutorias, rotas_p, rotas_t
+
+
+# --- Mediciones ---
+
+def cronometrar(funcion, items, repeticiones):
+    mejor, aceptados = float("inf"), 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultados = [funcion(x) for x in items]
+        mejor = min(mejor, time.perf_counter() - inicio)
+        aceptados = sum(1 for r in resultados if r)
+    return mejor / len(items) * 1e6, aceptados
+
+
+def memoria_por_item(textos, construir):
+    """ Bytes residentes por ítem: los diccionarios de `json.loads` o, si `construir`, los objetos. """
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    items = [json.loads(t) for t in textos]
+    if construir:
+        items = [construir(d) for d in items]
+    gc.collect()
+    usado = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+    del items
+    return usado / len(textos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    preguntas, tutorias, rotas_p, rotas_t = muestras(args.items)
+    n, r = len(rotas_p), args.repeticiones
+
+    print(f"Validación ({n} ítems, 1 de cada 5 roto)")
+    print(f"{'esquema':10s}{'variante':22s}{'µs/ítem':>10s}{'aceptados':>11s}")
+    filas = (
+        ("tutor", "dict (anterior)", validar_tutor_legado, rotas_t),
+        ("tutor", "compilado", esquemas.validar_tutor, rotas_t),
+        ("tutor", "Tutoria.desde_dict", esquemas.Tutoria.desde_dict, rotas_t),
+        ("quiz", "dict (anterior)", validar_pregunta_quiz_legado, rotas_p),
+        ("quiz", "compilado", esquemas.validar_pregunta_quiz, rotas_p),
+        ("quiz", "PreguntaQuiz.desde_dict", esquemas.PreguntaQuiz.desde_dict, rotas_p),
+    )
+    for esquema, variante, funcion, items in filas:
+        us, aceptados = cronometrar(funcion, items, r)
+        print(f"{esquema:10s}{variante:22s}{us:10.2f}{aceptados:8d}/{len(items)}")
+
+    # Respuesta: la pantalla pregunta por cada letra elegida y la muestra
+    rng = random.Random(3)
+    consultas = [(i, rng.choice("ABCD")) for i in range(n)]
+    objetos = [esquemas.PreguntaQuiz.desde_dict(p) for p in preguntas]
+
+    def legado(consulta):
+        p = preguntas[consulta[0]]
+        return (consulta[1] == letra_correcta_legado(p), opcion_de_letra_legado(p, consulta[1]))
+
+    def indexado(consulta):
+        p = objetos[consulta[0]]
+        return (p.es_correcta(consulta[1]), p.opcion(consulta[1]))
+
+    us_legado, _ = cronometrar(legado, consultas, r)
+    us_indexado, _ = cronometrar(indexado, consultas, r)
+    print(f"\nRespuesta del quiz (es_correcta + opción elegida): "
+          f"recorrido {us_legado:.2f} µs, índice {us_indexado:.2f} µs ({us_legado / us_indexado:.1f}x)")
+
+    print(f"\nMemoria residente por ítem ({n} ítems)")
+    print(f"{'esquema':10s}{'dict (B)':>10s}{'__slots__ (B)':>15s}{'ahorro':>9s}")
+    for esquema, items, clase in (("tutor", tutorias, esquemas.Tutoria), ("quiz", preguntas, esquemas.PreguntaQuiz)):
+        textos = [json.dumps(d) for d in items]
+        como_dict = memoria_por_item(textos, None)
+        como_objeto = memoria_por_item(textos, clase.desde_dict)
+        print(f"{esquema:10s}{como_dict:10.0f}{como_objeto:15.0f}{1 - como_objeto / como_dict:9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: historial de intentos con escritura diferida por lotes frente a
+un INSERT + commit por intento en el hilo de la sesión.
+
+Uso:
+    python -m benchmarks.bench_historial [--sesiones 300] [--intentos 200] [--pausa-ms 1] [--estudiantes 5000]
+
+1. Sesiones concurrentes (un hilo cada una) registrando intentos con una
+   pausa corta entre uno y otro (--pausa-ms 0: sin pausa, el máximo
+   sostenido): latencia que ve el rerun (p50/p99 de la llamada) y filas por
+   segundo hasta que todo está en disco, con cada estrategia. Sin pausa,
+   el p99 de ambas lo dominan el GIL y el reparto de turnos entre 300 hilos.
+2. Consultas sobre el historial resultante: acierto por tema de todos los
+   estudiantes (desde el resumen diario y, para comparar, agrupando la
+   tabla de intentos) y los últimos intentos de un estudiante (índice).
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from modules import historial
+
+TEMAS = [f"Tema {i}" for i in range(12)]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def en_paralelo(sesiones, trabajo):
+    """ Lanza un hilo por sesión; devuelve (latencias en µs de todas las llamadas, segundos). """
+    latencias = [[] for _ in range(sesiones)]
+    barrera = threading.Barrier(sesiones + 1)
+
+    def sesion(i):
+        barrera.wait()
+        trabajo(i, latencias[i])
+
+    hilos = [threading.Thread(target=sesion, args=(i,)) for i in range(sesiones)]
+    for h in hilos:
+        h.start()
+    barrera.wait()
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.join()
+    return [x for lista in latencias for x in lista], time.perf_counter() - inicio
+
+
+def intento_al_azar(azar, estudiantes):
+    return (f"e{azar.randrange(estudiantes)}", "quiz", azar.choice(TEMAS), f"q{azar.randrange(10**6)}", "A",
+            azar.random() < 0.6, 4.0)
+
+
+def sincrono(sesiones, intentos, estudiantes, pausa):
+    con = historial._conectar()
+    lock = threading.Lock()
+    sql = ("INSERT INTO intentos (estudiante, tipo, tema, item, paso, respuesta, acierto, puntos, examen, momento) "
+           "VALUES (?, ?, ?, ?, 0, ?, ?, ?, NULL, ?)")
+
+    def trabajo(i, latencias):
+        azar = random.Random(i)
+        for _ in range(intentos):
+            e, tipo, tema, item, resp, acierto, pts = intento_al_azar(azar, estudiantes)
+            inicio = time.perf_counter()
+            with lock:
+                con.execute(sql, (e, tipo, tema, item, resp, int(acierto), pts, time.time()))
+                con.commit()
+            latencias.append((time.perf_counter() - inicio) * 1e6)
+            time.sleep(pausa)
+
+    latencias, segundos = en_paralelo(sesiones, trabajo)
+    con.close()
+    return latencias, segundos
+
+
+def diferido(sesiones, intentos, estudiantes, pausa):
+    def trabajo(i, latencias):
+        azar = random.Random(i)
+        for _ in range(intentos):
+            e, tipo, tema, item, resp, acierto, pts = intento_al_azar(azar, estudiantes)
+            inicio = time.perf_counter()
+            historial.registrar_intento(e, tipo, tema, item, resp, acierto, pts)
+            latencias.append((time.perf_counter() - inicio) * 1e6)
+            time.sleep(pausa)
+
+    inicio = time.perf_counter()
+    latencias, _ = en_paralelo(sesiones, trabajo)
+    historial.volcar(espera=600)
+    return latencias, time.perf_counter() - inicio
+
+
+def cronometrar(funcion, repeticiones=20):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sesiones", type=int, default=300)
+    parser.add_argument("--intentos", type=int, default=200, help="intentos por sesión")
+    parser.add_argument("--pausa-ms", type=float, default=1, help="pausa entre intentos de una sesión")
+    parser.add_argument("--estudiantes", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        total = args.sesiones * args.intentos
+        for nombre, estrategia in (("commit por intento", sincrono), ("escritura diferida", diferido)):
+            historial.RUTA_HISTORIAL = f"{carpeta}/{nombre.replace(' ', '_')}.sqlite3"
+            latencias, segundos = estrategia(args.sesiones, args.intentos, args.estudiantes, args.pausa_ms / 1000)
+            print(f"{nombre:20s}: {total} intentos de {args.sesiones} sesiones | llamada p50 "
+                  f"{percentil(latencias, 0.5):7.1f} µs, p99 {percentil(latencias, 0.99):8.1f} µs | "
+                  f"{total / segundos:8.0f} filas/s hasta disco")
+        datos = historial.estadisticas()
+        print(f"  lotes: {datos['lotes']}, mayor {datos['lote_max']} filas, último {datos['ms_ultimo_lote']} ms")
+
+        con = sqlite3.connect(historial.RUTA_HISTORIAL)
+        desde = time.time() - 30 * 24 * 3600
+        agrupando = lambda: con.execute(
+            "SELECT tema, COUNT(acierto), SUM(acierto) FROM intentos WHERE tipo = 'quiz' AND momento >= ? "
+            "GROUP BY tema", (desde,)).fetchall()
+        print(f"acierto por tema ({total} intentos): resumen diario {cronometrar(historial.acierto_por_tema):.2f} ms"
+              f" | agrupando intentos {cronometrar(agrupando, 3):.1f} ms")
+        print(f"últimos 50 intentos de un estudiante: {cronometrar(lambda: historial.intentos_de('e42')):.2f} ms")
+        tasas = [t["tasa"] for t in historial.acierto_por_tema()]
+        print(f"  {len(tasas)} temas, acierto medio {statistics.mean(tasas):.3f}")
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: extractor JSON de una pasada vs. el `limpiar_json` anterior.
+
+Uso:
+    python -m benchmarks.bench_json [--repeticiones 2000]
+
+Recorre `corpus_gemini.jsonl` (salidas de Gemini con cercas, prosa y
+barras de LaTeX mal escapadas; añadir ahí los casos reales que aparezcan)
+y reporta tiempo medio por llamada y cuántos casos quedan bien parseados.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from modules.json_robusto import analizar_json
+
+RUTA_CORPUS = os.path.join(os.path.dirname(__file__), "corpus_gemini.jsonl")
+
+
+def limpiar_json_legado(texto):
+    """ Versión anterior (hasta tres json.loads), copiada tal cual para comparar. """
+    if not texto: return None
+    texto = texto.replace("```json", "").replace("```", "").strip()
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        pass
+    try:
+        texto_reparado = re.sub(r'\\(?!["\\/bfnrtu])', r'\\\\', texto)
+        return json.loads(texto_reparado)
+    except Exception:
+        try:
+             return json.loads(texto.replace("\\", "\\\\"))
+        except:
+             return None
+
+
+def cargar_corpus():
+    with open(RUTA_CORPUS, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def medir(funcion, corpus, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for caso in corpus:
+            funcion(caso["texto"])
+    return (time.perf_counter() - inicio) / (repeticiones * len(corpus)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = cargar_corpus()
+    nueva = lambda texto: analizar_json(texto)[0]
+
+    print(f"{'caso':<24} {'legado':>8} {'nuevo':>8}  reparaciones")
+    aciertos = {"legado": 0, "nuevo": 0}
+    for caso in corpus:
+        ok_legado = limpiar_json_legado(caso["texto"]) == caso["esperado"]
+        datos, reparaciones = analizar_json(caso["texto"])
+        ok_nuevo = datos == caso["esperado"]
+        aciertos["legado"] += ok_legado
+        aciertos["nuevo"] += ok_nuevo
+        print(f"{caso['nombre']:<24} {'ok' if ok_legado else 'MAL':>8} {'ok' if ok_nuevo else 'MAL':>8}  {','.join(reparaciones)}")
+
+    t_legado = medir(limpiar_json_legado, corpus, args.repeticiones)
+    t_nuevo = medir(nueva, corpus, args.repeticiones)
+    print()
+    print(f"Correctos: legado {aciertos['legado']}/{len(corpus)} | nuevo {aciertos['nuevo']}/{len(corpus)}")
+    print(f"Tiempo medio por llamada: legado {t_legado:.1f} µs | nuevo {t_nuevo:.1f} µs ({t_legado / t_nuevo:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
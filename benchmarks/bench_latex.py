@@ -0,0 +1,138 @@
+"""
+Benchmark: fórmulas dibujadas en el servidor (`latex_render`) frente a
+mandar el LaTeX crudo al navegador en cada rerun.
+
+Uso:
+    python -m benchmarks.bench_latex [--universo 80] [--sesiones 200] [--reruns 6]
+
+1. Coste de una fórmula: primer render con mathtext, lectura desde la
+   caché de disco (otro proceso o tras reiniciar) y acierto en el LRU.
+2. Trabajo de la pantalla del quiz por rerun: partir las opciones en ")"
+   cada vez (antes) frente a la vista preparada (`preparar_pregunta`).
+3. Sesiones que sacan 5 preguntas de un universo común (como el pool y el
+   banco) y hacen varios reruns cada una: cuántos renders caen en la
+   petición del estudiante con y sin preparar las preguntas al entrar al
+   pool, y el tiempo medio de pantalla.
+4. Bytes que viajan al navegador por pregunta (crudo y gzip). El SVG pesa
+   más que el LaTeX; lo que se ahorra es el análisis y la maquetación de
+   KaTeX en el dispositivo del estudiante, que aquí no se puede medir.
+"""
+import argparse
+import gzip
+import random
+import statistics
+import tempfile
+import time
+
+from modules import generador_parametrico, latex_render
+
+TEMAS = ["Integración por partes", "Fracciones parciales", "EDO de variables separables", "EDO lineales de primer orden"]
+
+
+def universo(n):
+    preguntas = generador_parametrico.generar_para_temas(TEMAS, n, semilla=11)
+    return [p for p in preguntas if p.get("opciones")]
+
+
+def vaciar_memoria():
+    with latex_render._lock:
+        latex_render._svgs.clear()
+        latex_render._vistas.clear()
+
+
+def medir_formulas(preguntas):
+    formulas = [m.group(2) or m.group(1) for p in preguntas for texto in [p["pregunta"], *p["opciones"]]
+                for m in latex_render._RE_FORMULA.finditer(texto)]
+    formulas = list(dict.fromkeys(formulas))[:40]
+
+    def cronometrar():
+        inicio = time.perf_counter()
+        for f in formulas:
+            latex_render.svg(f)
+        return (time.perf_counter() - inicio) / len(formulas) * 1000
+
+    frio = cronometrar()
+    lru = cronometrar()
+    vaciar_memoria()
+    disco = cronometrar()
+    return frio, disco, lru
+
+
+def pantalla_antes(pregunta):
+    opciones = []
+    for opcion_texto in pregunta["opciones"]:
+        if ")" in opcion_texto:
+            letra, resto = opcion_texto.split(")", 1)
+            opciones.append(f"**{letra})** {resto}")
+        else:
+            opciones.append(opcion_texto)
+    radio = [op.split(")")[0] + ")" for op in pregunta["opciones"]]
+    return f"#### {pregunta['pregunta']}", opciones, radio
+
+
+def pantalla_despues(pregunta):
+    vista = latex_render.preparar_pregunta(pregunta)
+    return f"#### {vista['enunciado']}", [t for _, t in vista["opciones"]], [f"{letra})" for letra, _ in vista["opciones"]]
+
+
+def por_rerun(preguntas, funcion, repeticiones=2000):
+    for p in preguntas:
+        funcion(p)
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        funcion(preguntas[i % len(preguntas)])
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+def simular_sesiones(preguntas, sesiones, reruns, precalentar):
+    vaciar_memoria()
+    latex_render.RUTA_LATEX = tempfile.mkdtemp()
+    if precalentar:
+        for p in preguntas:
+            latex_render.preparar_pregunta(p)
+    antes = latex_render.estadisticas()["renders"]
+    azar = random.Random(5)
+    tiempos = []
+    for _ in range(sesiones):
+        for p in azar.sample(preguntas, 5):
+            for _ in range(reruns):
+                inicio = time.perf_counter()
+                pantalla_despues(p)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+    return latex_render.estadisticas()["renders"] - antes, statistics.mean(tiempos), max(tiempos)
+
+
+def bytes_por_pregunta(preguntas):
+    crudo = [("\n".join([a, *b])).encode("utf-8") for a, b, _ in map(pantalla_antes, preguntas)]
+    svg = [("\n".join([a, *b])).encode("utf-8") for a, b, _ in map(pantalla_despues, preguntas)]
+    media = lambda datos: statistics.mean(len(d) for d in datos)
+    return media(crudo), media([gzip.compress(d) for d in crudo]), media(svg), media([gzip.compress(d) for d in svg])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--universo", type=int, default=80)
+    parser.add_argument("--sesiones", type=int, default=200)
+    parser.add_argument("--reruns", type=int, default=6)
+    args = parser.parse_args()
+
+    preguntas = universo(args.universo)
+    with tempfile.TemporaryDirectory() as carpeta:
+        latex_render.RUTA_LATEX = carpeta
+        frio, disco, lru = medir_formulas(preguntas)
+        print(f"fórmula: primer render {frio:.1f} ms | desde disco {disco:.2f} ms | LRU {lru * 1000:.1f} µs")
+
+        print(f"pantalla del quiz por rerun: partir opciones {por_rerun(preguntas, pantalla_antes):.1f} µs | "
+              f"vista preparada {por_rerun(preguntas, pantalla_despues):.1f} µs")
+
+    for precalentar in (False, True):
+        renders, media, peor = simular_sesiones(preguntas, args.sesiones, args.reruns, precalentar)
+        print(f"{'preparadas al entrar al pool' if precalentar else 'sin preparar':28s}: "
+              f"{renders:4d} renders en peticiones | pantalla media {media:.2f} ms, peor {peor:.0f} ms")
+
+    crudo, crudo_gz, svg, svg_gz = bytes_por_pregunta(preguntas)
+    print(f"bytes por pregunta: LaTeX {crudo:.0f} ({crudo_gz:.0f} gzip) | SVG {svg:.0f} ({svg_gz:.0f} gzip)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: varias réplicas (procesos) con y sin estado compartido, contra
+el Gemini simulado.
+
+Uso:
+    python -m benchmarks.bench_multiproceso [--procesos 4] [--ejercicios 12] [--rpm 120] [--latencia-ms 300]
+
+Cada proceso hace de una réplica de Streamlit en su propio nodo (caché de
+tutorías local en su carpeta) y pide la tutoría de los mismos ejercicios,
+en otro orden. El simulador tiene el mismo tope de peticiones por minuto
+que la cuota configurada en cada réplica (GEMINI_RPM), como la cuota real
+de la clave compartida.
+
+- por proceso: cada réplica tutoriza todo y se reparte la cuota a ciegas
+  (los 429 del tope los ve el simulador).
+- compartido (TUTOR_ESTADO_COMPARTIDO en un SQLite): las réplicas se
+  sirven las tutorías de las otras (aciertos compartidos), la cuota es una
+  sola y el pool del quiz lo llena una réplica y lo sirven todas.
+
+Se informa de las peticiones al modelo, los 429, los aciertos de caché
+(locales y compartidos) y las preguntas del pool que recibió cada réplica.
+Las respuestas rotas del simulador no se cachean: con estado compartido
+siguen haciendo falta más llamadas que ejercicios distintos.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.servidor_gemini_simulado import iniciar_en_hilo
+
+TEMA_POOL = "Integración por partes"
+
+
+def replica(i, args, carpeta, barrera, resultados):
+    # Se importa aquí: el entorno (cuota, estado compartido) ya es el del experimento
+    from modules import backend_modelo, cache_tutor, cliente_gemini, generador_parametrico, pool_quiz, tutor_ia
+
+    cache_tutor.RUTA_CACHE = os.path.join(carpeta, f"replica_{i}", "tutor_cache.sqlite3")
+    modelo = backend_modelo.ModeloHTTP(f"http://127.0.0.1:{args.puerto}")
+    ejercicios = [(f"Calcule la integral del ejercicio {k} de la guía por partes.", TEMA_POOL)
+                  for k in range(args.ejercicios)]
+    random.Random(i).shuffle(ejercicios)
+
+    barrera.wait()
+    inicio = time.perf_counter()
+    llamadas = validas = 0
+    for pregunta, tema in ejercicios:
+        clave = cache_tutor.generar_clave(pregunta, tema, modelo.model_name, tutor_ia.VERSION_PROMPT_TUTOR)
+        datos = cache_tutor.obtener(clave)
+        if datos is None:
+            llamadas += 1
+            try:
+                respuesta = cliente_gemini.generar(modelo, tutor_ia.construir_prompt_tutor(pregunta, tema))
+                datos = tutor_ia.limpiar_json(respuesta.text)
+            except cliente_gemini.ErrorIA:
+                datos = None
+            if tutor_ia.validar_tutor(datos):
+                cache_tutor.guardar(clave, datos)
+        validas += tutor_ia.validar_tutor(datos)
+    segundos = time.perf_counter() - inicio
+
+    # Pool del quiz: la réplica 0 lo llena; todas (ella incluida) sacan un examen de 5
+    if i == 0:
+        pool_quiz.agregar(TEMA_POOL, generador_parametrico.generar(TEMA_POOL, 10))
+    barrera.wait()
+    del_pool = len(pool_quiz.tomar([TEMA_POOL], 5, set()))
+
+    cache = cache_tutor.estadisticas()
+    resultados.put({"replica": i, "llamadas": llamadas, "validas": validas, "segundos": segundos,
+                    "hits": cache["hits"], "hits_compartidos": cache["hits_compartidos"], "del_pool": del_pool})
+
+
+def ejecutar(args, simulador, compartido):
+    contexto = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as carpeta:
+        os.environ["TUTOR_ESTADO_COMPARTIDO"] = os.path.join(carpeta, "estado.sqlite3") if compartido else ""
+        os.environ["GEMINI_RPM"] = str(args.rpm)
+        os.environ["GEMINI_RAFAGA"] = "2"
+        barrera = contexto.Barrier(args.procesos)
+        resultados = contexto.Queue()
+        antes = simulador.estadisticas()
+        procesos = [contexto.Process(target=replica, args=(i, args, carpeta, barrera, resultados))
+                    for i in range(args.procesos)]
+        for p in procesos:
+            p.start()
+        filas = sorted((resultados.get() for _ in procesos), key=lambda f: f["replica"])
+        for p in procesos:
+            p.join()
+    despues = simulador.estadisticas()
+    return filas, despues["peticiones"] - antes["peticiones"], despues["errores_429_tope"] - antes["errores_429_tope"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--ejercicios", type=int, default=12)
+    parser.add_argument("--rpm", type=float, default=120, help="cuota de la clave (simulador y GEMINI_RPM)")
+    parser.add_argument("--latencia-ms", type=float, default=300)
+    parser.add_argument("--puerto", type=int, default=8773)
+    args = parser.parse_args()
+
+    _, simulador = iniciar_en_hilo(args.puerto, latencia_ms=args.latencia_ms, jitter_ms=50, rpm=args.rpm, semilla=5)
+    print(f"{args.procesos} réplicas x {args.ejercicios} ejercicios (los mismos), cuota {args.rpm:.0f} rpm")
+    print(f"{'modo':12s}{'llamadas':>10s}{'peticiones':>12s}{'429':>6s}{'hits locales':>14s}"
+          f"{'hits compartidos':>18s}{'válidas':>9s}{'s (máx)':>9s}{'del pool':>10s}")
+    for nombre, compartido in (("por proceso", False), ("compartido", True)):
+        filas, peticiones, errores_429 = ejecutar(args, simulador, compartido)
+        suma = lambda campo: sum(f[campo] for f in filas)
+        print(f"{nombre:12s}{suma('llamadas'):10d}{peticiones:12d}{errores_429:6d}{suma('hits'):14d}"
+              f"{suma('hits_compartidos'):18d}{suma('validas'):5d}/{args.procesos * args.ejercicios:<3d}"
+              f"{max(f['segundos'] for f in filas):9.1f}{'/'.join(str(f['del_pool']) for f in filas):>10s}")
+
+
+if __name__ == "__main__":
+    main()
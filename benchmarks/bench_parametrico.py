@@ -0,0 +1,52 @@
+"""
+Benchmark: generación local de preguntas por plantillas.
+
+Uso:
+    python -m benchmarks.bench_parametrico [--cantidad 1000] [--verificar 40]
+
+Mide, por plantilla, cuántas preguntas distintas salen y cuánto cuesta
+generarlas. Con --verificar pasa una muestra por el verificador SymPy:
+la respuesta correcta debe ser VALIDA y ningún distractor debe pasar.
+La muestra comparte un solo plazo, proporcional a su tamaño (lo que no
+termina a tiempo no cuenta como INVALIDO).
+"""
+import argparse
+import time
+
+from modules import generador_parametrico, verificador
+
+TEMAS = {
+    "por_partes": "Integración por partes",
+    "fracciones_parciales": "Fracciones parciales",
+    "edo_separable": "EDO de variables separables",
+    "edo_lineal": "EDO lineales de primer orden",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cantidad", type=int, default=1000)
+    parser.add_argument("--verificar", type=int, default=0)
+    args = parser.parse_args()
+
+    for nombre, tema in TEMAS.items():
+        inicio = time.perf_counter()
+        preguntas = generador_parametrico.generar(tema, args.cantidad, semilla=1)
+        ms = (time.perf_counter() - inicio) * 1000
+        distintas = len({p["pregunta"] for p in preguntas})
+        linea = f"{nombre:22s} {distintas:5d} distintas  {ms:7.2f} ms  ({ms * 1000 / max(1, distintas):.1f} µs/ítem)"
+        if args.verificar:
+            muestra = preguntas[:args.verificar]
+            plazo = verificador.TIMEOUT_SEGUNDOS * max(1, len(muestra) / 10)
+            validas = len(verificador.filtrar_preguntas_quiz(muestra, plazo))
+            distractores = [
+                dict(p, respuesta_correcta=next(o for o in p["opciones"] if o != p["respuesta_correcta"]))
+                for p in muestra
+            ]
+            colados = len(verificador.filtrar_preguntas_quiz(distractores, plazo))
+            linea += f"  verificadas {validas}/{len(muestra)}  distractores aceptados {colados}"
+        print(linea)
+
+
+if __name__ == "__main__":
+    main()
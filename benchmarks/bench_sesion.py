@@ -0,0 +1,116 @@
+"""
+Benchmark: memoria de `st.session_state` por sesión, antes y después del
+almacén compartido de preguntas.
+
+Uso:
+    python -m benchmarks.bench_sesion [--sesiones 500] [--universo 200]
+
+Simula N sesiones a mitad de un quiz y de una serie del Dojo, cada una
+con 5 preguntas de quiz, 5 ejercicios, la tutoría actual y 5 respuestas,
+sacadas de un universo común de preguntas (como el pool y el banco):
+
+- antes: cada sesión guarda sus propios dicts (cada petición parsea su
+  copia del JSON) y respuestas con `pregunta`/`explicacion`/`correcta`.
+- después: IDs de `almacen_preguntas` y tuplas (id, letra, puntos); el
+  contenido se cuenta una sola vez, en el almacén.
+
+El tamaño es profundo (cada objeto se cuenta una vez aunque aparezca en
+varias sesiones), además del tamaño pickle por sesión.
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+
+from modules import almacen_preguntas, generador_parametrico
+
+RUTA_CORPUS = os.path.join(os.path.dirname(__file__), "respuestas_simuladas.jsonl")
+TEMAS = ["Integración por partes", "Fracciones parciales", "EDO de variables separables", "EDO lineales de primer orden"]
+
+
+def tamano_profundo(objeto, vistos):
+    """ Bytes de `objeto` y lo que cuelga de él, sin contar dos veces lo ya visto. """
+    if id(objeto) in vistos:
+        return 0
+    vistos.add(id(objeto))
+    total = sys.getsizeof(objeto)
+    if isinstance(objeto, dict):
+        total += sum(tamano_profundo(k, vistos) + tamano_profundo(v, vistos) for k, v in objeto.items())
+    elif isinstance(objeto, (list, tuple, set)):
+        total += sum(tamano_profundo(v, vistos) for v in objeto)
+    return total
+
+
+def tutorias_validas():
+    tutorias = []
+    with open(RUTA_CORPUS, encoding="utf-8") as f:
+        for linea in f:
+            caso = json.loads(linea)
+            if caso["tipo"] == "tutor":
+                try:
+                    tutorias.append(json.loads(caso["texto"]))
+                except ValueError:
+                    pass
+    return [t for t in tutorias if isinstance(t, dict) and "estrategias" in t]
+
+
+def sesion_antes(azar, universo, tutorias):
+    copia = lambda o: json.loads(json.dumps(o))
+    quiz = [copia(p) for p in azar.sample(universo, 5)]
+    respuestas = [
+        {"pregunta": p["pregunta"], "elegida": p["opciones"][0], "correcta": p["respuesta_correcta"],
+         "explicacion": p["explicacion"], "puntos": 4.0, "es_correcta": True}
+        for p in quiz
+    ]
+    return {
+        "preguntas_quiz": quiz,
+        "respuestas_usuario": respuestas,
+        "entrenamiento_lista": [copia(p) for p in azar.sample(universo, 5)],
+        "entrenamiento_data_ia": copia(azar.choice(tutorias)),
+    }
+
+
+def sesion_despues(azar, universo, tutorias):
+    quiz = almacen_preguntas.guardar_lista(azar.sample(universo, 5))
+    return {
+        "quiz_ids": quiz,
+        "respuestas_usuario": [(qid, "A", 4.0) for qid in quiz],
+        "entrenamiento_ids": almacen_preguntas.guardar_lista(azar.sample(universo, 5)),
+        "entrenamiento_tutor_id": almacen_preguntas.guardar(azar.choice(tutorias)),
+    }
+
+
+def medir(sesiones, compartido=None):
+    vistos = set()
+    por_sesiones = sum(tamano_profundo(s, vistos) for s in sesiones)
+    extra = tamano_profundo(compartido, vistos) if compartido is not None else 0
+    pickle_medio = sum(len(pickle.dumps(s)) for s in sesiones) / len(sesiones)
+    return por_sesiones, extra, pickle_medio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sesiones", type=int, default=500)
+    parser.add_argument("--universo", type=int, default=200, help="preguntas distintas en circulación")
+    args = parser.parse_args()
+
+    universo = generador_parametrico.generar_para_temas(TEMAS, args.universo, semilla=3)
+    tutorias = tutorias_validas()
+
+    antes = [sesion_antes(random.Random(i), universo, tutorias) for i in range(args.sesiones)]
+    despues = [sesion_despues(random.Random(i), universo, tutorias) for i in range(args.sesiones)]
+
+    b_antes, _, p_antes = medir(antes)
+    b_despues, b_almacen, p_despues = medir(despues, almacen_preguntas._objetos)
+    n = args.sesiones
+    print(f"{n} sesiones, {len(universo)} preguntas en circulación, almacén: {almacen_preguntas.estadisticas()}")
+    print(f"{'':10s}{'KB/sesión':>12s}{'pickle KB':>12s}{'total MB':>12s}")
+    print(f"{'antes':10s}{b_antes / n / 1024:12.1f}{p_antes / 1024:12.1f}{b_antes / 2**20:12.2f}")
+    print(f"{'después':10s}{b_despues / n / 1024:12.1f}{p_despues / 1024:12.1f}{(b_despues + b_almacen) / 2**20:12.2f}"
+          f"   (almacén compartido: {b_almacen / 2**20:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
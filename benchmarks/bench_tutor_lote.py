@@ -0,0 +1,117 @@
+"""
+Benchmark: tutorías de una serie del Dojo, una llamada por ejercicio
+frente a lotes (contra el Gemini simulado, en este mismo proceso).
+
+Uso:
+    python -m benchmarks.bench_tutor_lote [--series 5] [--latencia-ms 700] [--ms-por-token 8]
+
+Estrategias, para una serie de 5 ejercicios sin caché:
+
+- secuencial: una llamada por ejercicio, una detrás de otra.
+- prefetch_2: una llamada por ejercicio con 2 hilos (el prefetch anterior).
+- primero+lote: el primero solo y los otros 4 en un lote, en paralelo (el actual).
+- lote: los 5 en una sola llamada.
+
+Se mide el tiempo hasta la primera tutoría y hasta la última, las
+peticiones al modelo, los tokens de prompt enviados y cuántas tutorías
+válidas salen (el simulador devuelve también respuestas rotas: cada
+estrategia reintenta las que fallan una vez).
+
+Con la cuota por defecto (GEMINI_RPM=15) el limitador domina los tiempos y
+lo que se gana es, sobre todo, menos peticiones dentro de la cuota; con
+GEMINI_RPM=600 GEMINI_RAFAGA=20 se ve solo el efecto de la latencia.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import backend_modelo, cache_tutor, cliente_gemini, tutor_ia, tutor_lote
+
+from benchmarks.servidor_gemini_simulado import iniciar_en_hilo
+
+
+class Contador:
+    """ Envuelve las llamadas al modelo para contar peticiones y tokens de prompt. """
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self.peticiones = 0
+        self.tokens_prompt = 0
+
+    def __call__(self, prompt):
+        self.peticiones += 1
+        self.tokens_prompt += len(prompt) // 4
+        try:
+            return cliente_gemini.generar(self.modelo, prompt)
+        except cliente_gemini.ErrorIA:
+            return None
+
+
+def individual(llamar, pregunta, tema):
+    for _ in range(2):
+        respuesta = llamar(tutor_ia.construir_prompt_tutor(pregunta, tema))
+        datos = tutor_ia.limpiar_json(respuesta.text) if respuesta else None
+        if tutor_ia.validar_tutor(datos):
+            return datos
+    return None
+
+
+def ejecutar(estrategia, ejercicios, llamar):
+    """ Devuelve (segundos hasta la primera, segundos hasta la última, válidas). """
+    inicio = time.perf_counter()
+    listos = []
+
+    def marcar(datos):
+        listos.append(time.perf_counter() - inicio)
+        return datos
+
+    if estrategia == "secuencial":
+        resultados = [marcar(individual(llamar, *e)) for e in ejercicios]
+    elif estrategia == "prefetch_2":
+        with ThreadPoolExecutor(2) as ex:
+            resultados = list(ex.map(lambda e: marcar(individual(llamar, *e)), ejercicios))
+    elif estrategia == "primero+lote":
+        with ThreadPoolExecutor(2) as ex:
+            primero = ex.submit(lambda: marcar(individual(llamar, *ejercicios[0])))
+            resto = ex.submit(lambda: marcar(tutor_lote.generar(ejercicios[1:], llamar, "simulado")))
+            resultados = [primero.result()] + resto.result()
+    else:
+        resultados = marcar(tutor_lote.generar(ejercicios, llamar, "simulado"))
+    return min(listos), max(listos), sum(r is not None for r in resultados)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=5)
+    parser.add_argument("--puerto", type=int, default=8771)
+    parser.add_argument("--latencia-ms", type=float, default=700)
+    parser.add_argument("--ms-por-token", type=float, default=8, help="≈125 tokens/s de salida")
+    args = parser.parse_args()
+
+    iniciar_en_hilo(args.puerto, latencia_ms=args.latencia_ms, jitter_ms=100, ms_por_token=args.ms_por_token, semilla=3)
+    modelo = backend_modelo.ModeloHTTP(f"http://127.0.0.1:{args.puerto}")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        cache_tutor.RUTA_CACHE = os.path.join(carpeta, "tutor.sqlite3")
+        print(f"{'estrategia':14s}{'1ª (s)':>8s}{'todas (s)':>11s}{'peticiones':>12s}{'tokens prompt':>15s}{'válidas':>9s}")
+        for estrategia in ("secuencial", "prefetch_2", "primero+lote", "lote"):
+            primeras, ultimas, validas = [], [], []
+            contador = Contador(modelo)
+            for serie in range(args.series):
+                # Enunciados distintos en cada serie: nada sale de la caché
+                ejercicios = [(f"Ejercicio {estrategia}-{serie}-{i}: resuelve el problema {i} de la guía.", "Cálculo")
+                              for i in range(5)]
+                primera, ultima, n = ejecutar(estrategia, ejercicios, contador)
+                primeras.append(primera)
+                ultimas.append(ultima)
+                validas.append(n)
+            print(f"{estrategia:14s}{statistics.mean(primeras):8.2f}{statistics.mean(ultimas):11.2f}"
+                  f"{contador.peticiones / args.series:12.1f}{contador.tokens_prompt / args.series:15.0f}"
+                  f"{statistics.mean(validas):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
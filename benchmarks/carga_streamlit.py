@@ -0,0 +1,258 @@
+"""
+Prueba de carga sin navegador: N estudiantes simulados recorren la app a
+la vez (Dojo, Respuesta Guiada y Quiz) contra el Gemini simulado.
+
+Uso:
+    python -m benchmarks.carga_streamlit --lanzar-servidor --concurrencias 1,2,4,8 \\
+        [--sesiones 2] [--flujos dojo,consulta,quiz] [--latencia-ms 800] [--tasa-429 0.05] [--rpm 600]
+
+Cada estudiante es un `AppTest` de Streamlit en su propio hilo, dentro de
+un mismo proceso (como las sesiones de un servidor real: comparten
+cachés, pool y limitador). Cada clic es una "acción" cronometrada (el
+rerun completo del script). Por nivel de concurrencia se informan las
+sesiones completadas por minuto, acciones por segundo, p50/p95/p99 por
+acción y la tasa de error (excepción en el script, mensaje de error en
+pantalla o flujo que no llegó al final).
+
+Sin --lanzar-servidor se usa el servidor ya levantado en TUTOR_SIMULADOR_URL.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from modules import almacen_preguntas, esquemas
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, "app.py")
+
+RUTA_DOJO = "a) Entrenamiento (Temario)"
+RUTA_CONSULTA = "b) Respuesta Guiada (Consultas)"
+RUTA_QUIZ = "c) Autoevaluación (Quiz)"
+
+ENUNCIADOS_CONSULTA = [
+    r"Calcula $\int x e^{2x}\,dx$",
+    r"Resuelve $y' + 2y = 4$",
+    r"Halla el área entre $y = x^2$ y $y = x$",
+    r"Calcula $\int \frac{1}{(x-1)(x+2)}\,dx$",
+]
+
+
+class FlujoIncompleto(Exception):
+    pass
+
+
+class Estudiante:
+    """ Una sesión de navegador simulada: un AppTest y el registro de sus acciones. """
+
+    def __init__(self, registro, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(RUTA_APP, default_timeout=timeout)
+        self.registro = registro
+        self.flujo = ""
+        self.cargada = False
+
+    def accion(self, nombre, preparar=None):
+        inicio = time.perf_counter()
+        error = None
+        try:
+            if preparar:
+                preparar()
+            self.at.run()
+            if self.at.exception:
+                error = self.at.exception[0].value
+            elif self.at.error:
+                error = self.at.error[0].value
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.registro.anotar(self.flujo, nombre, time.perf_counter() - inicio, error)
+        if error:
+            raise FlujoIncompleto(f"{self.flujo}/{nombre}: {error}")
+
+    def boton(self, prefijo=None, clave=None):
+        for b in self.at.button:
+            if (clave and b.key == clave) or (prefijo and b.label.startswith(prefijo)):
+                return b
+        raise FlujoIncompleto(f"{self.flujo}: no aparece el botón {clave or prefijo!r}")
+
+    def clic(self, nombre, prefijo=None, clave=None):
+        boton = self.boton(prefijo, clave)
+        self.accion(nombre, boton.click)
+
+    def ir_a(self, ruta):
+        # La navegación vive en la barra lateral (interfaz.mostrar_sidebar)
+        for radio in list(self.at.sidebar.radio) + list(self.at.radio):
+            if ruta in radio.options:
+                self.accion("navegar", lambda: radio.set_value(ruta))
+                return
+        raise FlujoIncompleto(f"no aparece la ruta {ruta!r}")
+
+    def estado(self, clave, defecto=None):
+        return self.at.session_state[clave] if clave in self.at.session_state else defecto
+
+    # --- Flujos ---
+
+    def dojo(self, azar):
+        self.ir_a(RUTA_DOJO)
+        selector = self.at.multiselect[0]
+        self.accion("elegir_temas", lambda: selector.set_value([azar.choice(selector.options)]))
+        self.clic("iniciar_serie", prefijo="⚡ Iniciar")
+        for idx in range(len(self.estado("entrenamiento_ids", []))):
+            tutor = almacen_preguntas.obtener(self.estado("entrenamiento_tutor_id"))
+            if not tutor:
+                raise FlujoIncompleto(f"dojo: ejercicio {idx} sin datos del tutor")
+            correcta = tutor["estrategias"][tutor["indice_correcta"]]
+            radio = self.at.radio(key=f"radio_estrat_{idx}")
+            self.accion("elegir_estrategia", lambda: radio.set_value(correcta))
+            self.clic("validar_estrategia", clave=f"btn_val_{idx}")
+            self.clic("paso_intermedio", clave=f"btn_go_step2_{idx}")
+            self.clic("hito_alcanzado", clave=f"btn_si_{idx}")
+            self.clic("siguiente_ejercicio", clave=f"btn_next_{idx}")
+        self.clic("volver_inicio", clave="btn_reset_entrenamiento")
+
+    def consulta(self, azar):
+        self.ir_a(RUTA_CONSULTA)
+        area = self.at.text_area[0]
+        self.accion("escribir_enunciado", lambda: area.input(azar.choice(ENUNCIADOS_CONSULTA)))
+        self.clic("analizar", prefijo="🚀 Resolver")
+        datos = self.estado("consulta_data")
+        if not datos:
+            raise FlujoIncompleto("consulta: el análisis no devolvió datos")
+        correcta = datos["estrategias"][datos["indice_correcta"]]
+        radio = self.at.radio(key="rad_cons")
+        self.accion("elegir_estrategia", lambda: radio.set_value(correcta))
+        self.clic("validar_estrategia", prefijo="Validar Estrategia")
+        self.clic("paso_intermedio", prefijo="Ver Paso Intermedio")
+        self.clic("hito_alcanzado", prefijo="👍 Llegué")
+        self.clic("terminar", prefijo="🏁 Terminar")
+
+    def quiz(self, azar):
+        self.ir_a(RUTA_QUIZ)
+        self.clic("generar_quiz", prefijo="🏆 Generar Primer Parcial")
+        preguntas = [almacen_preguntas.obtener_como(qid, esquemas.PreguntaQuiz) for qid in self.estado("quiz_ids", [])]
+        if not self.estado("quiz_activo") or not preguntas or None in preguntas:
+            raise FlujoIncompleto("quiz: no se generaron preguntas")
+        for actual in range(len(preguntas)):
+            radio = self.at.radio(key=f"radio_{actual}")
+            # Un estudiante que acierta más o menos la mitad
+            letra = preguntas[actual].letra_correcta if azar.random() < 0.5 else None
+            opcion = next((o for o in radio.options if letra and o.startswith(letra)), azar.choice(radio.options))
+            self.accion("elegir_opcion", lambda: radio.set_value(opcion))
+            self.clic("responder", prefijo="Responder")
+            self.clic("siguiente_pregunta", prefijo="Siguiente Pregunta")
+        self.clic("nuevo_examen", prefijo="🔄 Comenzar Nuevo Examen")
+
+    def recorrer(self, flujo, azar):
+        self.flujo = flujo
+        if not self.cargada:
+            self.accion("cargar_app")
+            self.cargada = True
+        getattr(self, flujo)(azar)
+
+
+class Registro:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.sesiones = defaultdict(lambda: [0, 0])  # flujo -> [completas, fallidas]
+
+    def anotar(self, flujo, accion, segundos, error):
+        with self.lock:
+            self.tiempos[(flujo, accion)].append(segundos)
+            if error:
+                self.errores[(flujo, accion)] += 1
+
+    def sesion(self, flujo, ok):
+        with self.lock:
+            self.sesiones[flujo][0 if ok else 1] += 1
+
+
+def simular_estudiante(n, flujos, sesiones, registro, timeout, semilla):
+    azar = random.Random(semilla + n)
+    estudiante = Estudiante(registro, timeout)
+    for i in range(sesiones):
+        flujo = flujos[(n + i) % len(flujos)]
+        try:
+            estudiante.recorrer(flujo, azar)
+            registro.sesion(flujo, True)
+        except FlujoIncompleto as e:
+            print(f"Aviso: estudiante {n}: {e}")
+            registro.sesion(flujo, False)
+            # Sesión nueva, como quien recarga la pestaña
+            estudiante = Estudiante(registro, timeout)
+
+
+def nivel(concurrencia, args, flujos):
+    registro = Registro()
+    hilos = [
+        threading.Thread(target=simular_estudiante, name=f"estudiante_{n}",
+                         args=(n, flujos, args.sesiones, registro, args.timeout, args.semilla))
+        for n in range(concurrencia)
+    ]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return registro, time.perf_counter() - inicio
+
+
+def informar(concurrencia, registro, duracion):
+    completas = sum(c for c, _ in registro.sesiones.values())
+    fallidas = sum(f for _, f in registro.sesiones.values())
+    acciones = sum(len(v) for v in registro.tiempos.values())
+    errores = sum(registro.errores.values())
+    print(f"\n=== {concurrencia} estudiantes | {duracion:.1f} s ===")
+    print(f"sesiones: {completas} completas, {fallidas} fallidas ({completas / duracion * 60:.1f}/min) | "
+          f"acciones: {acciones} ({acciones / duracion:.2f}/s) | error: {errores / max(1, acciones):.1%}")
+    print(f"{'flujo/acción':<34}{'n':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'err':>6}")
+    for (flujo, accion), tiempos in sorted(registro.tiempos.items()):
+        p50, p95, p99 = np.percentile(np.array(tiempos) * 1000, [50, 95, 99])
+        print(f"{flujo + '/' + accion:<34}{len(tiempos):>5}{p50:>9.0f}{p95:>9.0f}{p99:>9.0f}"
+              f"{registro.errores[(flujo, accion)]:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencias", default="1,2,4,8")
+    parser.add_argument("--sesiones", type=int, default=2, help="sesiones por estudiante y nivel")
+    parser.add_argument("--flujos", default="dojo,consulta,quiz")
+    parser.add_argument("--timeout", type=float, default=120, help="segundos máximos por rerun")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--lanzar-servidor", action="store_true", help="arranca el Gemini simulado en este proceso")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=300)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--rpm", type=float, default=0)
+    args = parser.parse_args()
+
+    os.environ["TUTOR_BACKEND"] = "simulado"
+    os.environ.setdefault("TUTOR_SIMULADOR_URL", f"http://127.0.0.1:{args.puerto}")
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+
+    simulador = None
+    if args.lanzar_servidor:
+        from benchmarks.servidor_gemini_simulado import iniciar_en_hilo
+
+        _, simulador = iniciar_en_hilo(args.puerto, latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms,
+                                       tasa_429=args.tasa_429, rpm=args.rpm, semilla=args.semilla)
+
+    flujos = [f.strip() for f in args.flujos.split(",") if f.strip()]
+    for concurrencia in (int(c) for c in args.concurrencias.split(",")):
+        registro, duracion = nivel(concurrencia, args, flujos)
+        informar(concurrencia, registro, duracion)
+        if simulador:
+            print(f"servidor: {simulador.estadisticas()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Servidor HTTP que imita la API REST de Gemini para pruebas de carga.
+
+Uso:
+    python -m benchmarks.servidor_gemini_simulado --puerto 8765 \\
+        [--latencia-ms 800] [--jitter-ms 300] [--tasa-429 0.05] [--rpm 600] [--concurrencia 16] \\
+        [--factor-rapido 0.35]
+
+Con la app apuntando a él:
+    TUTOR_BACKEND=simulado TUTOR_SIMULADOR_URL=http://127.0.0.1:8765 streamlit run app.py
+
+Responde `:generateContent` y `:streamGenerateContent?alt=sse` con
+respuestas grabadas de `respuestas_simuladas.jsonl` (incluidas las mal
+formadas: cercas, prosa, barras sin escapar, JSON truncado), elegidas
+según el tipo de prompt (tutor, análisis o quiz; a los lotes del tutor
+responde un array con un elemento por ejercicio). Simula latencia fija
+más un coste por token de salida, 429
+aleatorios, un tope de peticiones por minuto (429 con Retry-After) y un
+tope de peticiones simultáneas (las demás hacen cola).
+
+El nombre del modelo sale de la ruta de la petición: los que contienen
+"rapido" (el modelo rápido del enrutador) tardan --factor-rapido veces lo
+normal y eligen entre todas las respuestas grabadas; los demás solo entre
+las que la app sabe reparar, como un modelo más caro que se equivoca menos.
+`GET /estadisticas` devuelve los contadores.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.tutor_ia import limpiar_json
+
+RUTA_CORPUS = os.path.join(os.path.dirname(__file__), "respuestas_simuladas.jsonl")
+FRAGMENTOS_STREAM = 6
+_RE_LOTE = re.compile(r"exactamente (\d+) objetos")
+_RE_MODELO = re.compile(r"/models/([^:/]+):")
+
+
+def cargar_corpus(ruta=RUTA_CORPUS):
+    """ {tipo: [texto, ...]} """
+    corpus = {}
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                caso = json.loads(linea)
+                corpus.setdefault(caso["tipo"], []).append(caso["texto"])
+    return corpus
+
+
+def clasificar_prompt(texto):
+    if "tema_detectado" in texto:
+        return "analisis"
+    if "indice_correcta" in texto or "estrategias" in texto:
+        return "tutor"
+    return "quiz"
+
+
+class Simulador:
+    """ Estado compartido por los hilos del servidor: corpus, límites y contadores. """
+
+    def __init__(self, corpus, latencia_ms=800, jitter_ms=300, tasa_429=0.0, rpm=0, concurrencia=0, semilla=None,
+                 ms_por_token=0.0, factor_rapido=0.35):
+        self.corpus = corpus
+        self.reparables = {tipo: [t for t in textos if limpiar_json(t) is not None] or textos
+                           for tipo, textos in corpus.items()}
+        self.factor_rapido = factor_rapido
+        self.latencia = latencia_ms / 1000
+        self.por_token = ms_por_token / 1000
+        self.jitter = jitter_ms / 1000
+        self.tasa_429 = tasa_429
+        self.rpm = rpm
+        self.azar = random.Random(semilla)
+        self.semaforo = threading.BoundedSemaphore(concurrencia) if concurrencia else None
+        self.lock = threading.Lock()
+        self.tokens = float(rpm / 60) if rpm else 0.0
+        self.ultimo = time.monotonic()
+        self.stats = {"peticiones": 0, "respuestas": 0, "errores_429_inyectados": 0, "errores_429_tope": 0,
+                      "stream": 0, "en_curso": 0, "max_en_curso": 0, "por_modelo": {}}
+
+    def _contar(self, campo, n=1):
+        with self.lock:
+            self.stats[campo] += n
+
+    def admitir(self):
+        """ None si pasa; si no, los segundos de Retry-After del 429. """
+        with self.lock:
+            self.stats["peticiones"] += 1
+            if self.azar.random() < self.tasa_429:
+                self.stats["errores_429_inyectados"] += 1
+                return 1.0
+            if not self.rpm:
+                return None
+            tasa = self.rpm / 60
+            ahora = time.monotonic()
+            # Ráfaga máxima: un segundo de cuota.
+            self.tokens = min(max(1.0, tasa), self.tokens + (ahora - self.ultimo) * tasa)
+            self.ultimo = ahora
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            self.stats["errores_429_tope"] += 1
+            return round((1 - self.tokens) / tasa, 2)
+
+    def elegir(self, texto_prompt, modelo=""):
+        tipo = clasificar_prompt(texto_prompt)
+        lote = _RE_LOTE.search(texto_prompt) if tipo == "tutor" else None
+        rapido = "rapido" in modelo
+        with self.lock:
+            self.stats["por_modelo"][modelo] = self.stats["por_modelo"].get(modelo, 0) + 1
+            origen = self.corpus if rapido else self.reparables
+            opciones = origen.get(tipo) or origen.get("tutor") or ["{}"]
+            if lote:
+                texto = self._array_tutor(opciones, int(lote.group(1)))
+            else:
+                texto = self.azar.choice(opciones)
+            espera = max(0.0, self.azar.gauss(self.latencia, self.jitter)) + len(texto) / 4 * self.por_token
+            return texto, espera * self.factor_rapido if rapido else espera
+
+    def _array_tutor(self, opciones, n):
+        """
+        Un elemento por ejercicio, sacado de las respuestas grabadas: las que
+        la app sabe reparar entran reparadas; las irrecuperables (truncadas,
+        sin JSON) entran como un elemento sin campos, que la validación rechaza.
+        """
+        elementos = []
+        for i in range(n):
+            elemento = limpiar_json(self.azar.choice(opciones))
+            elementos.append(dict(elemento, id=i) if isinstance(elemento, dict) else {"id": i})
+        return json.dumps(elementos, ensure_ascii=False)
+
+    def estadisticas(self):
+        with self.lock:
+            return dict(self.stats, por_modelo=dict(self.stats["por_modelo"]))
+
+
+def _cuerpo(texto, texto_prompt):
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": texto}]}, "finishReason": "STOP"}],
+        "usageMetadata": {"promptTokenCount": len(texto_prompt) // 4, "candidatesTokenCount": len(texto) // 4},
+    }
+
+
+def crear_manejador(simulador):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, codigo, datos, cabeceras=()):
+            cuerpo = json.dumps(datos).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            for clave, valor in cabeceras:
+                self.send_header(clave, valor)
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/estadisticas":
+                self._json(200, simulador.estadisticas())
+            else:
+                self._json(404, {"error": {"code": 404, "message": "No encontrado"}})
+
+        def do_POST(self):
+            peticion = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            texto_prompt = " ".join(
+                p.get("text", "") for c in peticion.get("contents", []) for p in c.get("parts", [])
+            )
+            espera = simulador.admitir()
+            if espera is not None:
+                self._json(429, {"error": {
+                    "code": 429, "status": "RESOURCE_EXHAUSTED",
+                    "message": f"Resource has been exhausted (e.g. check quota). retry in {espera}s",
+                }}, cabeceras=[("Retry-After", str(espera))])
+                return
+            if simulador.semaforo:
+                simulador.semaforo.acquire()
+            with simulador.lock:
+                simulador.stats["en_curso"] += 1
+                simulador.stats["max_en_curso"] = max(simulador.stats["max_en_curso"], simulador.stats["en_curso"])
+            try:
+                modelo = _RE_MODELO.search(self.path)
+                texto, latencia = simulador.elegir(texto_prompt, modelo.group(1) if modelo else "")
+                if ":streamGenerateContent" in self.path:
+                    self._stream(texto, texto_prompt, latencia)
+                else:
+                    time.sleep(latencia)
+                    self._json(200, _cuerpo(texto, texto_prompt))
+                simulador._contar("respuestas")
+            finally:
+                simulador._contar("en_curso", -1)
+                if simulador.semaforo:
+                    simulador.semaforo.release()
+
+        def _stream(self, texto, texto_prompt, latencia):
+            simulador._contar("stream")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            tamano = max(1, len(texto) // FRAGMENTOS_STREAM + 1)
+            for inicio in range(0, len(texto), tamano):
+                time.sleep(latencia / FRAGMENTOS_STREAM)
+                evento = json.dumps(_cuerpo(texto[inicio:inicio + tamano], texto_prompt))
+                self.wfile.write(f"data: {evento}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            self.close_connection = True
+
+    return Manejador
+
+
+def crear_servidor(puerto, simulador, host="127.0.0.1"):
+    servidor = ThreadingHTTPServer((host, puerto), crear_manejador(simulador))
+    servidor.daemon_threads = True
+    return servidor
+
+
+def iniciar_en_hilo(puerto, **opciones):
+    """ Arranca el servidor en un hilo daemon (para el driver de carga); devuelve (servidor, simulador). """
+    corpus = cargar_corpus(opciones.pop("corpus", RUTA_CORPUS))
+    simulador = Simulador(corpus, **opciones)
+    servidor = crear_servidor(puerto, simulador)
+    threading.Thread(target=servidor.serve_forever, name="gemini_simulado", daemon=True).start()
+    return servidor, simulador
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--corpus", default=RUTA_CORPUS)
+    parser.add_argument("--latencia-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=300)
+    parser.add_argument("--ms-por-token", type=float, default=0, help="latencia extra por token de salida")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="probabilidad de 429 aleatorio por petición")
+    parser.add_argument("--rpm", type=float, default=0, help="tope de peticiones por minuto (0 = sin tope)")
+    parser.add_argument("--concurrencia", type=int, default=0, help="peticiones simultáneas (0 = sin tope)")
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--factor-rapido", type=float, default=0.35, help="latencia del modelo rápido / la del normal")
+    args = parser.parse_args()
+
+    simulador = Simulador(
+        cargar_corpus(args.corpus), latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms,
+        tasa_429=args.tasa_429, rpm=args.rpm, concurrencia=args.concurrencia, semilla=args.semilla,
+        ms_por_token=args.ms_por_token, factor_rapido=args.factor_rapido,
+    )
+    servidor = crear_servidor(args.puerto, simulador, args.host)
+    print(f"Gemini simulado en http://{args.host}:{args.puerto} ({sum(map(len, simulador.corpus.values()))} respuestas grabadas)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(simulador.estadisticas(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Almacén compartido (por proceso) de preguntas y tutorías.
+
+Las sesiones guardan solo IDs cortos en `st.session_state`; el contenido
+(enunciados, opciones, explicaciones en LaTeX, JSON del tutor) vive una
+sola vez aquí aunque lo usen cientos de sesiones. El ID es un hash del
+contenido, así que la misma pregunta servida a varias sesiones (pool,
+banco, plantillas, caché del tutor) se guarda una vez.
+
+Los objetos guardados se comparten entre sesiones: no se deben mutar.
+Si se supera MAX_OBJETOS se expulsan los menos usados recientemente;
+`obtener` devuelve None para un ID expulsado, salvo que se le pase el
+`respaldo` de la sesión (referencias a los mismos objetos, no copias):
+entonces el objeto se vuelve a guardar con el mismo ID. El quiz lo usa
+para que la presión de memoria del servidor nunca anule una respuesta.
+`obtener_como` da el mismo
+objeto como clase de `esquemas` (validado y con las opciones ya partidas),
+construida una sola vez por objeto.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+MAX_OBJETOS = int(os.environ.get("TUTOR_ALMACEN_MAX", 20000))
+
+_lock = threading.Lock()
+_objetos = OrderedDict()
+_cargas = {}
+_stats = {"guardados": 0, "reutilizados": 0, "expulsados": 0, "perdidos": 0, "restaurados": 0}
+
+
+def _id(objeto):
+    material = json.dumps(objeto, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()[:12]
+
+
+def guardar(objeto):
+    """ Guarda una pregunta/tutoría (dict) y devuelve su ID. """
+    oid = _id(objeto)
+    with _lock:
+        if oid in _objetos:
+            _objetos.move_to_end(oid)
+            _stats["reutilizados"] += 1
+            return oid
+        # Claves internadas: todas las copias comparten 'pregunta', 'opciones', etc.
+        _objetos[oid] = {sys.intern(k) if isinstance(k, str) else k: v for k, v in objeto.items()}
+        _stats["guardados"] += 1
+        while len(_objetos) > MAX_OBJETOS:
+            expulsado, _ = _objetos.popitem(last=False)
+            _cargas.pop(expulsado, None)
+            _stats["expulsados"] += 1
+    return oid
+
+
+def guardar_lista(objetos):
+    return [guardar(o) for o in objetos]
+
+
+def obtener(oid, respaldo=None):
+    """
+    El objeto guardado con ese ID, o None si no existe (o fue expulsado y
+    no está en `respaldo`, un dict {id: objeto} de `respaldar`).
+    """
+    if oid is None:
+        return None
+    with _lock:
+        objeto = _objetos.get(oid)
+        if objeto is not None:
+            _objetos.move_to_end(oid)
+            return objeto
+        _stats["perdidos"] += 1
+    objeto = respaldo.get(oid) if respaldo else None
+    if objeto is not None:
+        guardar(objeto)
+        with _lock:
+            _stats["restaurados"] += 1
+    return objeto
+
+
+def respaldar(oids):
+    """ {id: objeto} para la sesión: referencias a los objetos guardados, que no cuestan una copia. """
+    return {oid: objeto for oid, objeto in zip(oids, map(obtener, oids)) if objeto is not None}
+
+
+def obtener_lista(oids):
+    """ Los objetos de una lista de IDs, omitiendo los que ya no están. """
+    return [o for o in map(obtener, oids) if o is not None]
+
+
+def obtener_como(oid, clase, respaldo=None):
+    """
+    El objeto como `clase` (`esquemas.Tutoria`, `Analisis` o
+    `PreguntaQuiz`), o None si no está o no cumple el esquema.
+    """
+    objeto = obtener(oid, respaldo)
+    if objeto is None:
+        return None
+    with _lock:
+        carga = _cargas.get(oid)
+    if type(carga) is clase:
+        return carga
+    carga = clase.desde_dict(objeto)
+    if carga is not None:
+        with _lock:
+            if oid in _objetos:
+                _cargas[oid] = carga
+    return carga
+
+
+def estadisticas():
+    with _lock:
+        return dict(_stats, objetos=len(_objetos))
@@ -0,0 +1,167 @@
+"""
+Backend del modelo intercambiable.
+
+- TUTOR_BACKEND=gemini (por defecto): el modelo real vía `ia_core`.
+- TUTOR_BACKEND=simulado: `ModeloHTTP` contra el servidor simulado
+  (`benchmarks/servidor_gemini_simulado.py`) en TUTOR_SIMULADOR_URL.
+
+`ModeloHTTP` imita lo que la app usa de `genai.GenerativeModel`:
+`generate_content(partes, stream=False)` devuelve un objeto con `.text`
+y `.usage_metadata`; con stream=True, un iterable de fragmentos. Un 429
+se lanza como excepción con el texto y `retry_after`, igual que la
+librería, para que `cliente_gemini` aplique su backoff sin cambios.
+
+`obtener_modelo_nombrado` da otros modelos del mismo backend (el rápido
+del enrutador: TUTOR_SIMULADOR_MODELO_RAPIDO en el simulado,
+gemini-1.5-flash-8b con Gemini).
+"""
+import base64
+import io
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+BACKEND = os.environ.get("TUTOR_BACKEND", "gemini").lower()
+URL_SIMULADOR = os.environ.get("TUTOR_SIMULADOR_URL", "http://127.0.0.1:8765")
+MODELO_SIMULADO = os.environ.get("TUTOR_SIMULADOR_MODELO", "gemini-simulado")
+MODELO_SIMULADO_RAPIDO = os.environ.get("TUTOR_SIMULADOR_MODELO_RAPIDO", "gemini-simulado-rapido")
+MODELO_GEMINI_RAPIDO = "gemini-1.5-flash-8b"
+TIMEOUT_HTTP = 90
+
+_lock = threading.Lock()
+_modelo = None
+_nombrados = {}
+
+
+class ErrorHTTPModelo(Exception):
+    """ Error HTTP del backend; `retry_after` viene de la cabecera Retry-After. """
+
+    def __init__(self, codigo, mensaje, retry_after=None):
+        super().__init__(f"{codigo} {mensaje}")
+        self.codigo = codigo
+        self.retry_after = retry_after
+
+
+class _Uso:
+    __slots__ = ("prompt_token_count", "candidates_token_count")
+
+    def __init__(self, datos):
+        self.prompt_token_count = datos.get("promptTokenCount", 0)
+        self.candidates_token_count = datos.get("candidatesTokenCount", 0)
+
+
+class RespuestaModelo:
+    __slots__ = ("text", "usage_metadata")
+
+    def __init__(self, datos):
+        partes = datos.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+        self.text = "".join(p.get("text", "") for p in partes)
+        self.usage_metadata = _Uso(datos.get("usageMetadata", {}))
+
+
+def _parte(parte):
+    """ Parte del prompt en el formato REST de Gemini (texto o inline_data en base64). """
+    if isinstance(parte, str):
+        return {"text": parte}
+    if isinstance(parte, dict) and "data" in parte:
+        return {"inline_data": {"mime_type": parte.get("mime_type", "image/jpeg"),
+                                "data": base64.b64encode(bytes(parte["data"])).decode("ascii")}}
+    if hasattr(parte, "save"):
+        # Imagen PIL
+        buffer = io.BytesIO()
+        parte.save(buffer, format="PNG")
+        return {"inline_data": {"mime_type": "image/png", "data": base64.b64encode(buffer.getvalue()).decode("ascii")}}
+    return {"text": str(parte)}
+
+
+class ModeloHTTP:
+    def __init__(self, url=URL_SIMULADOR, model_name=MODELO_SIMULADO):
+        self.url = url.rstrip("/")
+        self.model_name = model_name
+
+    def _abrir(self, metodo, prompt_parts):
+        partes = prompt_parts if isinstance(prompt_parts, (list, tuple)) else [prompt_parts]
+        cuerpo = json.dumps({"contents": [{"role": "user", "parts": [_parte(p) for p in partes]}]}).encode("utf-8")
+        peticion = urllib.request.Request(
+            f"{self.url}/v1beta/models/{self.model_name}:{metodo}",
+            data=cuerpo,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            return urllib.request.urlopen(peticion, timeout=TIMEOUT_HTTP)
+        except urllib.error.HTTPError as e:
+            detalle = e.read().decode("utf-8", "replace")
+            retry_after = e.headers.get("Retry-After")
+            raise ErrorHTTPModelo(e.code, detalle, float(retry_after) if retry_after else None) from None
+
+    def generate_content(self, prompt_parts, stream=False, **kwargs):
+        if not stream:
+            with self._abrir("generateContent", prompt_parts) as respuesta:
+                return RespuestaModelo(json.loads(respuesta.read()))
+        # La petición se hace ya (un 429 salta aquí, dentro del bucle de reintentos);
+        # los fragmentos se leen al iterar.
+        return self._fragmentos(self._abrir("streamGenerateContent?alt=sse", prompt_parts))
+
+    @staticmethod
+    def _fragmentos(respuesta):
+        with respuesta:
+            for linea in respuesta:
+                linea = linea.decode("utf-8").strip()
+                if linea.startswith("data:"):
+                    yield RespuestaModelo(json.loads(linea[5:]))
+
+
+def configurar():
+    """ Prepara el backend; False si no se puede usar (p. ej. falta la clave de Gemini). """
+    if BACKEND == "simulado":
+        return True
+    from modules import ia_core
+
+    return ia_core.configurar_gemini()
+
+
+def iniciar_modelo():
+    """ (modelo, nombre_modelo) del backend configurado. """
+    if BACKEND == "simulado":
+        modelo = ModeloHTTP()
+        return modelo, modelo.model_name
+    from modules import ia_core
+
+    return ia_core.iniciar_modelo()
+
+
+def obtener_modelo():
+    """
+    (modelo, nombre_modelo) compartido por todo el proceso: se configura y
+    construye una vez, no en cada rerun. None si el backend no se pudo
+    configurar (no se recuerda el fallo: el siguiente rerun lo reintenta).
+    """
+    global _modelo
+    with _lock:
+        if _modelo is None and configurar():
+            _modelo = iniciar_modelo()
+        return _modelo
+
+
+def nombre_modelo_rapido():
+    """ Modelo rápido por defecto del backend (el enrutador lo prueba antes que el principal). """
+    return MODELO_SIMULADO_RAPIDO if BACKEND == "simulado" else MODELO_GEMINI_RAPIDO
+
+
+def obtener_modelo_nombrado(nombre):
+    """
+    Otro modelo del mismo backend, por nombre, también compartido por el
+    proceso. Requiere el backend ya configurado (`obtener_modelo`).
+    """
+    with _lock:
+        if nombre not in _nombrados:
+            if BACKEND == "simulado":
+                _nombrados[nombre] = ModeloHTTP(model_name=nombre)
+            else:
+                import google.generativeai as genai
+
+                _nombrados[nombre] = genai.GenerativeModel(nombre)
+        return _nombrados[nombre]
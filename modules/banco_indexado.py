@@ -0,0 +1,248 @@
+"""
+Banco de preguntas compilado a un formato indexado y mapeado en memoria.
+
+`python -m scripts.compilar_banco` escribe en RUTA_BANCO una carpeta por
+versión con columnas NumPy (las preguntas ordenadas por tema):
+
+- `textos.bin` + `desplazamientos.npy`: el JSON de cada pregunta, contiguo.
+- `inicio_tema.npy`: la pregunta i es del tema t si inicio[t] <= i < inicio[t+1].
+- `dificultad.npy` (uint8) y `etiquetas.npy` (máscara de bits uint32).
+
+y `banco.json` (el manifiesto) apunta a la versión vigente (NumPy se
+importa al abrir el banco, no al arrancar). Los arrays se
+abren con mmap: arrancar no lee el banco y las páginas se comparten
+entre procesos. Muestrear es O(1) por pregunta: tabla de alias (Vose)
+sobre los temas elegidos y un índice uniforme dentro del rango del tema.
+
+Si el manifiesto cambia en disco (se recompiló) se recarga sin reiniciar.
+Sin banco compilado se delega en `banco_preguntas.obtener_preguntas_fijas`.
+"""
+import json
+import os
+import random
+import shutil
+import threading
+import time
+
+FORMATO_BANCO = 1
+RUTA_BANCO = os.environ.get("TUTOR_BANCO_RUTA", os.path.join("data", "banco_indexado"))
+RECARGA_SEGUNDOS = float(os.environ.get("TUTOR_BANCO_RECARGA", 5))
+VERSIONES_CONSERVADAS = 2
+MAX_TABLAS_ALIAS = 256
+
+_lock = threading.Lock()
+_estado = {"indice": None, "mtime": None, "revisado": 0.0}
+_tablas_alias = {}
+_stats = {"muestreos": 0, "recargas": 0, "respaldo": 0}
+
+
+class _Indice:
+    """ Una versión del banco abierta con mmap (solo lectura). """
+
+    def __init__(self, carpeta, manifiesto):
+        import numpy as np
+
+        self.version = manifiesto["version"]
+        self.temas = manifiesto["temas"]
+        self.etiquetas = manifiesto["etiquetas"]
+        self.posicion_tema = {t: i for i, t in enumerate(self.temas)}
+        abrir = lambda nombre: np.load(os.path.join(carpeta, nombre), mmap_mode="r")
+        self.desplazamientos = abrir("desplazamientos.npy")
+        self.inicio_tema = abrir("inicio_tema.npy").tolist()  # T+1 enteros: mejor como lista
+        self.dificultad = abrir("dificultad.npy")
+        self.mascara_etiquetas = abrir("etiquetas.npy")
+        ruta_textos = os.path.join(carpeta, "textos.bin")
+        # np.memmap no admite ficheros vacíos
+        self.textos = np.memmap(ruta_textos, dtype=np.uint8, mode="r") if os.path.getsize(ruta_textos) else b""
+
+    def __len__(self):
+        return len(self.desplazamientos) - 1
+
+    def cantidad(self, tema):
+        t = self.posicion_tema.get(tema)
+        return 0 if t is None else self.inicio_tema[t + 1] - self.inicio_tema[t]
+
+    def pregunta(self, i):
+        pregunta = json.loads(bytes(self.textos[self.desplazamientos[i]:self.desplazamientos[i + 1]]))
+        pregunta["dificultad"] = int(self.dificultad[i])
+        mascara = int(self.mascara_etiquetas[i])
+        pregunta["etiquetas"] = [e for b, e in enumerate(self.etiquetas) if mascara >> b & 1]
+        return pregunta
+
+
+# --- Compilación ---
+
+def compilar(preguntas, ruta=None):
+    """
+    Escribe una versión nueva del banco con `preguntas` (dicts con 'tema',
+    'pregunta', 'opciones', ... y opcionalmente 'dificultad' y
+    'etiquetas') y la publica reemplazando el manifiesto de forma atómica.
+    """
+    import numpy as np
+
+    ruta = ruta or RUTA_BANCO
+    preguntas = sorted(preguntas, key=lambda p: p.get("tema", ""))
+    temas = sorted({p.get("tema", "") for p in preguntas})
+    etiquetas = sorted({e for p in preguntas for e in p.get("etiquetas", ())})[:32]
+    bit = {e: b for b, e in enumerate(etiquetas)}
+
+    version = time.strftime("%Y%m%d%H%M%S") + f"_{time.time_ns() % 10**6:06d}"
+    carpeta = os.path.join(ruta, f"v{version}")
+    os.makedirs(carpeta, exist_ok=True)
+
+    desplazamientos = np.zeros(len(preguntas) + 1, dtype=np.int64)
+    with open(os.path.join(carpeta, "textos.bin"), "wb") as f:
+        for i, p in enumerate(preguntas):
+            base = {k: v for k, v in p.items() if k not in ("dificultad", "etiquetas")}
+            datos = json.dumps(base, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(datos)
+            desplazamientos[i + 1] = desplazamientos[i] + len(datos)
+    codigos = np.searchsorted(temas, [p.get("tema", "") for p in preguntas]) if preguntas else np.zeros(0, int)
+    inicio_tema = np.searchsorted(codigos, np.arange(len(temas) + 1)).astype(np.int64)
+    dificultad = np.array([int(p.get("dificultad", 0) or 0) for p in preguntas], dtype=np.uint8)
+    mascara = np.array(
+        [sum(1 << bit[e] for e in set(p.get("etiquetas", ())) if e in bit) for p in preguntas], dtype=np.uint32
+    )
+    np.save(os.path.join(carpeta, "desplazamientos.npy"), desplazamientos)
+    np.save(os.path.join(carpeta, "inicio_tema.npy"), inicio_tema)
+    np.save(os.path.join(carpeta, "dificultad.npy"), dificultad)
+    np.save(os.path.join(carpeta, "etiquetas.npy"), mascara)
+
+    manifiesto = {"formato": FORMATO_BANCO, "version": version, "carpeta": os.path.basename(carpeta),
+                  "temas": temas, "etiquetas": etiquetas, "preguntas": len(preguntas)}
+    temporal = os.path.join(ruta, "banco.json.tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+    os.replace(temporal, os.path.join(ruta, "banco.json"))
+    _purgar_versiones(ruta, manifiesto["carpeta"])
+    return manifiesto
+
+
+def _purgar_versiones(ruta, vigente):
+    # Los procesos que aún mapean una versión borrada siguen leyéndola (el inodo vive hasta el munmap).
+    antiguas = sorted(d for d in os.listdir(ruta) if d.startswith("v") and d != vigente)
+    for carpeta in antiguas[:max(0, len(antiguas) - (VERSIONES_CONSERVADAS - 1))]:
+        shutil.rmtree(os.path.join(ruta, carpeta), ignore_errors=True)
+
+
+# --- Carga y recarga en caliente ---
+
+def _abrir():
+    ruta = RUTA_BANCO
+    with open(os.path.join(ruta, "banco.json"), encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    if manifiesto.get("formato") != FORMATO_BANCO:
+        raise ValueError(f"formato de banco desconocido en {ruta}")
+    return _Indice(os.path.join(ruta, manifiesto["carpeta"]), manifiesto)
+
+
+def indice_vigente():
+    """ El índice cargado (recargándolo si el manifiesto cambió), o None si no hay banco compilado. """
+    ahora = time.monotonic()
+    with _lock:
+        if _estado["indice"] is not None and ahora - _estado["revisado"] < RECARGA_SEGUNDOS:
+            return _estado["indice"]
+        _estado["revisado"] = ahora
+        try:
+            mtime = os.stat(os.path.join(RUTA_BANCO, "banco.json")).st_mtime_ns
+        except OSError:
+            return _estado["indice"]
+        if mtime != _estado["mtime"]:
+            try:
+                _estado["indice"] = _abrir()
+                _stats["recargas"] += 1
+            except (OSError, ValueError, KeyError) as e:
+                # Se sigue sirviendo la versión anterior
+                print(f"Aviso: banco indexado no disponible {e}")
+            _estado["mtime"] = mtime
+            _tablas_alias.clear()
+        return _estado["indice"]
+
+
+def recargar():
+    """ Fuerza la revisión del manifiesto en la próxima consulta. """
+    with _lock:
+        _estado["revisado"] = 0.0
+        _estado["mtime"] = None
+
+
+# --- Muestreo ---
+
+def tabla_alias(pesos):
+    """ Método de alias de Vose: (probabilidad, alias) para muestrear en O(1). """
+    import numpy as np
+
+    pesos = np.clip(np.asarray(pesos, dtype=float), 0, None)
+    k = len(pesos)
+    if pesos.sum() <= 0:
+        pesos = np.ones(k)
+    escalados = pesos * k / pesos.sum()
+    prob = np.ones(k)
+    alias = np.arange(k)
+    pequenos = [i for i in range(k) if escalados[i] < 1]
+    grandes = [i for i in range(k) if escalados[i] >= 1]
+    while pequenos and grandes:
+        p, g = pequenos.pop(), grandes.pop()
+        prob[p], alias[p] = escalados[p], g
+        escalados[g] -= 1 - escalados[p]
+        (pequenos if escalados[g] < 1 else grandes).append(g)
+    return prob.tolist(), alias.tolist()
+
+
+def _alias_temas(indice, temas, pesos):
+    clave = (indice.version, temas, tuple(sorted(pesos.items())) if pesos else None)
+    with _lock:
+        tabla = _tablas_alias.get(clave)
+    if tabla is None:
+        codigos = [indice.posicion_tema[t] for t in temas]
+        # Por defecto, el mismo peso para cada tema elegido
+        w = [pesos.get(t, 1.0) if pesos else 1.0 for t in temas]
+        tabla = (codigos, *tabla_alias(w))
+        with _lock:
+            if len(_tablas_alias) >= MAX_TABLAS_ALIAS:
+                _tablas_alias.clear()
+            _tablas_alias[clave] = tabla
+    return tabla
+
+
+def muestrear(indice, temas, n, pesos=None, azar=random):
+    """ Hasta n posiciones distintas del índice, repartidas entre `temas` según `pesos`. """
+    temas = tuple(t for t in dict.fromkeys(temas) if indice.cantidad(t) > 0)
+    if not temas or n <= 0:
+        return []
+    codigos, prob, alias = _alias_temas(indice, temas, pesos)
+    disponibles = sum(indice.cantidad(t) for t in temas)
+    elegidas = []
+    vistas = set()
+    intentos = 0
+    while len(elegidas) < min(n, disponibles) and intentos < 20 * n:
+        intentos += 1
+        j = azar.randrange(len(codigos))
+        t = codigos[j] if azar.random() < prob[j] else codigos[alias[j]]
+        inicio, fin = indice.inicio_tema[t], indice.inicio_tema[t + 1]
+        i = inicio + azar.randrange(fin - inicio)
+        if i not in vistas:
+            vistas.add(i)
+            elegidas.append(i)
+    return elegidas
+
+
+def obtener_preguntas_fijas(temas, n, pesos=None):
+    """ Igual que `banco_preguntas.obtener_preguntas_fijas`, sin recorrer el banco. """
+    indice = indice_vigente()
+    if indice is None:
+        _stats["respaldo"] += 1
+        try:
+            from modules import banco_preguntas
+
+            return banco_preguntas.obtener_preguntas_fijas(temas, n) or []
+        except Exception as e:
+            print(f"Aviso: Banco no disponible {e}")
+            return []
+    _stats["muestreos"] += 1
+    return [indice.pregunta(i) for i in muestrear(indice, temas, n, pesos)]
+
+
+def estadisticas():
+    indice = _estado["indice"]
+    return dict(_stats, version=indice.version if indice else None, preguntas=len(indice) if indice else 0)
@@ -0,0 +1,259 @@
+"""
+Caché de consultas con foto.
+
+Un análisis guardado solo se reutiliza si el contenido coincide:
+- la misma foto (hash exacto de los bytes ya preprocesados, que son
+  deterministas para la misma subida), o
+- una foto parecida (dHash de 256 bits a poca distancia de Hamming) cuyo
+  enunciado, transcrito por el modelo rápido, es el mismo que el del
+  análisis guardado. Dos ejercicios que solo cambian un exponente dan el
+  mismo dHash; el hash perceptual solo preselecciona candidatos.
+
+Los candidatos se buscan en SQL por bandas del dHash (32 bandas de 8
+bits): a distancia <= 31 comparten al menos una banda, así que con
+UMBRAL_HAMMING <= 31 la búsqueda no pierde ninguna foto dentro del umbral.
+La clave incluye además un hash del texto normalizado del alumno.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from modules import cache_tutor, telemetria, tutor_ia
+
+UMBRAL_HAMMING = int(os.environ.get("TUTOR_FOTO_HAMMING", 20))
+TTL_SEGUNDOS = cache_tutor.TTL_SEGUNDOS
+MAX_ENTRADAS = int(os.environ.get("TUTOR_FOTO_CACHE_MAX", 5000))
+LADO_HASH = 16
+BITS_BANDA = 8
+MAX_CANDIDATOS = 20
+# Transcripciones hechas al buscar, para guardarlas con el análisis de esa foto
+MAX_TRANSCRIPCIONES = 64
+
+_lock = threading.Lock()
+_conexion = None
+_transcripciones = OrderedDict()
+_contadores = {"hits": 0, "hits_exactos": 0, "misses": 0, "escrituras": 0, "transcripciones": 0, "descartes": 0}
+
+_RE_RELLENO = re.compile(r"\$|\\left|\\right|\\displaystyle|\\[,;:! ]|\s+")
+_RE_LLAVE_SIMPLE = re.compile(r"\{(\w)\}")
+
+
+def hash_perceptual(blob):
+    """ dHash de 256 bits (32 bytes): cada píxel frente a su vecino en una miniatura 17x16. """
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(blob["data"])).convert("L").resize((LADO_HASH + 1, LADO_HASH), Image.LANCZOS)
+    pixeles = list(img.getdata())
+    ancho = LADO_HASH + 1
+    valor = 0
+    for fila in range(LADO_HASH):
+        base = fila * ancho
+        for col in range(LADO_HASH):
+            valor = (valor << 1) | (pixeles[base + col] > pixeles[base + col + 1])
+    return valor.to_bytes(LADO_HASH * LADO_HASH // 8, "big")
+
+
+def hash_imagen(blob):
+    return hashlib.sha256(blob["data"]).hexdigest()
+
+
+def hash_texto(texto_usuario):
+    return hashlib.sha256(cache_tutor.normalizar_texto(texto_usuario).lower().encode("utf-8")).hexdigest()[:16]
+
+
+def distancia(a, b):
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).bit_count()
+
+
+def bandas(phash):
+    """ Claves de banda (número de banda y valor en un entero) para el índice de candidatos. """
+    paso = BITS_BANDA // 8
+    return [(i << BITS_BANDA) | int.from_bytes(phash[i * paso:(i + 1) * paso], "big")
+            for i in range(len(phash) // paso)]
+
+
+def normalizar_enunciado(latex):
+    """ LaTeX sin espacios, $, \\left/\\right ni llaves de un solo símbolo: "x^{2} \\, dx" == "x^2dx". """
+    texto = _RE_RELLENO.sub("", str(latex or ""))
+    return _RE_LLAVE_SIMPLE.sub(r"\1", texto)
+
+
+def _obtener_conexion():
+    global _conexion
+    if _conexion is None:
+        carpeta = os.path.dirname(cache_tutor.RUTA_CACHE)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        _conexion = sqlite3.connect(cache_tutor.RUTA_CACHE, check_same_thread=False, timeout=10)
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        # La tabla anterior (dHash de 64 bits, sin comprobación de contenido) no se reutiliza
+        _conexion.execute("DROP TABLE IF EXISTS consultas_foto")
+        _conexion.execute("""
+            CREATE TABLE IF NOT EXISTS fotos_analizadas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash_texto TEXT NOT NULL,
+                hash_imagen TEXT NOT NULL,
+                phash BLOB NOT NULL,
+                transcripcion TEXT,
+                datos TEXT NOT NULL,
+                creado REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_fotos_exacta ON fotos_analizadas(hash_imagen, hash_texto)")
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_fotos_creado ON fotos_analizadas(creado)")
+        # El índice anterior (16 bandas de 16 bits) solo era completo hasta distancia 15
+        _conexion.execute("DROP TABLE IF EXISTS fotos_bandas")
+        _conexion.execute("""
+            CREATE TABLE IF NOT EXISTS fotos_bandas8 (
+                clave INTEGER NOT NULL,
+                id INTEGER NOT NULL
+            )
+        """)
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_fotos_bandas8 ON fotos_bandas8(clave)")
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_fotos_bandas8_id ON fotos_bandas8(id)")
+        if _conexion.execute("SELECT 1 FROM fotos_bandas8 LIMIT 1").fetchone() is None:
+            _conexion.executemany("INSERT INTO fotos_bandas8 (clave, id) VALUES (?, ?)", [
+                (clave, id_fila) for id_fila, phash in _conexion.execute("SELECT id, phash FROM fotos_analizadas")
+                for clave in bandas(phash)
+            ])
+        _conexion.commit()
+    return _conexion
+
+
+def _candidatos(con, phash, texto, umbral):
+    """ [(distancia, id, transcripción, datos)] de fotos parecidas con el mismo texto, las más cercanas primero. """
+    claves = bandas(phash)
+    filas = con.execute(
+        # Cuantas más bandas comparte, más cerca está: se acota antes de medir en Python
+        f"""SELECT f.id, f.phash FROM fotos_bandas8 b JOIN fotos_analizadas f ON f.id = b.id
+            WHERE b.clave IN ({",".join("?" * len(claves))}) AND f.hash_texto = ? AND f.creado > ?
+            GROUP BY f.id ORDER BY COUNT(*) DESC LIMIT ?""",
+        (*claves, texto, time.time() - TTL_SEGUNDOS, MAX_CANDIDATOS * 5),
+    ).fetchall()
+    cercanas = sorted((distancia(f[1], phash), f[0]) for f in filas)
+    cercanas = [c for c in cercanas if c[0] <= umbral][:MAX_CANDIDATOS]
+    # Los análisis solo de los candidatos que quedan
+    contenido = dict((f[0], f[1:]) for f in con.execute(
+        f"SELECT id, transcripcion, datos FROM fotos_analizadas WHERE id IN ({','.join('?' * len(cercanas))})",
+        [id_fila for _, id_fila in cercanas]))
+    return [(d, id_fila) + contenido[id_fila] for d, id_fila in cercanas]
+
+
+def _acierto(con, id_fila, exacto):
+    con.execute("UPDATE fotos_analizadas SET hits = hits + 1 WHERE id = ?", (id_fila,))
+    con.commit()
+    _contadores["hits"] += 1
+    _contadores["hits_exactos"] += exacto
+    telemetria.cache("fotos", True)
+
+
+def _fallo():
+    _contadores["misses"] += 1
+    telemetria.cache("fotos", False)
+
+
+def buscar(blob, texto_usuario, transcribir=None, umbral=None):
+    """
+    Análisis cacheado de la misma foto o de una parecida con el mismo
+    enunciado (y mismo texto del alumno), o None.
+    `transcribir(blob)` devuelve el enunciado en LaTeX o None; sin él solo
+    se reutiliza la foto exacta.
+    """
+    umbral = UMBRAL_HAMMING if umbral is None else umbral
+    try:
+        phash = hash_perceptual(blob)
+    except OSError:
+        return None
+    exacta, texto = hash_imagen(blob), hash_texto(texto_usuario)
+    with _lock:
+        try:
+            con = _obtener_conexion()
+            fila = con.execute(
+                "SELECT id, datos FROM fotos_analizadas WHERE hash_imagen = ? AND hash_texto = ? AND creado > ?"
+                " ORDER BY creado DESC LIMIT 1",
+                (exacta, texto, time.time() - TTL_SEGUNDOS),
+            ).fetchone()
+            if fila is not None:
+                _acierto(con, fila[0], True)
+                return json.loads(fila[1])
+            candidatos = _candidatos(con, phash, texto, umbral) if transcribir else []
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Aviso: caché de fotos no disponible {e}")
+            _contadores["misses"] += 1
+            return None
+        if not candidatos:
+            _fallo()
+            return None
+
+    # La transcripción es una llamada al modelo: fuera del lock
+    transcripcion = transcribir(blob)
+    enunciado = normalizar_enunciado(transcripcion)
+    with _lock:
+        _contadores["transcripciones"] += 1
+        if transcripcion:
+            _transcripciones[exacta] = transcripcion
+            while len(_transcripciones) > MAX_TRANSCRIPCIONES:
+                _transcripciones.popitem(last=False)
+        try:
+            for _, id_fila, guardada, datos in candidatos:
+                analisis = json.loads(datos)
+                referencia = guardada if guardada else analisis.get("enunciado_latex")
+                if enunciado and normalizar_enunciado(referencia) == enunciado:
+                    _acierto(_obtener_conexion(), id_fila, False)
+                    return analisis
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Aviso: caché de fotos no disponible {e}")
+        # Foto parecida pero otro ejercicio (p. ej. otro exponente)
+        _contadores["descartes"] += 1
+        _fallo()
+        return None
+
+
+def guardar(blob, texto_usuario, datos):
+    """ Guarda el análisis solo si es válido (nunca cachear respuestas rotas). """
+    if not tutor_ia.validar_analisis(datos):
+        return
+    try:
+        phash = hash_perceptual(blob)
+    except OSError:
+        return
+    exacta = hash_imagen(blob)
+    with _lock:
+        transcripcion = _transcripciones.pop(exacta, None)
+        try:
+            con = _obtener_conexion()
+            cursor = con.execute(
+                "INSERT INTO fotos_analizadas (hash_texto, hash_imagen, phash, transcripcion, datos, creado)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (hash_texto(texto_usuario), exacta, phash, transcripcion,
+                 json.dumps(datos, ensure_ascii=False), time.time()),
+            )
+            con.executemany("INSERT INTO fotos_bandas8 (clave, id) VALUES (?, ?)",
+                            [(clave, cursor.lastrowid) for clave in bandas(phash)])
+            corte = con.execute(
+                "SELECT creado FROM fotos_analizadas ORDER BY creado DESC LIMIT 1 OFFSET ?", (MAX_ENTRADAS,)
+            ).fetchone()
+            if corte is not None:
+                # Solo las bandas de las filas expulsadas (por el índice de id), no un barrido de la tabla
+                con.execute("DELETE FROM fotos_bandas8 WHERE id IN (SELECT id FROM fotos_analizadas WHERE creado <= ?)",
+                            corte)
+                con.execute("DELETE FROM fotos_analizadas WHERE creado <= ?", corte)
+            con.commit()
+            _contadores["escrituras"] += 1
+        except sqlite3.Error as e:
+            print(f"Aviso: no se pudo guardar en caché de fotos {e}")
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_contadores)
+    consultas = datos["hits"] + datos["misses"]
+    datos["tasa_acierto"] = round(datos["hits"] / consultas, 3) if consultas else 0.0
+    return datos
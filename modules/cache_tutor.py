@@ -0,0 +1,171 @@
+"""
+Caché persistente (SQLite) para las tutorías generadas por la IA.
+
+La clave es un hash del enunciado normalizado, el tema, el modelo que
+respondió y la versión del prompt: un ejercicio del banco solo se
+tutoriza una vez por modelo, y al leer se prueban los de la ruta.
+Las entradas caducan por TTL y, si se supera el tamaño máximo, se
+expulsan las menos usadas recientemente (LRU).
+
+Con estado compartido (TUTOR_ESTADO_COMPARTIDO), un fallo local se busca
+también en el de todas las réplicas y lo que se guarda se publica allí.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from modules import estado_compartido, telemetria
+
+RUTA_CACHE = os.environ.get("TUTOR_CACHE_RUTA", os.path.join(".cache", "tutor_cache.sqlite3"))
+TTL_SEGUNDOS = int(os.environ.get("TUTOR_CACHE_TTL", 60 * 60 * 24 * 30))
+MAX_ENTRADAS = int(os.environ.get("TUTOR_CACHE_MAX", 5000))
+
+_lock = threading.Lock()
+_conexion = None
+_contadores = {"hits": 0, "misses": 0, "escrituras": 0, "expulsiones": 0, "hits_compartidos": 0}
+
+
+def normalizar_texto(texto):
+    """ Unifica unicode y espacios para que variaciones triviales compartan clave. """
+    texto = unicodedata.normalize("NFC", str(texto or ""))
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def generar_clave(pregunta_texto, tema, nombre_modelo, version_prompt):
+    """ Hash SHA-256 del contenido que determina la respuesta del tutor. """
+    material = json.dumps(
+        [normalizar_texto(pregunta_texto), normalizar_texto(tema), str(nombre_modelo), str(version_prompt)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _obtener_conexion():
+    global _conexion
+    if _conexion is None:
+        carpeta = os.path.dirname(RUTA_CACHE)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        _conexion = sqlite3.connect(RUTA_CACHE, check_same_thread=False, timeout=10)
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.execute("""
+            CREATE TABLE IF NOT EXISTS tutorias (
+                clave TEXT PRIMARY KEY,
+                datos TEXT NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_tutorias_acceso ON tutorias(ultimo_acceso)")
+        _conexion.commit()
+    return _conexion
+
+
+def obtener(clave):
+    """ Devuelve el JSON cacheado o None (si no existe o caducó). """
+    return obtener_alguna([clave])
+
+
+def obtener_alguna(claves):
+    """
+    El JSON de la primera de `claves` que esté en caché, o None: la misma
+    tutoría con cada modelo de la ruta. Cuenta un solo acierto o fallo.
+    """
+    datos = _obtener_local(claves)
+    if datos is not None or not estado_compartido.activo():
+        return datos
+    # Otra réplica ya la generó: se trae a la caché local para la próxima vez
+    for clave in claves:
+        datos = estado_compartido.obtener(f"tutor:{clave}")
+        if datos is not None:
+            with _lock:
+                _contadores["hits_compartidos"] += 1
+            _guardar_local(clave, datos)
+            return datos
+    return None
+
+
+def _obtener_local(claves):
+    ahora = time.time()
+    with _lock:
+        try:
+            con = _obtener_conexion()
+            filas = {clave: (datos, creado) for clave, datos, creado in con.execute(
+                f"SELECT clave, datos, creado FROM tutorias WHERE clave IN ({','.join('?' * len(claves))})", claves)}
+            caducadas = [clave for clave, (_, creado) in filas.items() if ahora - creado > TTL_SEGUNDOS]
+            if caducadas:
+                con.executemany("DELETE FROM tutorias WHERE clave = ?", [(clave,) for clave in caducadas])
+                con.commit()
+            vigente = next((clave for clave in claves if clave in filas and clave not in caducadas), None)
+            if vigente is None:
+                _contadores["misses"] += 1
+                telemetria.cache("tutor", False)
+                return None
+            con.execute(
+                "UPDATE tutorias SET ultimo_acceso = ?, hits = hits + 1 WHERE clave = ?",
+                (ahora, vigente),
+            )
+            con.commit()
+            _contadores["hits"] += 1
+            telemetria.cache("tutor", True)
+            return json.loads(filas[vigente][0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Aviso: caché de tutor no disponible {e}")
+            _contadores["misses"] += 1
+            return None
+
+
+def guardar(clave, datos):
+    """ Guarda (o reemplaza) una tutoría y aplica la expulsión LRU. """
+    _guardar_local(clave, datos)
+    if estado_compartido.activo():
+        estado_compartido.guardar(f"tutor:{clave}", datos, TTL_SEGUNDOS)
+
+
+def _guardar_local(clave, datos):
+    ahora = time.time()
+    with _lock:
+        try:
+            con = _obtener_conexion()
+            con.execute(
+                "INSERT OR REPLACE INTO tutorias (clave, datos, creado, ultimo_acceso, hits) VALUES (?, ?, ?, ?, 0)",
+                (clave, json.dumps(datos, ensure_ascii=False), ahora, ahora),
+            )
+            _contadores["escrituras"] += 1
+            _expulsar(con, ahora)
+            con.commit()
+        except sqlite3.Error as e:
+            print(f"Aviso: no se pudo guardar en caché {e}")
+
+
+def _expulsar(con, ahora):
+    """ Borra caducados y, si sobra, las entradas con acceso más antiguo. """
+    borradas = con.execute("DELETE FROM tutorias WHERE creado < ?", (ahora - TTL_SEGUNDOS,)).rowcount
+    total = con.execute("SELECT COUNT(*) FROM tutorias").fetchone()[0]
+    exceso = total - MAX_ENTRADAS
+    if exceso > 0:
+        borradas += con.execute(
+            "DELETE FROM tutorias WHERE clave IN (SELECT clave FROM tutorias ORDER BY ultimo_acceso ASC LIMIT ?)",
+            (exceso,),
+        ).rowcount
+    _contadores["expulsiones"] += max(borradas, 0)
+
+
+def estadisticas():
+    """ Contadores de aciertos/fallos del proceso y tamaño actual de la caché. """
+    with _lock:
+        datos = dict(_contadores)
+        try:
+            datos["entradas"] = _obtener_conexion().execute("SELECT COUNT(*) FROM tutorias").fetchone()[0]
+        except sqlite3.Error:
+            datos["entradas"] = None
+    consultas = datos["hits"] + datos["misses"]
+    # Un acierto compartido cuenta antes como fallo local
+    datos["tasa_acierto"] = round((datos["hits"] + datos["hits_compartidos"]) / consultas, 3) if consultas else 0.0
+    return datos
@@ -0,0 +1,368 @@
+"""
+Cliente de Gemini compartido por todo el proceso (todas las sesiones).
+
+- Limitador token-bucket global: las sesiones hacen cola en vez de
+  saturar la cuota a la vez.
+- Backoff exponencial con jitter, respetando el `retry_delay` que envía
+  el servidor en los 429 (pausa a todo el proceso, no solo a una sesión).
+- Semáforo que acota las llamadas simultáneas (por proceso).
+- Con TUTOR_ESTADO_COMPARTIDO, el bucket y la pausa son los del estado
+  compartido: todas las réplicas respetan una sola cuota.
+- Con stream=True el hueco del semáforo se ocupa hasta leer el último
+  fragmento, y un corte a mitad se reintenta desde el principio.
+"""
+import os
+import random
+import re
+import threading
+import time
+
+from modules import estado_compartido, telemetria
+
+RPM = float(os.environ.get("GEMINI_RPM", 15))
+RAFAGA = int(os.environ.get("GEMINI_RAFAGA", 5))
+MAX_CONCURRENCIA = int(os.environ.get("GEMINI_MAX_CONCURRENCIA", 8))
+INTENTOS_MAX = int(os.environ.get("GEMINI_INTENTOS_MAX", 6))
+PLAZO_SEGUNDOS = float(os.environ.get("GEMINI_PLAZO_SEGUNDOS", 120))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+_RE_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+_RE_RETRY_IN = re.compile(r"retry (?:in|after) ([\d.]+)\s*s", re.IGNORECASE)
+
+
+class ErrorIA(Exception):
+    """ La llamada a la IA no se pudo completar tras agotar reintentos o plazo. """
+
+
+class StreamNoSoportado(ErrorIA):
+    """ El modelo no admite stream=True: el llamador puede pedir la respuesta entera. """
+
+
+class RespuestaAcumulada:
+    """ Un stream ya leído entero, con el mismo `.text` que la respuesta de `generar`. """
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class LimitadorTokens:
+    """
+    Token bucket por reservas: cada llamada toma un token (el saldo puede
+    quedar negativo) y recibe cuánto debe esperar. Así el orden es FIFO y
+    la espera ocurre fuera del lock.
+    Con `compartido` (nombre del bucket) y estado compartido configurado,
+    el saldo vive allí; si no responde, se usa el del proceso.
+    """
+
+    def __init__(self, tasa_por_segundo, capacidad, compartido=None):
+        self.tasa = tasa_por_segundo
+        self.capacidad = capacidad
+        self.compartido = compartido if estado_compartido.activo() else None
+        self._tokens = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """ Reserva un token y devuelve los segundos a esperar antes de usarlo. """
+        if self.compartido:
+            espera = estado_compartido.reservar(self.compartido, self.tasa, self.capacidad)
+            if espera is not None:
+                return espera
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.tasa, self._pausa_hasta - ahora)
+
+    def devolver(self):
+        """ Reintegra un token reservado que no se llegó a usar. """
+        if self.compartido:
+            estado_compartido.devolver(self.compartido, self.capacidad)
+            return
+        with self._lock:
+            self._tokens = min(self.capacidad, self._tokens + 1)
+
+    def pausar(self, segundos):
+        """ Indicación del servidor: nadie llama hasta que pase la pausa. """
+        if self.compartido:
+            estado_compartido.pausar(self.compartido, segundos)
+        with self._lock:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+
+
+_limitador = LimitadorTokens(RPM / 60.0, RAFAGA, compartido="gemini")
+_semaforo = threading.BoundedSemaphore(MAX_CONCURRENCIA)
+_lock_stats = threading.Lock()
+_stats = {"llamadas": 0, "exitos": 0, "reintentos": 0, "errores_429": 0, "fallos": 0, "en_vuelo": 0}
+
+
+def _sumar(campo, n=1):
+    with _lock_stats:
+        _stats[campo] += n
+
+
+def estadisticas():
+    with _lock_stats:
+        return dict(_stats)
+
+
+def codigo_estado(error):
+    """ Código HTTP del error (`codigo` del backend simulado, `code` de google.api_core o urllib), o None. """
+    for atributo in ("codigo", "code", "status_code"):
+        codigo = getattr(error, atributo, None)
+        if isinstance(codigo, int):
+            return codigo
+    return None
+
+
+def es_error_cuota(error):
+    codigo = codigo_estado(error)
+    if codigo is not None:
+        return codigo == 429
+    return "ResourceExhausted" in type(error).__name__ or "quota" in str(error).lower()
+
+
+def _es_reintentable(error):
+    codigo = codigo_estado(error)
+    if codigo is not None:
+        # Errores del cliente (prompt inválido, clave mala): reintentar no ayuda.
+        return codigo in (408, 429) or codigo >= 500
+    if es_error_cuota(error):
+        return True
+    # Sin código: argumentos o respuesta inválidos no cambian al reintentar; red y cortes, sí.
+    return not isinstance(error, (ValueError, TypeError))
+
+
+def pista_reintento(error):
+    """ Segundos de espera que sugiere el servidor, si los indica. """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        return float(retry_after)
+    texto = str(error)
+    for patron in (_RE_RETRY_DELAY, _RE_RETRY_IN):
+        encontrado = patron.search(texto)
+        if encontrado:
+            return float(encontrado.group(1))
+    return None
+
+
+def calcular_espera(intento, error):
+    """ Backoff exponencial con jitter completo; la pista del servidor manda si es mayor. """
+    espera = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** intento)))
+    pista = pista_reintento(error)
+    if pista is not None:
+        espera = max(espera, pista + random.uniform(0, 1))
+    return espera
+
+
+def _registrar_fallo(error, intento, limite, al_reintentar):
+    """ Decide si se reintenta; devuelve la espera o None si hay que rendirse. """
+    if es_error_cuota(error):
+        _sumar("errores_429")
+        telemetria.sumar("errores_429")
+    if intento + 1 >= limite or not _es_reintentable(error):
+        return None
+    espera = calcular_espera(intento, error)
+    if es_error_cuota(error):
+        _limitador.pausar(espera)
+    _sumar("reintentos")
+    telemetria.sumar("reintentos")
+    if al_reintentar:
+        al_reintentar(espera, error)
+    return espera
+
+
+def _dormir(segundos, cancelar):
+    """ Espera interrumpible: devuelve True si se pidió cancelar. """
+    if cancelar is None:
+        time.sleep(segundos)
+        return False
+    return cancelar.wait(segundos)
+
+
+def _error_final(ultimo_error, cancelar):
+    if cancelar is not None and cancelar.is_set():
+        return ErrorIA("Solicitud cancelada")
+    return ErrorIA(str(ultimo_error) if ultimo_error else "Plazo agotado esperando cuota de la IA")
+
+
+def nombre_modelo(model):
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+def tamano_prompt(prompt_parts):
+    """ Bytes aproximados del prompt (texto en UTF-8 y datos de imágenes). """
+    partes = prompt_parts if isinstance(prompt_parts, (list, tuple)) else [prompt_parts]
+    total = 0
+    for parte in partes:
+        if isinstance(parte, str):
+            total += len(parte.encode("utf-8"))
+        elif isinstance(parte, dict) and "data" in parte:
+            total += len(parte["data"])
+    return total
+
+
+def _anotar_respuesta(span, respuesta):
+    """ Tokens y tamaño de la respuesta. """
+    _anotar_uso(span, respuesta)
+    try:
+        span.anotar(bytes_respuesta=len(respuesta.text.encode("utf-8")))
+    except (AttributeError, ValueError):
+        # Respuesta bloqueada o sin texto
+        pass
+
+
+def _anotar_fragmento(span, fragmento):
+    """ Como `_anotar_respuesta`, acumulando: el uso de tokens llega (acumulado) en los fragmentos. """
+    _anotar_uso(span, fragmento)
+    try:
+        span.sumar("bytes_respuesta", len(fragmento.text.encode("utf-8")))
+    except (AttributeError, ValueError):
+        pass
+
+
+def _anotar_uso(span, respuesta):
+    uso = getattr(respuesta, "usage_metadata", None)
+    if uso is not None:
+        span.anotar(
+            tokens_entrada=getattr(uso, "prompt_token_count", 0) or 0,
+            tokens_salida=getattr(uso, "candidates_token_count", 0) or 0,
+        )
+
+
+def generar(model, prompt_parts, intentos_max=None, plazo=None, al_reintentar=None, cancelar=None,
+            al_reiniciar=None, **kwargs):
+    """
+    Llama a `model.generate_content` respetando cuota y concurrencia global.
+    `al_reintentar(espera, error)` permite avisar en la UI y `cancelar`
+    (threading.Event) aborta entre intentos. Lanza ErrorIA.
+    Con stream=True devuelve un iterador de fragmentos (los errores salen
+    al iterar); si la conexión se corta a mitad, se pide todo de nuevo y
+    antes se llama a `al_reiniciar()` para que el consumidor descarte lo
+    recibido. Sin `al_reiniciar`, un corte a mitad no se reintenta.
+    Cada llamada queda registrada como span "llm" en la telemetría (en
+    streaming, hasta el último fragmento).
+    """
+    if kwargs.pop("stream", False):
+        return _generar_stream(model, prompt_parts, intentos_max, plazo, al_reintentar, cancelar, al_reiniciar,
+                               **kwargs)
+    with telemetria.span("llm", modelo=nombre_modelo(model)) as span:
+        span.anotar(bytes_prompt=tamano_prompt(prompt_parts))
+        respuesta = _generar(model, prompt_parts, intentos_max, plazo, al_reintentar, cancelar, **kwargs)
+        _anotar_respuesta(span, respuesta)
+        return respuesta
+
+
+def _esperar_turno(fin, cancelar):
+    """ Reserva cuota y un hueco del semáforo; False si se agota el plazo o se cancela. """
+    espera = _limitador.reservar()
+    if time.monotonic() + espera > fin:
+        _limitador.devolver()
+        return False
+    telemetria.sumar("espera_cuota_ms", round(espera * 1000))
+    if _dormir(espera, cancelar) or not _semaforo.acquire(timeout=max(0.0, fin - time.monotonic())):
+        # El token reservado no se llegó a usar
+        _limitador.devolver()
+        return False
+    _sumar("en_vuelo")
+    telemetria.sumar("intentos")
+    return True
+
+
+def _liberar_turno():
+    _sumar("en_vuelo", -1)
+    _semaforo.release()
+
+
+def _seguir_tras_fallo(error, intento, limite, fin, al_reintentar, cancelar):
+    """ Espera el backoff si toca reintentar; False si hay que rendirse. """
+    espera = _registrar_fallo(error, intento, limite, al_reintentar)
+    if espera is None or time.monotonic() + espera > fin:
+        return False
+    return not _dormir(espera, cancelar)
+
+
+def _generar(model, prompt_parts, intentos_max, plazo, al_reintentar, cancelar, **kwargs):
+    limite = intentos_max or INTENTOS_MAX
+    fin = time.monotonic() + (plazo or PLAZO_SEGUNDOS)
+    ultimo_error = None
+    _sumar("llamadas")
+    for intento in range(limite):
+        if not _esperar_turno(fin, cancelar):
+            break
+        try:
+            respuesta = model.generate_content(prompt_parts, **kwargs)
+            _sumar("exitos")
+            return respuesta
+        except Exception as e:
+            ultimo_error = e
+        finally:
+            _liberar_turno()
+        if not _seguir_tras_fallo(ultimo_error, intento, limite, fin, al_reintentar, cancelar):
+            break
+    _sumar("fallos")
+    raise _error_final(ultimo_error, cancelar)
+
+
+def _generar_stream(model, prompt_parts, intentos_max, plazo, al_reintentar, cancelar, al_reiniciar, **kwargs):
+    # El span se cierra tras el último fragmento (o el error, o si el consumidor deja de leer)
+    span = telemetria.abrir("llm", modelo=nombre_modelo(model))
+    span.anotar(bytes_prompt=tamano_prompt(prompt_parts), stream=True)
+    resultado = "interrumpido"
+    try:
+        yield from _fragmentos(span, model, prompt_parts, intentos_max, plazo, al_reintentar, cancelar, al_reiniciar,
+                               **kwargs)
+        resultado = "ok"
+    except Exception:
+        resultado = "error"
+        raise
+    finally:
+        telemetria.cerrar(span, resultado)
+
+
+def _fragmentos(span, model, prompt_parts, intentos_max, plazo, al_reintentar, cancelar, al_reiniciar, **kwargs):
+    limite = intentos_max or INTENTOS_MAX
+    fin = time.monotonic() + (plazo or PLAZO_SEGUNDOS)
+    ultimo_error = None
+    _sumar("llamadas")
+    for intento in range(limite):
+        # Reintentos, 429 y espera de cuota van al span "llm" (solo mientras no hay un yield de por medio)
+        with telemetria.activo(span):
+            turno = _esperar_turno(fin, cancelar)
+        if not turno:
+            break
+        entregados = 0
+        try:
+            try:
+                fragmentos = model.generate_content(prompt_parts, stream=True, **kwargs)
+            except (TypeError, NotImplementedError) as e:
+                raise StreamNoSoportado(str(e)) from e
+            for fragmento in fragmentos:
+                entregados += 1
+                _anotar_fragmento(span, fragmento)
+                yield fragmento
+            _sumar("exitos")
+            return
+        except StreamNoSoportado:
+            _sumar("fallos")
+            raise
+        except Exception as e:
+            ultimo_error = e
+        finally:
+            # También si el consumidor deja de leer (close del generador)
+            _liberar_turno()
+        if entregados and al_reiniciar is None:
+            # Lo ya entregado no se puede retirar: repetir la petición lo duplicaría
+            break
+        with telemetria.activo(span):
+            seguir = _seguir_tras_fallo(ultimo_error, intento, limite, fin, al_reintentar, cancelar)
+        if not seguir:
+            break
+        if entregados:
+            al_reiniciar()
+    _sumar("fallos")
+    raise _error_final(ultimo_error, cancelar)
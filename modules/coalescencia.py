@@ -0,0 +1,157 @@
+"""
+Coalescencia de peticiones (single-flight) para prompts idénticos.
+
+Si varias sesiones envían el mismo prompt a la vez (p. ej. toda la clase
+pulsando "Generar Primer Parcial"), solo la primera llama a la IA; las
+demás esperan su respuesta con un tiempo máximo. Una petición en curso
+se puede cancelar con `cancelar(clave)`, y las de una sesión que ya no
+las necesita (prefetch detenido, sesión cerrada) con `cancelar_dueno`:
+las llamadas hechas dentro de `con_dueno(dueno, ...)` quedan a su nombre.
+"""
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FuturesTimeout
+
+from modules import telemetria
+from modules.cliente_gemini import ErrorIA
+
+ESPERA_MAX_SEGUNDOS = 150
+
+_lock = threading.Lock()
+_en_vuelo = {}
+_hilo = threading.local()
+_stats = {"lideres": 0, "coalescidas": 0, "tiempo_agotado": 0, "canceladas": 0}
+
+
+class Cancelada(ErrorIA):
+    """ La petición compartida se canceló o su sesión líder se interrumpió. """
+
+
+class _Vuelo:
+    __slots__ = ("futuro", "cancelar", "esperando", "duenos")
+
+    def __init__(self):
+        self.futuro = Future()
+        self.cancelar = threading.Event()
+        self.esperando = 0
+        # dueño -> llamadas suyas esperando este vuelo
+        self.duenos = {}
+
+
+def clave_prompt(nombre_modelo, prompt_parts):
+    """ Hash del modelo y de todas las partes del prompt (texto e imágenes). """
+    h = hashlib.sha256(str(nombre_modelo).encode("utf-8"))
+    partes = prompt_parts if isinstance(prompt_parts, (list, tuple)) else [prompt_parts]
+    for parte in partes:
+        if isinstance(parte, str):
+            h.update(b"T" + parte.encode("utf-8"))
+        elif isinstance(parte, dict) and "data" in parte:
+            h.update(b"B" + str(parte.get("mime_type")).encode() + bytes(parte["data"]))
+        elif hasattr(parte, "tobytes"):
+            # Imagen PIL
+            h.update(b"I" + f"{parte.mode}{parte.size}".encode() + parte.tobytes())
+        else:
+            h.update(b"R" + repr(parte).encode("utf-8"))
+    return h.hexdigest()
+
+
+def ejecutar(clave, funcion, timeout=ESPERA_MAX_SEGUNDOS):
+    """
+    Ejecuta `funcion(evento_cancelar)` una sola vez por clave en vuelo.
+    La primera llamada la ejecuta en el hilo que llama; las concurrentes
+    esperan como mucho `timeout` segundos y reciben el mismo resultado.
+    """
+    dueno = getattr(_hilo, "dueno", None)
+    with _lock:
+        vuelo = _en_vuelo.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _en_vuelo[clave] = _Vuelo()
+            _stats["lideres"] += 1
+        else:
+            _stats["coalescidas"] += 1
+        vuelo.esperando += 1
+        vuelo.duenos[dueno] = vuelo.duenos.get(dueno, 0) + 1
+    telemetria.cache("coalescencia", not lider)
+
+    if lider:
+        try:
+            resultado = funcion(vuelo.cancelar)
+        except Exception as e:
+            vuelo.futuro.set_exception(e)
+            raise
+        except BaseException:
+            # Rerun/stop de Streamlit en la sesión líder: los demás reintentan.
+            vuelo.futuro.set_exception(Cancelada("La sesión líder se interrumpió"))
+            raise
+        else:
+            vuelo.futuro.set_result(resultado)
+            return resultado
+        finally:
+            _terminar(clave, vuelo, dueno)
+
+    try:
+        return vuelo.futuro.result(timeout=timeout)
+    except FuturesTimeout:
+        with _lock:
+            _stats["tiempo_agotado"] += 1
+        raise ErrorIA(f"Tiempo de espera agotado ({timeout}s) aguardando una respuesta compartida")
+    except Cancelada:
+        if vuelo.cancelar.is_set():
+            raise
+        return ejecutar(clave, funcion, timeout)
+    finally:
+        _terminar(clave, vuelo, dueno)
+
+
+def _terminar(clave, vuelo, dueno):
+    with _lock:
+        vuelo.esperando -= 1
+        vuelo.duenos[dueno] -= 1
+        if not vuelo.duenos[dueno]:
+            del vuelo.duenos[dueno]
+        if vuelo.futuro.done() and _en_vuelo.get(clave) is vuelo:
+            del _en_vuelo[clave]
+
+
+def cancelar(clave):
+    """ Pide cancelar la petición en vuelo; True si había una. """
+    with _lock:
+        vuelo = _en_vuelo.get(clave)
+        if vuelo is None:
+            return False
+        vuelo.cancelar.set()
+        _stats["canceladas"] += 1
+        return True
+
+
+def con_dueno(dueno, funcion, *args, **kwargs):
+    """ Ejecuta `funcion` con las peticiones que haga a nombre de `dueno` (p. ej. el prefetch de una sesión). """
+    anterior = getattr(_hilo, "dueno", None)
+    _hilo.dueno = dueno
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        _hilo.dueno = anterior
+
+
+def cancelar_dueno(dueno):
+    """
+    Cancela las peticiones en vuelo que solo espera `dueno`; las que
+    comparten otras sesiones siguen. Devuelve cuántas se cancelaron.
+    """
+    with _lock:
+        canceladas = 0
+        for vuelo in _en_vuelo.values():
+            if vuelo.duenos.get(dueno) == vuelo.esperando and not vuelo.cancelar.is_set():
+                vuelo.cancelar.set()
+                canceladas += 1
+        _stats["canceladas"] += canceladas
+        return canceladas
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_stats)
+        datos["en_vuelo"] = len(_en_vuelo)
+    return datos
@@ -0,0 +1,279 @@
+"""
+Dominio por estudiante y planificador adaptativo del Dojo.
+
+Cada respuesta (quiz) o primer intento de estrategia (Dojo) actualiza en
+O(1), sin releer el historial:
+
+- la habilidad del estudiante en el tema (theta, estilo Elo/Rasch:
+  P(acierto) = 1 / (1 + e^-(theta - b)), theta += K·(acierto - P));
+- la dificultad b del ítem, con un paso menor (calibración compartida);
+- la caja Leitner del ítem para ese estudiante, que fija cuándo repasarlo.
+
+El planificador arma la serie con los repasos vencidos primero y luego
+ejercicios del banco indexado, repartidos hacia los temas más débiles y
+con la dificultad que deja la probabilidad de acierto cerca de
+OBJETIVO_ACIERTO. Los temas ya dominados casi no reciben ejercicios.
+
+Los repasos guardan solo el id del ítem; el enunciado se guarda una vez
+por ítem en `items`, no una copia por estudiante. El `estudiante` es el
+identificador de la URL: separa el progreso, no autentica a nadie.
+"""
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from modules import banco_indexado, pool_quiz
+
+RUTA_DOMINIO = os.environ.get("TUTOR_DOMINIO_RUTA", os.path.join(".cache", "dominio.sqlite3"))
+K_ESTUDIANTE = 0.4
+K_ITEM = 0.05
+K_MINIMO = 0.25           # sin bajar de aquí: el estudiante aprende, theta no es fija
+UMBRAL_DOMINIO = 0.85      # P(acierto) en un ítem de dificultad media
+OBJETIVO_ACIERTO = 0.6
+PESO_DOMINADO = 0.05
+MAX_REPASOS = 2
+CANDIDATOS_POR_HUECO = 4
+# Caja Leitner -> segundos hasta el próximo repaso
+INTERVALOS = [10 * 60, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600, 21 * 24 * 3600]
+# dificultad del banco (1-3) -> b inicial
+DIFICULTAD_INICIAL = {1: -1.0, 2: 0.0, 3: 1.0}
+
+_lock = threading.Lock()
+_conexion = None
+_stats = {"respuestas": 0, "planificaciones": 0, "repasos_servidos": 0, "errores": 0}
+
+
+def _obtener_conexion():
+    global _conexion
+    if _conexion is None:
+        carpeta = os.path.dirname(RUTA_DOMINIO)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        _conexion = sqlite3.connect(RUTA_DOMINIO, check_same_thread=False, timeout=10)
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.execute("PRAGMA synchronous=NORMAL")
+        _conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS habilidad (
+                estudiante TEXT NOT NULL,
+                tema TEXT NOT NULL,
+                theta REAL NOT NULL DEFAULT 0,
+                respuestas INTEGER NOT NULL DEFAULT 0,
+                aciertos INTEGER NOT NULL DEFAULT 0,
+                actualizado REAL NOT NULL,
+                PRIMARY KEY (estudiante, tema)
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                item TEXT PRIMARY KEY,
+                b REAL NOT NULL,
+                respuestas INTEGER NOT NULL DEFAULT 0,
+                pregunta TEXT
+            );
+            CREATE TABLE IF NOT EXISTS repasos (
+                estudiante TEXT NOT NULL,
+                item TEXT NOT NULL,
+                tema TEXT NOT NULL,
+                caja INTEGER NOT NULL,
+                proximo REAL NOT NULL,
+                PRIMARY KEY (estudiante, item)
+            );
+        """)
+        _migrar(_conexion)
+        _conexion.execute("CREATE INDEX IF NOT EXISTS idx_repasos_vencidos ON repasos(estudiante, proximo)")
+        _conexion.commit()
+    return _conexion
+
+
+def _migrar(con):
+    """ Esquema anterior: el JSON de la pregunta en cada fila de repasos. Pasa a `items`, una vez por ítem. """
+    if "pregunta" not in {c[1] for c in con.execute("PRAGMA table_info(items)")}:
+        con.execute("ALTER TABLE items ADD COLUMN pregunta TEXT")
+    if "pregunta" not in {c[1] for c in con.execute("PRAGMA table_info(repasos)")}:
+        return
+    con.executescript("""
+        UPDATE items SET pregunta = (SELECT r.pregunta FROM repasos r WHERE r.item = items.item LIMIT 1)
+            WHERE pregunta IS NULL;
+        DROP INDEX IF EXISTS idx_repasos_vencidos;
+        ALTER TABLE repasos RENAME TO repasos_anterior;
+        CREATE TABLE repasos (
+            estudiante TEXT NOT NULL,
+            item TEXT NOT NULL,
+            tema TEXT NOT NULL,
+            caja INTEGER NOT NULL,
+            proximo REAL NOT NULL,
+            PRIMARY KEY (estudiante, item)
+        );
+        INSERT INTO repasos SELECT estudiante, item, tema, caja, proximo FROM repasos_anterior;
+        DROP TABLE repasos_anterior;
+    """)
+
+
+def probabilidad(theta, b):
+    return 1 / (1 + math.exp(b - theta))
+
+
+def _b_inicial(pregunta):
+    return DIFICULTAD_INICIAL.get(pregunta.get('dificultad'), 0.0)
+
+
+def registrar(estudiante, pregunta, acierto):
+    """ Actualiza habilidad, dificultad del ítem y repaso con una respuesta. O(1). """
+    if not estudiante or not pregunta:
+        return
+    tema = pregunta.get('tema') or "General"
+    item = pool_quiz.id_pregunta(pregunta)
+    ahora = time.time()
+    y = 1.0 if acierto else 0.0
+    with _lock:
+        try:
+            con = _obtener_conexion()
+            fila = con.execute(
+                "SELECT theta, respuestas FROM habilidad WHERE estudiante = ? AND tema = ?", (estudiante, tema)
+            ).fetchone()
+            theta, n = fila if fila else (0.0, 0)
+            fila = con.execute(
+                "SELECT b, respuestas, pregunta IS NOT NULL FROM items WHERE item = ?", (item,)
+            ).fetchone()
+            b, n_item, guardada = fila if fila else (_b_inicial(pregunta), 0, False)
+            p = probabilidad(theta, b)
+            # Pasos grandes al principio, que se estabilizan con las respuestas
+            theta += max(K_MINIMO, K_ESTUDIANTE / math.sqrt(1 + n / 5)) * (y - p)
+            b -= K_ITEM * (y - p)
+            con.execute(
+                "INSERT INTO habilidad (estudiante, tema, theta, respuestas, aciertos, actualizado) VALUES (?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(estudiante, tema) DO UPDATE SET theta = excluded.theta, respuestas = respuestas + 1, "
+                "aciertos = aciertos + excluded.aciertos, actualizado = excluded.actualizado",
+                (estudiante, tema, theta, int(y), ahora),
+            )
+            # El enunciado solo se serializa la primera vez que se ve el ítem
+            con.execute(
+                "INSERT INTO items (item, b, respuestas, pregunta) VALUES (?, ?, ?, ?) ON CONFLICT(item) DO UPDATE SET "
+                "b = excluded.b, respuestas = excluded.respuestas, pregunta = COALESCE(items.pregunta, excluded.pregunta)",
+                (item, b, n_item + 1, None if guardada else json.dumps(pregunta, ensure_ascii=False)),
+            )
+            fila = con.execute(
+                "SELECT caja FROM repasos WHERE estudiante = ? AND item = ?", (estudiante, item)
+            ).fetchone()
+            caja = min(fila[0] + 1, len(INTERVALOS) - 1) if (fila and acierto) else (1 if acierto else 0)
+            con.execute(
+                "INSERT OR REPLACE INTO repasos (estudiante, item, tema, caja, proximo) VALUES (?, ?, ?, ?, ?)",
+                (estudiante, item, tema, caja, ahora + INTERVALOS[caja]),
+            )
+            con.commit()
+            _stats["respuestas"] += 1
+        except sqlite3.Error as e:
+            _stats["errores"] += 1
+            print(f"Aviso: no se pudo registrar el dominio {e}")
+
+
+def habilidades(estudiante, temas):
+    """ {tema: theta} (0 para los temas sin respuestas). """
+    resultado = dict.fromkeys(temas, 0.0)
+    if not estudiante or not temas:
+        return resultado
+    with _lock:
+        try:
+            filas = _obtener_conexion().execute(
+                f"SELECT tema, theta FROM habilidad WHERE estudiante = ? AND tema IN ({','.join('?' * len(temas))})",
+                (estudiante, *temas),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Aviso: dominio no disponible {e}")
+            filas = []
+    resultado.update(filas)
+    return resultado
+
+
+def dominado(theta):
+    return probabilidad(theta, 0.0) >= UMBRAL_DOMINIO
+
+
+def temas_prioritarios(estudiante, temas):
+    """ Los temas aún no dominados (o todos, si ya domina todos), del más débil al más fuerte. """
+    thetas = habilidades(estudiante, temas)
+    pendientes = [t for t in temas if not dominado(thetas[t])]
+    return sorted(pendientes or list(temas), key=thetas.get)
+
+
+def _repasos_vencidos(estudiante, temas, n):
+    with _lock:
+        try:
+            filas = _obtener_conexion().execute(
+                f"SELECT i.pregunta FROM repasos r JOIN items i ON i.item = r.item "
+                f"WHERE r.estudiante = ? AND r.proximo <= ? AND r.tema IN ({','.join('?' * len(temas))}) "
+                f"AND i.pregunta IS NOT NULL ORDER BY r.proximo LIMIT ?",
+                (estudiante, time.time(), *temas, n),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Aviso: repasos no disponibles {e}")
+            return []
+    return [json.loads(f[0]) for f in filas]
+
+
+def _dificultades(items):
+    if not items:
+        return {}
+    with _lock:
+        try:
+            return dict(_obtener_conexion().execute(
+                f"SELECT item, b FROM items WHERE item IN ({','.join('?' * len(items))})", items
+            ).fetchall())
+        except sqlite3.Error:
+            return {}
+
+
+def elegir_ejercicios(estudiante, temas, n, azar=random):
+    """
+    Hasta n ejercicios para la serie: repasos vencidos (como mucho
+    MAX_REPASOS) y luego del banco indexado. Los huecos se reparten entre
+    los temas según sus pesos (más para los débiles) y, dentro de cada
+    tema, se elige la dificultad más cercana a OBJETIVO_ACIERTO.
+    """
+    temas = list(temas)
+    _stats["planificaciones"] += 1
+    elegidos = _repasos_vencidos(estudiante, temas, min(n, MAX_REPASOS)) if estudiante else []
+    _stats["repasos_servidos"] += len(elegidos)
+    falta = n - len(elegidos)
+    indice = banco_indexado.indice_vigente()
+    if falta <= 0 or indice is None:
+        return elegidos + (banco_indexado.obtener_preguntas_fijas(temas, falta) if falta > 0 else [])
+
+    thetas = habilidades(estudiante, temas)
+    pesos = {t: PESO_DOMINADO if dominado(thetas[t]) else 1 - probabilidad(thetas[t], 0.0) for t in temas}
+    ya = {pool_quiz.id_pregunta(p) for p in elegidos}
+    candidatos = [indice.pregunta(i) for i in banco_indexado.muestrear(indice, temas, falta * CANDIDATOS_POR_HUECO, pesos, azar)]
+    candidatos = [c for c in candidatos if pool_quiz.id_pregunta(c) not in ya]
+    b = _dificultades([pool_quiz.id_pregunta(c) for c in candidatos])
+    distancia = lambda c: abs(
+        probabilidad(thetas.get(c.get('tema'), 0.0), b.get(pool_quiz.id_pregunta(c), _b_inicial(c))) - OBJETIVO_ACIERTO
+    )
+    # Cupos por tema: los temas de los primeros `falta` candidatos, sorteados según los pesos.
+    # Ordenar todo por distancia los ignoraría (un tema dominado con ítems a la medida se llevaría la serie).
+    cupos = {}
+    for c in candidatos[:falta]:
+        cupos[c.get('tema')] = cupos.get(c.get('tema'), 0) + 1
+    por_tema = {}
+    for c in sorted(candidatos, key=distancia):
+        por_tema.setdefault(c.get('tema'), []).append(c)
+    return elegidos + [c for tema, cupo in cupos.items() for c in por_tema[tema][:cupo]]
+
+
+def resumen(estudiante):
+    """ [(tema, P(acierto medio), respuestas, aciertos)] del estudiante. """
+    with _lock:
+        try:
+            filas = _obtener_conexion().execute(
+                "SELECT tema, theta, respuestas, aciertos FROM habilidad WHERE estudiante = ? ORDER BY tema",
+                (estudiante,),
+            ).fetchall()
+        except sqlite3.Error:
+            return []
+    return [(tema, round(probabilidad(theta, 0.0), 2), n, a) for tema, theta, n, a in filas]
+
+
+def estadisticas():
+    with _lock:
+        return dict(_stats)
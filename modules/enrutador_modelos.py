@@ -0,0 +1,203 @@
+"""
+Enrutado de cada llamada a la IA entre un modelo rápido y uno fuerte.
+
+Cada ruta (tutor, lote del tutor, quiz, análisis de texto, análisis de
+foto, transcripción de una foto para la caché de fotos) tiene una
+escalera de niveles: se prueba primero el modelo rápido y barato y solo
+se sube al fuerte si la respuesta no es JSON, no cumple el esquema o la
+verificación simbólica la rechaza. Sin respuesta (cuota,
+red) no se escala: el fuerte consume la misma cuota y fallaría igual.
+
+Por ruta y nivel se cuentan llamadas, aceptadas, motivos de rechazo,
+latencia y coste estimado, y cada llamada es un span "ruta/nivel" en la
+telemetría (percentiles en la página de administración).
+
+Configuración:
+- TUTOR_MODELO_RAPIDO / TUTOR_MODELO_FUERTE: nombres de los modelos (el
+  fuerte, por defecto, es el del backend).
+- TUTOR_RUTAS: escaleras a medida, p. ej. "analisis_foto=rapido+fuerte;quiz=fuerte".
+- TUTOR_ENRUTADOR=0: todo va directo al modelo fuerte, como antes.
+"""
+import os
+import threading
+import time
+
+from modules import backend_modelo, cliente_gemini, telemetria
+from modules.tutor_ia import limpiar_json
+
+ACTIVO = os.environ.get("TUTOR_ENRUTADOR", "1") != "0"
+MODELO_RAPIDO = os.environ.get("TUTOR_MODELO_RAPIDO", "")
+MODELO_FUERTE = os.environ.get("TUTOR_MODELO_FUERTE", "")
+# Enunciados de texto más largos que esto van directos al fuerte (problemas de aplicación con datos)
+LARGO_COMPLEJO = 700
+TOKENS_IMAGEN = 258
+ESCALERAS = {
+    "tutor": ("rapido", "fuerte"),
+    "tutor_lote": ("rapido", "fuerte"),
+    "quiz": ("rapido", "fuerte"),
+    "analisis": ("rapido", "fuerte"),
+    "analisis_complejo": ("fuerte",),
+    "analisis_foto": ("fuerte",),
+    "transcripcion": ("rapido",),
+}
+# Tipo del JSON de cada ruta (las demás devuelven un objeto)
+TIPOS_JSON = {"quiz": list, "tutor_lote": list}
+# USD por millón de tokens (entrada, salida); se busca por prefijo del nombre
+PRECIOS_MTOK = {
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-simulado-rapido": (0.0375, 0.15),
+    "gemini-simulado": (0.075, 0.30),
+}
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def _escaleras():
+    escaleras = dict(ESCALERAS)
+    for tramo in os.environ.get("TUTOR_RUTAS", "").split(";"):
+        if "=" in tramo:
+            ruta, niveles = tramo.split("=", 1)
+            escaleras[ruta.strip()] = tuple(n.strip() for n in niveles.split("+") if n.strip())
+    return escaleras
+
+
+def ruta_analisis(texto_usuario, hay_imagen):
+    """ Ruta del análisis de una consulta según su complejidad. """
+    if hay_imagen:
+        return "analisis_foto"
+    if len(texto_usuario or "") > LARGO_COMPLEJO:
+        return "analisis_complejo"
+    return "analisis"
+
+
+def _modelo(nivel):
+    """ (modelo, nombre) del nivel; None si ese nivel no está disponible. """
+    base = backend_modelo.obtener_modelo()
+    if base is None:
+        return None
+    if nivel == "fuerte":
+        return (backend_modelo.obtener_modelo_nombrado(MODELO_FUERTE), MODELO_FUERTE) if MODELO_FUERTE else base
+    nombre = MODELO_RAPIDO or backend_modelo.nombre_modelo_rapido()
+    return backend_modelo.obtener_modelo_nombrado(nombre), nombre
+
+
+def escalera(ruta):
+    """ [(nivel, modelo, nombre), ...] en orden de prueba, sin repetir modelos. """
+    niveles = _escaleras().get(ruta, ("fuerte",)) if ACTIVO else ("fuerte",)
+    pasos, vistos = [], set()
+    for nivel in niveles:
+        elegido = _modelo(nivel)
+        if elegido is not None and elegido[1] not in vistos:
+            vistos.add(elegido[1])
+            pasos.append((nivel,) + elegido)
+    return pasos
+
+
+# --- Métricas ---
+
+def _precio(nombre):
+    for prefijo in sorted(PRECIOS_MTOK, key=len, reverse=True):
+        if nombre.startswith(prefijo):
+            return PRECIOS_MTOK[prefijo]
+    return 0.0, 0.0
+
+
+def tokens_prompt(prompt_parts):
+    """ Estimación: ~4 bytes por token de texto y un coste fijo por imagen. """
+    partes = prompt_parts if isinstance(prompt_parts, (list, tuple)) else [prompt_parts]
+    imagenes = sum(1 for p in partes if not isinstance(p, str))
+    return cliente_gemini.tamano_prompt([p for p in partes if isinstance(p, str)]) // 4 + imagenes * TOKENS_IMAGEN
+
+
+def registrar(ruta, nivel, nombre, segundos, motivo=None, tokens_entrada=0, tokens_salida=0):
+    """ Una llamada de la ruta: motivo None si se aceptó, si no "sin_respuesta", "json", "esquema"... """
+    entrada, salida = _precio(nombre)
+    with _lock:
+        fila = _stats.setdefault((ruta, nivel), {
+            "modelo": nombre, "llamadas": 0, "aceptadas": 0, "rechazos": {}, "segundos": 0.0, "coste_usd": 0.0})
+        fila["llamadas"] += 1
+        fila["segundos"] += segundos
+        fila["coste_usd"] += (tokens_entrada * entrada + tokens_salida * salida) / 1e6
+        if motivo is None:
+            fila["aceptadas"] += 1
+        else:
+            fila["rechazos"][motivo] = fila["rechazos"].get(motivo, 0) + 1
+
+
+# --- Llamadas ---
+
+def resolver(ruta, prompt_parts, llamar, validar=None, con_modelo=False):
+    """
+    Recorre la escalera de la ruta hasta obtener un JSON aceptado.
+    `llamar(modelo, nombre)` devuelve el texto de la respuesta o None;
+    `validar(datos)` devuelve None si lo acepta o el motivo del rechazo.
+    Devuelve el JSON aceptado o None; con `con_modelo`, (JSON, nombre del
+    modelo que lo dio) o (None, None).
+    """
+    fallo = (None, None) if con_modelo else None
+    entrada = tokens_prompt(prompt_parts)
+    for nivel, modelo, nombre in escalera(ruta):
+        with telemetria.span(f"{ruta}/{nivel}", modelo=nombre) as span:
+            inicio = time.perf_counter()
+            texto = llamar(modelo, nombre)
+            datos = limpiar_json(texto, TIPOS_JSON.get(ruta, dict)) if texto else None
+            if texto is None:
+                motivo = "sin_respuesta"
+            elif datos is None:
+                motivo = "json"
+            else:
+                motivo = validar(datos) if validar else None
+            span.anotar(ruta=ruta, nivel=nivel, motivo=motivo or "")
+            span.resultado = "ok" if motivo is None else "rechazo"
+            registrar(ruta, nivel, nombre, time.perf_counter() - inicio, motivo, entrada, len(texto or "") // 4)
+        if motivo is None:
+            return (datos, nombre) if con_modelo else datos
+        if motivo == "sin_respuesta":
+            return fallo
+        print(f"Aviso: {ruta} con {nombre} rechazado ({motivo}), se escala")
+    return fallo
+
+
+def medido(ruta, nivel, nombre, llamar):
+    """
+    Envuelve `llamar(prompt)` (que devuelve la respuesta con `.text` o None)
+    para contar sus llamadas en la ruta, cuando la aceptación la decide otro
+    módulo (p. ej. elemento a elemento en `tutor_lote`).
+    """
+    def envoltura(prompt):
+        with telemetria.span(f"{ruta}/{nivel}", modelo=nombre):
+            inicio = time.perf_counter()
+            respuesta = llamar(prompt)
+            texto = getattr(respuesta, "text", None) if respuesta is not None else None
+            registrar(ruta, nivel, nombre, time.perf_counter() - inicio, None if texto else "sin_respuesta",
+                      tokens_prompt(prompt), len(texto or "") // 4)
+            return respuesta
+    return envoltura
+
+
+def estadisticas():
+    """ Filas por ruta y nivel; la tasa de escalado es llamadas de niveles altos / llamadas del primero. """
+    with _lock:
+        copia = {clave: dict(fila, rechazos=dict(fila["rechazos"])) for clave, fila in _stats.items()}
+    primeras = {}
+    for (ruta, nivel), fila in copia.items():
+        niveles = _escaleras().get(ruta, ("fuerte",))
+        if nivel == niveles[0]:
+            primeras[ruta] = fila["llamadas"]
+    filas = []
+    for (ruta, nivel), fila in sorted(copia.items()):
+        niveles = _escaleras().get(ruta, ("fuerte",))
+        base = primeras.get(ruta, 0)
+        filas.append({
+            "ruta": ruta, "nivel": nivel, "modelo": fila["modelo"], "llamadas": fila["llamadas"],
+            "aceptadas": fila["aceptadas"], "rechazos": fila["rechazos"],
+            "ms_medio": round(fila["segundos"] / fila["llamadas"] * 1000, 1),
+            "escalado": round(fila["llamadas"] / base, 3) if base and nivel != niveles[0] else None,
+            "coste_usd": round(fila["coste_usd"], 6),
+        })
+    return filas
@@ -0,0 +1,226 @@
+"""
+Esquemas de lo que devuelve la IA: tutoría del Dojo, análisis de una
+consulta y pregunta del quiz.
+
+Cada esquema tiene un validador compilado una sola vez al importar (una
+tupla de comprobaciones por campo, sin excepciones ni búsquedas por
+nombre al validar) y una clase con `__slots__` que se construye solo a
+partir de datos válidos: un JSON mal formado se rechaza al generarlo, no
+como un KeyError a mitad de pantalla. Las opciones del quiz quedan ya
+partidas: las letras en un str ("ABCD"), la respuesta correcta como
+índice y un diccionario letra -> índice, compartido por todas las
+preguntas con las mismas letras, para consultarlas en O(1).
+
+Las clases no se mutan (se comparten entre sesiones vía
+`almacen_preguntas`); `a_dict` devuelve el JSON para cachés y almacén.
+"""
+# Índices letra -> posición por secuencia de letras; "ABCD" cubre casi todas las preguntas
+MAX_INDICES = 256
+_indices = {}
+
+
+# --- Comprobaciones por campo ---
+
+def _texto(valor):
+    return type(valor) is str and valor != "" and not valor.isspace()
+
+
+def _texto_o_numero(valor):
+    # Un resultado "2" a veces llega como número: se acepta y se guarda como texto
+    return _texto(valor) or (isinstance(valor, (int, float)) and not isinstance(valor, bool))
+
+
+def _lista_textos(minimo):
+    def comprobar(valor):
+        return type(valor) is list and len(valor) >= minimo and all(map(_texto, valor))
+    return comprobar
+
+
+def compilar(campos, extra=None):
+    """
+    Validador de un esquema: `campos` es [(nombre, comprobación)] y `extra`,
+    una comprobación del objeto entero tras pasar las de los campos.
+    Devuelve una función datos -> bool.
+    """
+    campos = tuple(campos)
+
+    def validar(datos):
+        if type(datos) is not dict:
+            return False
+        obtener = datos.get
+        for nombre, comprobar in campos:
+            if not comprobar(obtener(nombre)):
+                return False
+        return extra is None or extra(datos)
+    return validar
+
+
+def _indice_en_rango(datos):
+    indice = datos["indice_correcta"]
+    return type(indice) is int and 0 <= indice < len(datos["estrategias"])
+
+
+_CAMPOS_TUTOR = (
+    ("estrategias", _lista_textos(2)),
+    ("indice_correcta", lambda v: type(v) is int),
+    ("feedback_estrategia", _texto),
+    ("paso_intermedio", _texto_o_numero),
+    ("resultado_final", _texto_o_numero),
+)
+validar_tutor = compilar(_CAMPOS_TUTOR, _indice_en_rango)
+validar_analisis = compilar((("tema_detectado", _texto),) + _CAMPOS_TUTOR, _indice_en_rango)
+
+
+def letras_opciones(opciones):
+    """ Letras de opciones "A) ..." en un str ("ABCD") o None si alguna no tiene letra o se repite. """
+    letras = ""
+    for opcion in opciones:
+        opcion = opcion.lstrip()
+        letra = opcion[:1]
+        if not (letra.isascii() and letra.isalpha()) or not opcion[1:].lstrip().startswith(")"):
+            return None
+        letras += letra.upper()
+    return letras if len(set(letras)) == len(letras) else None
+
+
+def indice_letras(letras):
+    """ {letra: posición} de una secuencia de letras, compartido entre preguntas. """
+    por_letra = _indices.get(letras)
+    if por_letra is None:
+        por_letra = {letra: i for i, letra in enumerate(letras)}
+        if len(_indices) < MAX_INDICES:
+            por_letra = _indices.setdefault(letras, por_letra)
+    return por_letra
+
+
+def _letra_respuesta(datos):
+    return datos["respuesta_correcta"].lstrip()[0].upper()
+
+
+def _respuesta_en_opciones(datos):
+    letras = letras_opciones(datos["opciones"])
+    return letras is not None and _letra_respuesta(datos) in letras
+
+
+_CAMPOS_QUIZ = (("pregunta", _texto), ("opciones", _lista_textos(2)), ("respuesta_correcta", _texto))
+_validar_campos_quiz = compilar(_CAMPOS_QUIZ)
+validar_pregunta_quiz = compilar(_CAMPOS_QUIZ, _respuesta_en_opciones)
+
+
+# --- Clases ---
+
+class Tutoria:
+    """ Tutoría de un ejercicio: estrategias, la correcta, pista, paso intermedio y resultado. """
+
+    __slots__ = ("estrategias", "indice_correcta", "feedback_estrategia", "paso_intermedio", "resultado_final")
+    _validar = staticmethod(validar_tutor)
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """ La tutoría de un JSON válido o None. """
+        if not cls._validar(datos):
+            return None
+        objeto = cls.__new__(cls)
+        objeto._cargar(datos)
+        return objeto
+
+    def _cargar(self, datos):
+        self.estrategias = tuple(datos["estrategias"])
+        self.indice_correcta = datos["indice_correcta"]
+        self.feedback_estrategia = datos["feedback_estrategia"]
+        self.paso_intermedio = str(datos["paso_intermedio"])
+        self.resultado_final = str(datos["resultado_final"])
+
+    @property
+    def estrategia_correcta(self):
+        return self.estrategias[self.indice_correcta]
+
+    def es_correcta(self, estrategia):
+        """ True si la estrategia elegida (texto del selector) es la correcta. """
+        return estrategia == self.estrategias[self.indice_correcta]
+
+    def a_dict(self):
+        datos = {campo: getattr(self, campo) for campo in Tutoria.__slots__}
+        datos["estrategias"] = list(self.estrategias)
+        return datos
+
+
+class Analisis(Tutoria):
+    """ Análisis de una consulta: lo de la tutoría más el tema detectado y el enunciado transcrito. """
+
+    __slots__ = ("tema_detectado", "enunciado_latex")
+    _validar = staticmethod(validar_analisis)
+
+    def _cargar(self, datos):
+        Tutoria._cargar(self, datos)
+        self.tema_detectado = datos["tema_detectado"]
+        enunciado = datos.get("enunciado_latex")
+        self.enunciado_latex = enunciado if isinstance(enunciado, str) else ""
+
+    def a_dict(self):
+        datos = Tutoria.a_dict(self)
+        datos.update(tema_detectado=self.tema_detectado, enunciado_latex=self.enunciado_latex)
+        return datos
+
+
+class PreguntaQuiz:
+    """ Pregunta de opción múltiple con las opciones ya partidas y la correcta como índice. """
+
+    __slots__ = ("pregunta", "opciones", "letras", "indice_correcta", "explicacion", "tema", "_por_letra")
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """ La pregunta de un JSON válido o None. """
+        # Las opciones se parten una sola vez: validarlas y cargarlas es el mismo trabajo
+        letras = letras_opciones(datos["opciones"]) if _validar_campos_quiz(datos) else None
+        if letras is None:
+            return None
+        por_letra = indice_letras(letras)
+        indice = por_letra.get(_letra_respuesta(datos))
+        if indice is None:
+            return None
+        objeto = cls.__new__(cls)
+        objeto.pregunta = datos["pregunta"]
+        objeto.opciones = tuple(datos["opciones"])
+        objeto.letras = letras
+        objeto._por_letra = por_letra
+        objeto.indice_correcta = indice
+        explicacion = datos.get("explicacion")
+        objeto.explicacion = explicacion if isinstance(explicacion, str) and explicacion.strip() else ""
+        objeto.tema = datos.get("tema") or ""
+        return objeto
+
+    @property
+    def letra_correcta(self):
+        return self.letras[self.indice_correcta]
+
+    @property
+    def textos(self):
+        """ Texto de cada opción sin la letra ("$...$"). """
+        return tuple(opcion.split(")", 1)[1].strip() for opcion in self.opciones)
+
+    @property
+    def respuesta_correcta(self):
+        """ Texto completo de la opción correcta ("B) $...$"). """
+        return self.opciones[self.indice_correcta]
+
+    def indice(self, letra):
+        """ Índice de la opción con esa letra o None. O(1). """
+        return self._por_letra.get((letra or "").strip().upper())
+
+    def es_correcta(self, letra):
+        return self.indice(letra) == self.indice_correcta
+
+    def opcion(self, letra):
+        """ Texto completo de la opción con esa letra; la letra tal cual si no existe. """
+        if not letra:
+            return "(sin respuesta)"
+        i = self.indice(letra)
+        return letra if i is None else self.opciones[i]
+
+    def a_dict(self):
+        datos = {"pregunta": self.pregunta, "opciones": list(self.opciones),
+                 "respuesta_correcta": self.respuesta_correcta, "explicacion": self.explicacion}
+        if self.tema:
+            datos["tema"] = self.tema
+        return datos
@@ -0,0 +1,422 @@
+"""
+Estado compartido entre réplicas (varios procesos de Streamlit detrás de
+un balanceador).
+
+Sin configurar, cada proceso guarda todo en memoria y en sus ficheros,
+como siempre. Con TUTOR_ESTADO_COMPARTIDO se comparte:
+
+- valores con caducidad (`obtener` / `guardar`): segundo nivel de la
+  caché de tutorías, así lo que tutoriza una réplica lo sirven todas;
+- el token bucket de la cuota de Gemini (`reservar`, `devolver`,
+  `pausar`): una sola cuota y una sola pausa tras un 429 para todas;
+- el pool del quiz (`pool_*`) y turnos con caducidad (`tomar_turno`) para
+  que cada tema lo reponga una sola réplica a la vez.
+
+Valores de TUTOR_ESTADO_COMPARTIDO:
+- una ruta a un fichero SQLite (o sqlite:///ruta): réplicas del mismo nodo;
+- redis://host:puerto/db: réplicas en varios nodos (requiere el paquete
+  `redis`; el reloj del limitador es el del servidor Redis).
+
+Si el backend falla, las funciones devuelven None y el llamador sigue con
+lo del proceso: nunca se bloquea la app por el estado compartido. Si no
+se puede conectar (o se pierde la conexión), durante REINTENTO_SEGUNDOS
+ni se intenta: cada llamada devuelve None al momento en vez de esperar
+el timeout de la conexión.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+URL = os.environ.get("TUTOR_ESTADO_COMPARTIDO", "")
+PREFIJO = os.environ.get("TUTOR_ESTADO_PREFIJO", "tutor:")
+PURGA_CADA = 200
+REINTENTO_SEGUNDOS = float(os.environ.get("TUTOR_ESTADO_REINTENTO", 30))
+
+_lock = threading.Lock()
+_backend = None
+# time.monotonic() hasta el que no se reintenta conectar tras un fallo de conexión
+_caido_hasta = 0.0
+_ID = uuid.uuid4().hex[:8]
+_stats = {"lecturas": 0, "aciertos": 0, "escrituras": 0, "reservas": 0, "errores": 0, "desconexiones": 0}
+
+
+def activo():
+    return bool(URL)
+
+
+def _dueno():
+    """ Identifica al proceso como dueño de sus turnos (el pid cambia también en un fork). """
+    return f"{os.getpid()}-{_ID}"
+
+
+def _sumar(campo, n=1):
+    with _lock:
+        _stats[campo] += n
+
+
+def _elegir(listas, n, vistas):
+    """ Reparto por turnos entre temas (como `pool_quiz.tomar`): [(tema, pid)] de hasta n no vistos. """
+    elegidas, indices = [], {tema: 0 for tema in listas}
+    pendientes = list(listas)
+    while len(elegidas) < n and pendientes:
+        for tema in list(pendientes):
+            if len(elegidas) >= n:
+                break
+            candidatas = listas[tema]
+            while indices[tema] < len(candidatas) and candidatas[indices[tema]] in vistas:
+                indices[tema] += 1
+            if indices[tema] >= len(candidatas):
+                pendientes.remove(tema)
+                continue
+            pid = candidatas[indices[tema]]
+            indices[tema] += 1
+            vistas.add(pid)
+            elegidas.append((tema, pid))
+    return elegidas
+
+
+class _SQLite:
+    """ Un fichero compartido por las réplicas del nodo; cada operación es una transacción corta. """
+
+    # Un fichero local no se "cae": sus errores no abren la pausa de reconexión
+    errores_conexion = ()
+
+    def __init__(self, ruta):
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self.con = sqlite3.connect(ruta, check_same_thread=False, timeout=10, isolation_level=None)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS valores (
+                clave TEXT PRIMARY KEY, valor TEXT NOT NULL, caduca REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS limitadores (
+                nombre TEXT PRIMARY KEY, tokens REAL NOT NULL, ultimo REAL NOT NULL, pausa_hasta REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS turnos (
+                nombre TEXT PRIMARY KEY, dueno TEXT NOT NULL, caduca REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tema TEXT NOT NULL, pid TEXT NOT NULL, pregunta TEXT NOT NULL, usos INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (tema, pid)
+            );
+        """)
+        self.lock = threading.Lock()
+        self.escrituras = 0
+
+    def _transaccion(self, trabajo):
+        # BEGIN IMMEDIATE: el bloqueo de escritura se toma al empezar, sin carreras entre leer y escribir
+        with self.lock:
+            self.con.execute("BEGIN IMMEDIATE")
+            try:
+                resultado = trabajo(self.con)
+                self.con.execute("COMMIT")
+                return resultado
+            except BaseException:
+                self.con.execute("ROLLBACK")
+                raise
+
+    def obtener(self, clave):
+        with self.lock:
+            fila = self.con.execute("SELECT valor, caduca FROM valores WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila and fila[1] > time.time() else None
+
+    def guardar(self, clave, valor, ttl):
+        ahora = time.time()
+        with self.lock:
+            self.con.execute("INSERT OR REPLACE INTO valores VALUES (?, ?, ?)", (clave, valor, ahora + ttl))
+            self.escrituras += 1
+            if self.escrituras % PURGA_CADA == 0:
+                self.con.execute("DELETE FROM valores WHERE caduca < ?", (ahora,))
+        return True
+
+    def reservar(self, nombre, tasa, capacidad):
+        def trabajo(con):
+            ahora = time.time()
+            fila = con.execute("SELECT tokens, ultimo, pausa_hasta FROM limitadores WHERE nombre = ?",
+                               (nombre,)).fetchone()
+            tokens, ultimo, pausa = fila or (float(capacidad), ahora, 0.0)
+            tokens = min(capacidad, tokens + max(0.0, ahora - ultimo) * tasa) - 1
+            con.execute("INSERT OR REPLACE INTO limitadores VALUES (?, ?, ?, ?)", (nombre, tokens, ahora, pausa))
+            return max(0.0, -tokens / tasa, pausa - ahora)
+        return self._transaccion(trabajo)
+
+    def devolver(self, nombre, capacidad):
+        with self.lock:
+            self.con.execute("UPDATE limitadores SET tokens = MIN(?, tokens + 1) WHERE nombre = ?", (capacidad, nombre))
+
+    def pausar(self, nombre, segundos):
+        with self.lock:
+            self.con.execute("UPDATE limitadores SET pausa_hasta = MAX(pausa_hasta, ?) WHERE nombre = ?",
+                             (time.time() + segundos, nombre))
+
+    def tomar_turno(self, nombre, segundos):
+        def trabajo(con):
+            ahora = time.time()
+            fila = con.execute("SELECT dueno, caduca FROM turnos WHERE nombre = ?", (nombre,)).fetchone()
+            if fila and fila[0] != _dueno() and fila[1] > ahora:
+                return False
+            con.execute("INSERT OR REPLACE INTO turnos VALUES (?, ?, ?)", (nombre, _dueno(), ahora + segundos))
+            return True
+        return self._transaccion(trabajo)
+
+    def soltar_turno(self, nombre):
+        with self.lock:
+            self.con.execute("DELETE FROM turnos WHERE nombre = ? AND dueno = ?", (nombre, _dueno()))
+
+    def pool_agregar(self, tema, preguntas, capacidad):
+        def trabajo(con):
+            libres = capacidad - con.execute("SELECT COUNT(*) FROM pool WHERE tema = ?", (tema,)).fetchone()[0]
+            agregadas = 0
+            for pid, texto in preguntas:
+                if agregadas >= libres:
+                    break
+                agregadas += con.execute("INSERT OR IGNORE INTO pool (tema, pid, pregunta) VALUES (?, ?, ?)",
+                                         (tema, pid, texto)).rowcount
+            return agregadas
+        return self._transaccion(trabajo)
+
+    def pool_tomar(self, temas, n, vistas, usos_max):
+        def trabajo(con):
+            listas, filas = {}, {}
+            for tema in temas:
+                for pid, texto, usos in con.execute(
+                        "SELECT pid, pregunta, usos FROM pool WHERE tema = ? ORDER BY id", (tema,)):
+                    listas.setdefault(tema, []).append(pid)
+                    filas[(tema, pid)] = (texto, usos)
+            elegidas = _elegir(listas, n, vistas)
+            for tema, pid in elegidas:
+                if filas[(tema, pid)][1] + 1 >= usos_max:
+                    con.execute("DELETE FROM pool WHERE tema = ? AND pid = ?", (tema, pid))
+                else:
+                    con.execute("UPDATE pool SET usos = usos + 1 WHERE tema = ? AND pid = ?", (tema, pid))
+            return [filas[e][0] for e in elegidas]
+        return self._transaccion(trabajo)
+
+    def pool_niveles(self, temas):
+        with self.lock:
+            filas = dict(self.con.execute("SELECT tema, COUNT(*) FROM pool GROUP BY tema").fetchall())
+        return {tema: filas.get(tema, 0) for tema in temas}
+
+
+# Token bucket atómico en el servidor; el reloj es TIME de Redis (el mismo para todos los nodos)
+_LUA_RESERVAR = """
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local tasa, capacidad = tonumber(ARGV[1]), tonumber(ARGV[2])
+local v = redis.call('HMGET', KEYS[1], 'tokens', 'ultimo', 'pausa')
+local tokens = tonumber(v[1]) or capacidad
+local ultimo = tonumber(v[2]) or ahora
+local pausa = tonumber(v[3]) or 0
+tokens = math.min(capacidad, tokens + math.max(0, ahora - ultimo) * tasa) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ultimo', ahora, 'pausa', pausa)
+return tostring(math.max(0, -tokens / tasa, pausa - ahora))
+"""
+_LUA_DEVOLVER = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then redis.call('HSET', KEYS[1], 'tokens', math.min(tonumber(ARGV[1]), tokens + 1)) end
+"""
+_LUA_PAUSAR = """
+local t = redis.call('TIME')
+local hasta = tonumber(t[1]) + tonumber(t[2]) / 1e6 + tonumber(ARGV[1])
+local pausa = tonumber(redis.call('HGET', KEYS[1], 'pausa')) or 0
+if hasta > pausa then redis.call('HSET', KEYS[1], 'pausa', hasta) end
+"""
+_LUA_SOLTAR = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then redis.call('DEL', KEYS[1]) end
+"""
+
+
+class _Redis:
+    """ Réplicas en varios nodos. El pool es un hash por tema (pid -> pregunta) más un ZSET para el orden. """
+
+    def __init__(self, url):
+        import redis
+
+        self.r = redis.Redis.from_url(url, decode_responses=True, socket_timeout=2)
+        self.errores_conexion = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+        self.r.ping()
+        self.reservar_lua = self.r.register_script(_LUA_RESERVAR)
+        self.devolver_lua = self.r.register_script(_LUA_DEVOLVER)
+        self.pausar_lua = self.r.register_script(_LUA_PAUSAR)
+        self.soltar_lua = self.r.register_script(_LUA_SOLTAR)
+
+    def obtener(self, clave):
+        return self.r.get(PREFIJO + clave)
+
+    def guardar(self, clave, valor, ttl):
+        return bool(self.r.set(PREFIJO + clave, valor, ex=max(1, int(ttl))))
+
+    def reservar(self, nombre, tasa, capacidad):
+        return float(self.reservar_lua(keys=[f"{PREFIJO}limitador:{nombre}"], args=[tasa, capacidad]))
+
+    def devolver(self, nombre, capacidad):
+        self.devolver_lua(keys=[f"{PREFIJO}limitador:{nombre}"], args=[capacidad])
+
+    def pausar(self, nombre, segundos):
+        self.pausar_lua(keys=[f"{PREFIJO}limitador:{nombre}"], args=[segundos])
+
+    def tomar_turno(self, nombre, segundos):
+        clave = f"{PREFIJO}turno:{nombre}"
+        if self.r.set(clave, _dueno(), nx=True, px=int(segundos * 1000)):
+            return True
+        return self.r.get(clave) == _dueno()
+
+    def soltar_turno(self, nombre):
+        self.soltar_lua(keys=[f"{PREFIJO}turno:{nombre}"], args=[_dueno()])
+
+    def _claves(self, tema):
+        return f"{PREFIJO}pool:{tema}", f"{PREFIJO}pool_orden:{tema}", f"{PREFIJO}pool_usos:{tema}"
+
+    def pool_agregar(self, tema, preguntas, capacidad):
+        datos, orden, _ = self._claves(tema)
+        agregadas = 0
+        for pid, texto in preguntas:
+            if self.r.zcard(orden) >= capacidad:
+                break
+            if self.r.hsetnx(datos, pid, texto):
+                self.r.zadd(orden, {pid: time.time()})
+                agregadas += 1
+        return agregadas
+
+    def pool_tomar(self, temas, n, vistas, usos_max):
+        # Sin transacción: dos réplicas pueden servir la misma pregunta a la vez y pasarse de usos por poco
+        listas = {tema: self.r.zrange(self._claves(tema)[1], 0, -1) for tema in temas}
+        elegidas = []
+        for tema, pid in _elegir(listas, n, vistas):
+            datos, orden, usos = self._claves(tema)
+            texto = self.r.hget(datos, pid)
+            if texto is None:
+                continue
+            if self.r.hincrby(usos, pid, 1) >= usos_max:
+                self.r.zrem(orden, pid)
+                self.r.hdel(datos, pid)
+                self.r.hdel(usos, pid)
+            elegidas.append(texto)
+        return elegidas
+
+    def pool_niveles(self, temas):
+        return {tema: self.r.zcard(self._claves(tema)[1]) for tema in temas}
+
+
+def _obtener_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if URL.startswith(("redis://", "rediss://", "unix://")):
+                    _backend = _Redis(URL)
+                else:
+                    _backend = _SQLite(URL[len("sqlite:///"):] if URL.startswith("sqlite:///") else URL)
+    return _backend
+
+
+def _desconectar(backend):
+    """ Descarta el backend caído y pausa los reintentos REINTENTO_SEGUNDOS. """
+    global _backend, _caido_hasta
+    with _lock:
+        if _backend is backend:
+            _backend = None
+        _caido_hasta = time.monotonic() + REINTENTO_SEGUNDOS
+        _stats["desconexiones"] += 1
+
+
+def _llamar(metodo, *args):
+    """ Ejecuta la operación en el backend; None si no hay estado compartido, falló o está en pausa tras caerse. """
+    if not URL or time.monotonic() < _caido_hasta:
+        return None
+    backend = None
+    try:
+        backend = _obtener_backend()
+        return getattr(backend, metodo)(*args)
+    except Exception as e:
+        _sumar("errores")
+        # Sin backend: falló la conexión al crearlo
+        if backend is None or isinstance(e, backend.errores_conexion):
+            _desconectar(backend)
+            print(f"Aviso: estado compartido no disponible ({metodo}), se reintenta en {REINTENTO_SEGUNDOS:g} s {e}")
+        else:
+            print(f"Aviso: estado compartido no disponible ({metodo}) {e}")
+        return None
+
+
+# --- Valores con caducidad ---
+
+def obtener(clave):
+    """ Valor JSON guardado por cualquier réplica, o None. """
+    texto = _llamar("obtener", clave)
+    _sumar("lecturas")
+    if texto is None:
+        return None
+    _sumar("aciertos")
+    return json.loads(texto)
+
+
+def guardar(clave, valor, ttl):
+    if _llamar("guardar", clave, json.dumps(valor, ensure_ascii=False), ttl):
+        _sumar("escrituras")
+
+
+# --- Cuota global ---
+
+def reservar(nombre, tasa, capacidad):
+    """ Segundos a esperar por un token del bucket compartido `nombre`; None si no hay estado compartido. """
+    espera = _llamar("reservar", nombre, tasa, capacidad)
+    if espera is not None:
+        _sumar("reservas")
+    return espera
+
+
+def devolver(nombre, capacidad):
+    _llamar("devolver", nombre, capacidad)
+
+
+def pausar(nombre, segundos):
+    _llamar("pausar", nombre, segundos)
+
+
+# --- Turnos (una réplica a la vez) ---
+
+def tomar_turno(nombre, segundos):
+    """ True si esta réplica se queda el turno `nombre` (caduca solo a los `segundos`). Sin estado compartido, siempre True. """
+    return _llamar("tomar_turno", nombre, segundos) is not False
+
+
+def soltar_turno(nombre):
+    _llamar("soltar_turno", nombre)
+
+
+# --- Pool del quiz ---
+
+def pool_agregar(tema, preguntas, capacidad):
+    """ preguntas: [(pid, dict)]; añade las que no estén hasta la capacidad. Devuelve cuántas entraron. """
+    return _llamar("pool_agregar", tema, [(pid, json.dumps(p, ensure_ascii=False)) for pid, p in preguntas], capacidad)
+
+
+def pool_tomar(temas, n, vistas, usos_max):
+    """ Hasta n preguntas no vistas repartidas entre los temas (actualiza `vistas`); None si falló. """
+    # Sobre una copia: si la transacción falla, `vistas` queda como estaba para la vía local
+    nuevas = set(vistas)
+    textos = _llamar("pool_tomar", list(temas), n, nuevas, usos_max)
+    if textos is None:
+        return None
+    vistas.update(nuevas)
+    return [json.loads(t) for t in textos]
+
+
+def pool_niveles(temas):
+    """ {tema: preguntas disponibles en el pool compartido} o None. """
+    return _llamar("pool_niveles", list(temas))
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_stats)
+    datos["backend"] = URL.split("://")[0] if "://" in URL else ("sqlite" if URL else "ninguno")
+    return datos
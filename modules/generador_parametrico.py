@@ -0,0 +1,337 @@
+"""
+Generador local de ejercicios por plantillas con parámetros aleatorios.
+
+Para los temas formulaicos (integración por partes, fracciones parciales,
+EDO separables y lineales) produce preguntas en el mismo esquema que el
+Quiz (`pregunta`, `opciones` "A) ...", `respuesta_correcta`,
+`explicacion`) sin llamar a la IA. Cada plantilla tiene varias formas
+(p. ej. por partes con e^{ax}, sin(ax) o cos(ax); EDO lineales con
+término independiente constante, lineal o exponencial), así que da
+miles de ejercicios distintos. Los distractores salen de errores
+típicos (signo, factor olvidado, término omitido). Los parámetros se
+sortean, deduplican y barajan en lote con NumPy (importado al generar,
+no al arrancar); solo se formatean los ítems que se devuelven.
+"""
+import math
+import unicodedata
+
+LETRAS = ("A", "B", "C", "D")
+
+
+# --- Formato LaTeX ---
+
+def _frac(num, den):
+    """ num/den reducido, en LaTeX ("\\frac{1}{3}", "-2", "-\\frac{1}{4}"). """
+    g = math.gcd(int(num), int(den)) or 1
+    num, den = num // g, den // g
+    if den < 0:
+        num, den = -num, -den
+    if den == 1:
+        return str(num)
+    signo = "-" if num < 0 else ""
+    return f"{signo}\\frac{{{abs(num)}}}{{{den}}}"
+
+
+def _con_signo(termino):
+    """ Para encadenar términos: "+ x" / "- x". """
+    return f"- {termino[1:]}" if termino.startswith("-") else f"+ {termino}"
+
+
+def _coef(num, den, cuerpo):
+    """ Coeficiente delante de una expresión (omite el 1). """
+    texto = _frac(num, den)
+    if texto == "1":
+        return cuerpo
+    if texto == "-1":
+        return f"-{cuerpo}"
+    return f"{texto}{cuerpo}"
+
+
+def _monomio(coef, cuerpo):
+    return "" if coef == 0 else _coef(coef, 1, cuerpo)
+
+
+def _sin_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFD", texto.lower()) if unicodedata.category(c) != "Mn")
+
+
+# --- Plantillas ---
+# Cada una: un muestreador (rng, n) -> arreglo (n, k) de enteros, cuya
+# primera columna elige la forma del enunciado, y un formateador
+# fila -> (enunciado, correcta, distractores, explicación).
+
+def _potencia(m):
+    return "x" if m == 1 else f"x^{m}"
+
+
+def _lineal(m, b):
+    """ "mx + b" (sin paréntesis). """
+    return f"{_monomio(m, 'x')} {_con_signo(str(b))}" if b else _monomio(m, "x")
+
+
+def _por_lineal(num, den, m, b, cuerpo):
+    """ (num/den)(mx + b)·cuerpo en LaTeX; con b = 0, (num·m/den) x·cuerpo. """
+    if b:
+        return _coef(num, den, f"({_lineal(m, b)}){cuerpo}")
+    return _coef(num * m, den, f"x{cuerpo}")
+
+
+def _sumando(num, den):
+    """ " + num/den" para encadenar, o "" si es 0. """
+    return f" {_con_signo(_frac(num, den))}" if num else ""
+
+
+def _muestrear_por_partes(rng, n):
+    import numpy as np
+
+    forma = rng.integers(0, 3, size=n)
+    a = rng.choice(np.r_[-12:-1, 2:13], size=n)
+    return np.column_stack((
+        forma,
+        # Seno y coseno con a > 0: sin(-ax) sería el mismo ejercicio con otro signo
+        np.where(forma > 0, np.abs(a), a),
+        rng.choice(np.r_[-9:0, 1:10], size=n),
+        rng.integers(-15, 16, size=n),
+    ))
+
+
+def _por_partes(forma, a, m, b):
+    # ∫ (mx + b) g(ax) dx con u = mx + b y g = e^{ax} (forma 0), sin(ax) (1) o cos(ax) (2)
+    lineal = _lineal(m, b)
+    factor = f"({lineal})" if b else lineal
+    if forma == 0:
+        # = e^{ax} ((m/a) x + (ab - m)/a²) + C; |a| >= 2, así que m/a nunca es m.
+        g = f"e^{{{a}x}}"
+        v = _coef(1, a, g)
+        correcta = f"{g}\\left({_coef(m, a, 'x')}{_sumando(a * b - m, a * a)}\\right) + C"
+        distractores = [
+            f"{g}\\left({_coef(m, a, 'x')}{_sumando(a * b + m, a * a)}\\right) + C",
+            f"{g}\\left({_coef(m, a, 'x')}{_sumando(b, a)}\\right) + C",
+            f"{g}\\left({_monomio(m, 'x')}{_sumando(a * b - m, a)}\\right) + C",
+        ]
+    else:
+        # sin: -(mx + b) cos(ax)/a + m sin(ax)/a²;  cos: (mx + b) sin(ax)/a + m cos(ax)/a²
+        seno, coseno = f"\\sin({a}x)", f"\\cos({a}x)"
+        g, otra, signo = (seno, coseno, -1) if forma == 1 else (coseno, seno, 1)
+        v = _coef(signo, a, otra)
+        primero = _por_lineal(signo, a, m, b, otra)
+        correcta = f"{primero} {_con_signo(_coef(m, a * a, g))} + C"
+        distractores = [
+            f"{_por_lineal(-signo, a, m, b, otra)} {_con_signo(_coef(m, a * a, g))} + C",
+            f"{primero} + C",
+            f"{primero} {_con_signo(_coef(-m, a * a, g))} + C",
+        ]
+    return (
+        f"Calcule $\\int {factor} {g}\\,dx$",
+        correcta,
+        distractores,
+        f"Por partes con $u = {lineal}$ y $dv = {g}\\,dx$: $du = {m}\\,dx$, $v = {v}$, "
+        f"y la integral que queda, $\\int v\\,du$, es inmediata.",
+    )
+
+
+def _muestrear_fracciones(rng, n):
+    import numpy as np
+
+    forma = rng.integers(0, 2, size=2 * n)
+    p = rng.integers(-12, 13, size=2 * n)
+    # |p - q| >= 2: con p - q = ±1 el distractor "sin dividir por p - q" coincidiría con otra opción.
+    q = p + rng.choice(np.r_[-9:-1, 2:10], size=2 * n)
+    c = np.where(forma == 0, rng.integers(1, 10, size=2 * n), rng.integers(-12, 13, size=2 * n))
+    # Numerador x - c: sin c = p ni c = q (se simplificaría) ni A = B (c en el punto medio)
+    validas = (forma == 0) | ((c != p) & (c != q) & (2 * c != p + q))
+    return np.column_stack((forma, p, q, c))[validas][:n]
+
+
+def _fracciones_parciales(forma, p, q, c):
+    # ∫ N(x) / ((x - p)(x - q)) dx = A ln|x - p| + B ln|x - q| + C,
+    # A = N(p)/(p - q), B = N(q)/(q - p), con N(x) = c (forma 0) o x - c (forma 1)
+    d = p - q
+    fp = f"(x {_con_signo(str(-p))})" if p else "x"
+    fq = f"(x {_con_signo(str(-q))})" if q else "x"
+    lp = f"\\ln|{fp.strip('()')}|"
+    lq = f"\\ln|{fq.strip('()')}|"
+
+    def logaritmos(num_a, num_b, den=d):
+        return f"{_coef(num_a, den, lp)} {_con_signo(_coef(num_b, den, lq))} + C"
+
+    if forma == 0:
+        numerador, num_a, num_b = str(c), c, -c
+        # Olvidar dividir por p - q
+        erronea = logaritmos(c, -c, 1)
+    else:
+        numerador, num_a, num_b = (f"x {_con_signo(str(-c))}" if c else "x"), p - c, c - q
+        # A y B intercambiados
+        erronea = logaritmos(num_b, num_a)
+    return (
+        f"Calcule $\\int \\frac{{{numerador}}}{{{fp}{fq}}}\\,dx$",
+        logaritmos(num_a, num_b),
+        [
+            logaritmos(-num_a, -num_b),
+            erronea,
+            f"\\ln|{fp}{fq}| + C",
+        ],
+        f"Fracciones parciales: $\\frac{{{numerador}}}{{{fp}{fq}}} = \\frac{{A}}{{{fp.strip('()')}}} + "
+        f"\\frac{{B}}{{{fq.strip('()')}}}$ con $A = {_frac(num_a, d)}$, $B = {_frac(num_b, d)}$.",
+    )
+
+
+def _muestrear_separable(rng, n):
+    import numpy as np
+
+    return np.column_stack((
+        rng.integers(0, 5, size=n),
+        rng.choice(np.r_[-12:0, 1:13], size=n),
+        rng.integers(-15, 16, size=n),
+    ))
+
+
+def _edo_separable(forma, k, c):
+    # y' = (k g(x) + c) y  ->  y = C e^{G(x) + c x}, con g = x^m (m = forma + 1), cos x (forma 3) o sin x (4)
+    cola = f" {_con_signo(_monomio(c, 'x'))}" if c else ""
+    if forma < 3:
+        m = forma + 1
+        termino = _monomio(k, _potencia(m))
+        primitiva = _coef(k, m + 1, _potencia(m + 1))
+        # Olvidar dividir por el nuevo exponente
+        erronea = _monomio(k, _potencia(m + 1))
+    elif forma == 3:
+        termino = _monomio(k, "\\cos(x)")
+        primitiva = _monomio(k, "\\sin(x)")
+        # Signo de la primitiva del coseno
+        erronea = _monomio(-k, "\\sin(x)")
+    else:
+        termino = _monomio(k, "\\sin(x)")
+        primitiva = _monomio(-k, "\\cos(x)")
+        erronea = _monomio(k, "\\cos(x)")
+    factor = f"({termino} {_con_signo(str(c))})" if c else termino
+    exponente = primitiva + cola
+    return (
+        f"Resuelva la EDO $y' = {factor}y$",
+        f"y = Ce^{{{exponente}}}",
+        [
+            f"y = Ce^{{{erronea}{cola}}}",
+            f"y = Ce^{{{termino}{f' {_con_signo(str(c))}' if c else ''}}}",
+            f"y = {exponente} + C",
+        ],
+        f"Variables separables: $\\frac{{dy}}{{y}} = {factor}\\,dx \\Rightarrow \\ln|y| = {exponente} + K$.",
+    )
+
+
+def _muestrear_lineal(rng, n):
+    import numpy as np
+
+    forma = rng.integers(0, 3, size=n)
+    a = rng.choice(np.r_[-12:0, 1:13], size=n)
+    r = rng.choice(np.r_[-5:0, 1:6], size=n)
+    # r = -a es resonancia (la particular sería b x e^{-ax}): se cambia de signo
+    r = np.where(r == -a, -r, r)
+    return np.column_stack((
+        forma,
+        a,
+        rng.choice(np.r_[-30:0, 1:31], size=n),
+        np.where(forma == 2, r, 0),
+    ))
+
+
+def _edo_lineal(forma, a, b, r):
+    # y' + ay = q(x)  ->  y = y_p + C e^{-ax}, con q = b (y_p = b/a), bx (y_p = (b/a)x - b/a²)
+    # o b e^{rx} (y_p = b/(a + r) e^{rx})
+    exp_ok = f"e^{{{_monomio(-a, 'x')}}}"
+    exp_mal = f"e^{{{_monomio(a, 'x')}}}"
+    if forma == 0:
+        q, particular = str(b), _frac(b, a)
+        # Signo de la particular
+        erronea = _frac(-b, a)
+    elif forma == 1:
+        q, particular = _monomio(b, "x"), f"{_coef(b, a, 'x')} {_con_signo(_frac(-b, a * a))}"
+        # Sin el término constante de la particular
+        erronea = _coef(b, a, "x")
+    else:
+        exp_r = f"e^{{{_monomio(r, 'x')}}}"
+        q, particular = _coef(b, 1, exp_r), _coef(b, a + r, exp_r)
+        # Dividir por a en vez de por a + r
+        erronea = _coef(b, a, exp_r)
+    return (
+        f"Resuelva la EDO lineal $y' {_con_signo(_monomio(a, 'y'))} = {q}$",
+        f"y = {particular} + C{exp_ok}",
+        [
+            f"y = {particular} + C{exp_mal}",
+            f"y = {erronea} + C{exp_ok}",
+            f"y = C{exp_ok}",
+        ],
+        f"Factor integrante $\\mu(x) = {exp_mal}$; la solución particular es $y_p = {particular}$.",
+    )
+
+
+PLANTILLAS = {
+    "por_partes": (_muestrear_por_partes, _por_partes),
+    "fracciones_parciales": (_muestrear_fracciones, _fracciones_parciales),
+    "edo_separable": (_muestrear_separable, _edo_separable),
+    "edo_lineal": (_muestrear_lineal, _edo_lineal),
+}
+
+
+def plantilla_para_tema(tema):
+    """ Nombre de la plantilla que cubre el tema (por palabras clave) o None. """
+    texto = _sin_acentos(tema)
+    if "partes" in texto:
+        return "por_partes"
+    if "fracciones" in texto:
+        return "fracciones_parciales"
+    if "separable" in texto:
+        return "edo_separable"
+    if "lineal" in texto and ("edo" in texto or "diferencial" in texto):
+        return "edo_lineal"
+    return None
+
+
+def _armar(filas, formatear, tema, rng):
+    """ Baraja las opciones (en lote) y construye los dicts del esquema del Quiz. """
+    import numpy as np
+
+    permutaciones = rng.permuted(np.tile(np.arange(4), (len(filas), 1)), axis=1)
+    preguntas = []
+    for fila, orden in zip(filas.tolist(), permutaciones.tolist()):
+        enunciado, correcta, distractores, explicacion = formatear(*fila)
+        textos = [correcta] + distractores
+        letra = LETRAS[orden.index(0)]
+        preguntas.append({
+            "pregunta": enunciado,
+            "opciones": [f"{LETRAS[i]}) ${textos[j]}$" for i, j in enumerate(orden)],
+            "respuesta_correcta": f"{letra}) ${correcta}$",
+            "explicacion": explicacion,
+            "tema": tema,
+            "origen": "parametrico",
+        })
+    return preguntas
+
+
+def generar(tema, n, semilla=None):
+    """ Hasta n preguntas distintas del tema ([] si el tema no tiene plantilla). """
+    import numpy as np
+
+    nombre = plantilla_para_tema(tema)
+    if nombre is None or n <= 0:
+        return []
+    muestrear, formatear = PLANTILLAS[nombre]
+    rng = np.random.default_rng(semilla)
+    # Se sortea de más y se deduplica por parámetros antes de formatear.
+    filas = np.unique(muestrear(rng, n * 2), axis=0)
+    filas = rng.permutation(filas)[:n]
+    return _armar(filas, formatear, tema, rng)
+
+
+def generar_para_temas(temas, n, semilla=None):
+    """ Reparte n preguntas al azar entre los temas que tienen plantilla. """
+    import numpy as np
+
+    soportados = [t for t in temas if plantilla_para_tema(t)]
+    if not soportados or n <= 0:
+        return []
+    rng = np.random.default_rng(semilla)
+    cuotas = np.bincount(rng.integers(0, len(soportados), size=n), minlength=len(soportados))
+    preguntas = []
+    for tema, cuota in zip(soportados, cuotas.tolist()):
+        preguntas.extend(generar(tema, cuota, rng))
+    return preguntas
@@ -0,0 +1,380 @@
+"""
+Gráficos de regiones (áreas) y sólidos de revolución.
+
+A partir del enunciado en LaTeX se extraen las curvas (y = ..., f(x) = ...),
+los límites (x = a, [a, b], \\int_a^b o las intersecciones) y el eje de
+giro. Las curvas pasan por `latex_expr` (lista blanca) y se evalúan con
+NumPy; nunca se ejecuta código escrito por la IA. El render usa el backend
+Agg en un hilo aparte y los PNG se guardan en una caché direccionada por
+contenido: el mismo problema, aunque esté redactado distinto, no se vuelve
+a dibujar. La caché en disco es un LRU por fecha de uso: como mucho
+MAX_DISCO PNG y ninguno sin usar en más de TTL_DISCO.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from modules import latex_expr, telemetria
+from modules.latex_expr import ErrorLatex, SYMPY_DISPONIBLE
+
+VERSION_GRAFICOS = "graficos-v1"
+RUTA_GRAFICOS = os.environ.get("TUTOR_GRAFICOS_RUTA", os.path.join(".cache", "graficos"))
+PUNTOS = 400
+PUNTOS_GIRO = 48
+RANGO_BUSQUEDA = (-10.0, 10.0)
+MAX_RECIENTES = 256
+MAX_DISCO = int(os.environ.get("TUTOR_GRAFICOS_MAX", 1000))
+TTL_DISCO = float(os.environ.get("TUTOR_GRAFICOS_TTL_DIAS", 30)) * 24 * 3600
+
+_RE_TEXTO = re.compile(r"\\(?:text|mathrm|textbf)\{([^{}]*)\}")
+_RE_CURVA = re.compile(
+    r"(?<![A-Za-z\\])(?:y|[fgh]\s*\(\s*x\s*\))\s*=\s*"
+    # La curva termina en una coma, un \quad o la siguiente palabra en castellano ("y", "entre", "girando"...).
+    r"(.+?)(?=\s*(?:,|;|\\quad|\\qquad|\s(?:y|e|[a-záéíóúñ]{2,})(?![A-Za-z(])|\.\s|\.?$))"
+)
+_RE_VERTICAL = re.compile(r"(?<![A-Za-z\\])x\s*=\s*(-?\s*[0-9.]+|-?\s*\\frac\{[^{}]+\}\{[^{}]+\}|-?\s*\\pi)")
+_RE_INTERVALO = re.compile(r"\[\s*(-?[0-9.]+|-?\\pi)\s*,\s*(-?[0-9.]+|-?\\pi)\s*\]")
+_RE_INTEGRAL = re.compile(r"\\int_\s*\{?([^{}\s^]+)\}?\s*\^\s*\{?([^{}\s]+)\}?\s*(.+?)\s*(?:\\[,;!]\s*)*d\s*x(?![A-Za-z])")
+_RE_GIRO = re.compile(
+    r"(?:alrededor|en\s+torno)[^=]*?(?:eje\s*(?:de\s*las?\s*)?(x|y)(?![A-Za-z])|(?<![A-Za-z\\])(x|y)\s*=\s*(-?[0-9.]+))"
+)
+_RE_VOLUMEN = re.compile(r"volumen|revoluci|s[oó]lido|alrededor")
+_RE_AREA = re.compile(r"[aá]rea|regi[oó]n|excedente|limitad|encerrad")
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graficos")
+_recientes = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "renders": 0, "sin_grafico": 0, "errores": 0, "podados": 0}
+
+
+# --- Interpretación del enunciado ---
+
+def _valor(latex):
+    return float(latex_expr.a_sympy(latex).evalf())
+
+
+def _curva(latex):
+    """ Expresión SymPy en x (o constante) o None si no se entiende. """
+    try:
+        expr = latex_expr.a_sympy(latex)
+    except ErrorLatex:
+        return None
+    return expr if {s.name for s in expr.free_symbols} <= {"x"} else None
+
+
+def _limpiar(enunciado):
+    texto = _RE_TEXTO.sub(r" \1 ", (enunciado or "").replace("$", " "))
+    return re.sub(r"\\[,;:! ]", " ", texto)
+
+
+def _intersecciones(funciones):
+    """ Raíces de f - g (o de f si hay una sola curva) sobre una malla en RANGO_BUSQUEDA. """
+    import numpy as np
+
+    xs = np.linspace(*RANGO_BUSQUEDA, 4001)
+    ys = [_evaluar(f, xs) for f in funciones] if len(funciones) > 1 else [_evaluar(funciones[0], xs), np.zeros_like(xs)]
+    raices = []
+    for i in range(len(ys)):
+        for j in range(i + 1, len(ys)):
+            d = ys[i] - ys[j]
+            validos = np.isfinite(d[:-1]) & np.isfinite(d[1:])
+            cambio = np.nonzero(validos & (np.sign(d[:-1]) != np.sign(d[1:])))[0]
+            # Interpolación lineal dentro de cada tramo con cambio de signo.
+            raices.extend((xs[cambio] - d[cambio] * (xs[cambio + 1] - xs[cambio]) / (d[cambio + 1] - d[cambio])).tolist())
+    return sorted({round(r, 6) for r in raices})
+
+
+def extraer_problema(enunciado, tema=""):
+    """
+    Especificación del gráfico o None si el enunciado no describe un área o
+    un volumen dibujable: {"tipo", "funciones", "a", "b", "eje"}.
+    """
+    if not SYMPY_DISPONIBLE:
+        return None
+    texto = _limpiar(enunciado)
+    contexto = f"{tema} {texto}".lower()
+    if _RE_VOLUMEN.search(contexto):
+        tipo = "volumen"
+    elif _RE_AREA.search(contexto):
+        tipo = "area"
+    else:
+        return None
+
+    eje = None
+    giro = _RE_GIRO.search(texto) if tipo == "volumen" else None
+    if giro:
+        if giro.group(1):
+            eje = [giro.group(1), 0.0]
+        else:
+            # "y = c" es una recta horizontal (giro paralelo al eje x) y viceversa.
+            eje = ["x" if giro.group(2) == "y" else "y", float(giro.group(3))]
+    elif tipo == "volumen":
+        eje = ["x", 0.0]
+
+    funciones = []
+    for m in _RE_CURVA.finditer(texto):
+        if giro and m.start() >= giro.start() and m.start() <= giro.end():
+            continue
+        expr = _curva(m.group(1))
+        if expr is not None and expr not in funciones:
+            funciones.append(expr)
+
+    limites = []
+    integral = _RE_INTEGRAL.search(texto)
+    try:
+        limites = [_valor(v) for v in _RE_VERTICAL.findall(texto)]
+        if len(limites) < 2 and (intervalo := _RE_INTERVALO.search(texto)):
+            limites = [_valor(intervalo.group(1)), _valor(intervalo.group(2))]
+        if len(limites) < 2 and integral:
+            limites = [_valor(integral.group(1)), _valor(integral.group(2))]
+    except (ErrorLatex, TypeError, ValueError):
+        limites = []
+    if not funciones and integral:
+        expr = _curva(integral.group(3))
+        if expr is not None:
+            funciones.append(expr)
+    if not funciones:
+        return None
+    if len(limites) < 2:
+        raices = _intersecciones(funciones)
+        if limites:
+            # Un solo "x = c": el otro extremo es la intersección más cercana.
+            otros = [r for r in raices if abs(r - limites[0]) > 1e-6]
+            if not otros:
+                return None
+            limites.append(min(otros, key=lambda r: abs(r - limites[0])))
+        elif len(raices) >= 2:
+            limites = [raices[0], raices[-1]]
+        else:
+            return None
+    a, b = min(limites), max(limites)
+    if b - a < 1e-9:
+        return None
+    return {"tipo": tipo, "funciones": [str(f) for f in funciones], "a": round(a, 6), "b": round(b, 6), "eje": eje}
+
+
+def clave_problema(spec):
+    contenido = json.dumps(spec, sort_keys=True) + "\x1f" + VERSION_GRAFICOS
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+# --- Render (backend Agg, sin pyplot: es seguro fuera del hilo principal) ---
+
+def _evaluar(expr, xs):
+    """ Evalúa en lote con NumPy; lo no real o no finito queda en NaN. """
+    import numpy as np
+    import sympy
+
+    x = sympy.Symbol("x")
+    with np.errstate(all="ignore"):
+        ys = np.asarray(sympy.lambdify(x, expr, "numpy")(xs))
+        if ys.ndim == 0:
+            ys = np.full_like(xs, ys, dtype=ys.dtype if np.iscomplexobj(ys) else float)
+        if np.iscomplexobj(ys):
+            ys = np.where(np.abs(ys.imag) < 1e-12, ys.real, np.nan)
+        ys = ys.astype(float)
+    ys[~np.isfinite(ys)] = np.nan
+    return ys
+
+
+def _etiqueta(expr, con_latex):
+    import sympy
+
+    return f"$y = {sympy.latex(expr)}$" if con_latex else f"y = {expr}"
+
+
+def _dibujar_region(ax, funciones, a, b, con_latex):
+    import numpy as np
+
+    margen = (b - a) * 0.25
+    xs = np.linspace(a - margen, b + margen, PUNTOS)
+    tramo = np.linspace(a, b, PUNTOS)
+    for f in funciones:
+        ax.plot(xs, _evaluar(f, xs), label=_etiqueta(f, con_latex))
+    superior = _evaluar(funciones[0], tramo)
+    inferior = _evaluar(funciones[1], tramo) if len(funciones) > 1 else np.zeros_like(tramo)
+    ax.fill_between(tramo, inferior, superior, alpha=0.3, color="tab:orange")
+    ax.axhline(0, color="0.6", linewidth=0.8)
+    ax.axvline(0, color="0.6", linewidth=0.8)
+    for limite in (a, b):
+        ax.axvline(limite, color="0.4", linestyle="--", linewidth=0.8)
+    ax.set_xlabel("x")
+    ax.set_ylabel("y")
+    ax.legend(loc="best", fontsize=8)
+    ax.grid(alpha=0.3)
+
+
+def _dibujar_solido(ax, funciones, a, b, eje):
+    import numpy as np
+
+    orientacion, c = eje
+    xs = np.linspace(a, b, PUNTOS_GIRO * 2)
+    theta = np.linspace(0, 2 * np.pi, PUNTOS_GIRO)
+    malla_x, malla_t = np.meshgrid(xs, theta)
+    for f, color in zip(funciones[:2], ("tab:blue", "tab:green")):
+        ys = _evaluar(f, xs)
+        if orientacion == "x":
+            # Giro alrededor de la recta y = c: radio |f(x) - c|.
+            radio = np.broadcast_to(ys - c, malla_x.shape)
+            X, Y, Z = malla_x, c + radio * np.cos(malla_t), radio * np.sin(malla_t)
+        else:
+            # Giro alrededor de la recta x = c: cada punto (x, f(x)) describe un círculo de radio |x - c|.
+            radio = malla_x - c
+            X, Y, Z = c + radio * np.cos(malla_t), np.broadcast_to(ys, malla_x.shape), radio * np.sin(malla_t)
+        ax.plot_surface(X, Y, Z, alpha=0.45, color=color, linewidth=0)
+    ax.set_xlabel("x")
+    ax.set_ylabel("y")
+    ax.set_zlabel("z")
+    recta = f"y = {c:g}" if orientacion == "x" else f"x = {c:g}"
+    ax.set_title(f"Giro alrededor de {recta}" if c else f"Giro alrededor del eje {orientacion}", fontsize=9)
+
+
+def _render(spec, con_latex=True):
+    import sympy
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    funciones = [sympy.sympify(f) for f in spec["funciones"]]
+    if spec["tipo"] == "volumen":
+        fig = Figure(figsize=(10, 4))
+        region = fig.add_subplot(1, 2, 1)
+        _dibujar_region(region, funciones, spec["a"], spec["b"], con_latex)
+        orientacion, c = spec["eje"]
+        (region.axhline if orientacion == "x" else region.axvline)(c, color="tab:red", linestyle="-.", linewidth=1)
+        _dibujar_solido(fig.add_subplot(1, 2, 2, projection="3d"), funciones, spec["a"], spec["b"], spec["eje"])
+    else:
+        fig = Figure(figsize=(6, 4))
+        _dibujar_region(fig.add_subplot(1, 1, 1), funciones, spec["a"], spec["b"], con_latex)
+    FigureCanvasAgg(fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=110, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+# --- Caché en disco y cola de render ---
+
+def _ruta(clave):
+    return os.path.join(RUTA_GRAFICOS, f"{clave}.png")
+
+
+def _leer_cache(clave):
+    try:
+        with open(_ruta(clave), "rb") as f:
+            png = f.read()
+    except OSError:
+        return None
+    try:
+        # La fecha de modificación es la del último uso: la poda expulsa primero lo que nadie pide
+        os.utime(_ruta(clave))
+    except OSError:
+        pass
+    return png
+
+
+def _podar_cache():
+    """ Borra los PNG sin usar en TTL_DISCO y, si sobran más de MAX_DISCO, los de uso más antiguo. """
+    entradas = []
+    try:
+        with os.scandir(RUTA_GRAFICOS) as directorio:
+            for entrada in directorio:
+                if entrada.name.endswith(".png"):
+                    try:
+                        entradas.append((entrada.stat().st_mtime, entrada.path))
+                    except OSError:
+                        continue
+    except OSError:
+        return
+    entradas.sort()
+    limite = time.time() - TTL_DISCO
+    sobran = len(entradas) - MAX_DISCO
+    for i, (usado, ruta) in enumerate(entradas):
+        if i >= sobran and usado >= limite:
+            break
+        try:
+            os.remove(ruta)
+            _contar("podados")
+        except OSError:
+            pass
+
+
+def _escribir_cache(clave, png):
+    try:
+        os.makedirs(RUTA_GRAFICOS, exist_ok=True)
+        temporal = f"{_ruta(clave)}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(png)
+        os.replace(temporal, _ruta(clave))
+    except OSError as e:
+        print(f"Aviso: no se pudo guardar el gráfico {e}")
+
+
+def _contar(evento):
+    with _lock:
+        _stats[evento] += 1
+
+
+def generar_png(enunciado, tema=""):
+    """ PNG del problema (desde caché si ya se dibujó) o None si no hay nada que graficar. """
+    try:
+        spec = extraer_problema(enunciado, tema)
+    except Exception as e:
+        print(f"Aviso: no se pudo interpretar el enunciado para graficar {e}")
+        spec = None
+    if spec is None:
+        _contar("sin_grafico")
+        return None
+    clave = clave_problema(spec)
+    png = _leer_cache(clave)
+    if png is not None:
+        _contar("hits")
+        telemetria.cache("graficos", True)
+        return png
+    _contar("misses")
+    telemetria.cache("graficos", False)
+    try:
+        try:
+            png = _render(spec)
+        except ValueError:
+            # Mathtext no entiende alguna etiqueta: se repite con texto plano.
+            png = _render(spec, con_latex=False)
+    except Exception as e:
+        print(f"Aviso: falló el render del gráfico {e}")
+        _contar("errores")
+        return None
+    _contar("renders")
+    _escribir_cache(clave, png)
+    _podar_cache()
+    return png
+
+
+def solicitar(enunciado, tema=""):
+    """
+    Encola el gráfico y devuelve un Future con el PNG (o None). Pedir el
+    mismo enunciado en cada rerun reutiliza el mismo Future.
+    """
+    clave_texto = hashlib.sha256(f"{tema}\x1f{enunciado}".encode("utf-8")).hexdigest()
+    with _lock:
+        futuro = _recientes.get(clave_texto)
+        if futuro is not None:
+            _recientes.move_to_end(clave_texto)
+            return futuro
+        if not SYMPY_DISPONIBLE or not enunciado:
+            futuro = Future()
+            futuro.set_result(None)
+        else:
+            futuro = _executor.submit(generar_png, enunciado, tema)
+        _recientes[clave_texto] = futuro
+        while len(_recientes) > MAX_RECIENTES:
+            _recientes.popitem(last=False)
+        return futuro
+
+
+def estadisticas():
+    with _lock:
+        return dict(_stats)
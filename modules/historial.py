@@ -0,0 +1,237 @@
+"""
+Historial persistente: intentos (quiz, pasos del Dojo, consultas) y
+exámenes terminados, por estudiante.
+
+La interfaz solo encola (`registrar_intento`, `registrar_examen`): un hilo
+escritor agrupa lo pendiente y lo vuelca en una transacción por lote, así
+que ningún rerun espera al disco. En la misma transacción se acumula el
+resumen por tema y día, de modo que "acierto por tema" sobre miles de
+estudiantes es una lectura de pocas filas; los índices por estudiante y
+por tema cubren el resto de consultas.
+"""
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+RUTA_HISTORIAL = os.environ.get("TUTOR_HISTORIAL_RUTA", os.path.join(".cache", "historial.sqlite3"))
+LOTE_MAX = 500
+INTERVALO_VOLCADO = 0.5
+REINTENTOS_LOTE = 5
+SEGUNDOS_DIA = 24 * 3600
+
+_cola = queue.Queue()
+_lock = threading.Lock()
+_lock_lectura = threading.Lock()
+_escritor = None
+_lectura = None
+_stats = {"encolados": 0, "escritos": 0, "lotes": 0, "lote_max": 0, "ms_ultimo_lote": 0.0, "errores": 0, "descartados": 0}
+
+
+def _conectar():
+    carpeta = os.path.dirname(RUTA_HISTORIAL)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    con = sqlite3.connect(RUTA_HISTORIAL, check_same_thread=False, timeout=10)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS intentos (
+            id INTEGER PRIMARY KEY,
+            estudiante TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            tema TEXT NOT NULL,
+            item TEXT NOT NULL,
+            paso INTEGER NOT NULL,
+            respuesta TEXT,
+            acierto INTEGER,
+            puntos REAL NOT NULL,
+            examen TEXT,
+            momento REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_intentos_estudiante ON intentos(estudiante, momento);
+        CREATE INDEX IF NOT EXISTS idx_intentos_tema ON intentos(tema, tipo, momento);
+        CREATE TABLE IF NOT EXISTS examenes (
+            id TEXT PRIMARY KEY,
+            estudiante TEXT NOT NULL,
+            temas TEXT NOT NULL,
+            preguntas INTEGER NOT NULL,
+            aciertos INTEGER NOT NULL,
+            nota REAL NOT NULL,
+            momento REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_examenes_estudiante ON examenes(estudiante, momento);
+        CREATE TABLE IF NOT EXISTS resumen_tema (
+            tema TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            dia INTEGER NOT NULL,
+            intentos INTEGER NOT NULL,
+            aciertos INTEGER NOT NULL,
+            PRIMARY KEY (tema, tipo, dia)
+        ) WITHOUT ROWID;
+    """)
+    return con
+
+
+# --- Escritura (no bloquea: solo encola) ---
+
+def registrar_intento(estudiante, tipo, tema, item, respuesta=None, acierto=None, puntos=0.0, paso=0, examen=None):
+    """
+    Encola un intento. tipo: "quiz", "dojo" o "consulta"; acierto None
+    cuando no hay corrección (p. ej. abrir una consulta).
+    """
+    fila = (estudiante, tipo, tema or "", item or "", int(paso), respuesta,
+            None if acierto is None else int(bool(acierto)), float(puntos or 0), examen, time.time())
+    _encolar(("intento", fila))
+
+
+def registrar_examen(examen, estudiante, temas, preguntas, aciertos, nota):
+    """ Encola el resultado de un examen terminado (repetirlo con el mismo id lo reemplaza). """
+    fila = (examen, estudiante, json.dumps(list(temas), ensure_ascii=False), int(preguntas), int(aciertos),
+            float(nota), time.time())
+    _encolar(("examen", fila))
+
+
+def _encolar(evento):
+    _iniciar_escritor()
+    _cola.put(evento)
+    with _lock:
+        _stats["encolados"] += 1
+
+
+def _escribir(con, lote):
+    intentos = [fila for tipo, fila in lote if tipo == "intento"]
+    examenes = [fila for tipo, fila in lote if tipo == "examen"]
+    resumen = {}
+    for _, tipo, tema, _, _, _, acierto, _, _, momento in intentos:
+        if acierto is not None:
+            clave = (tema, tipo, int(momento // SEGUNDOS_DIA))
+            total, buenos = resumen.get(clave, (0, 0))
+            resumen[clave] = (total + 1, buenos + acierto)
+    with con:
+        con.executemany(
+            "INSERT INTO intentos (estudiante, tipo, tema, item, paso, respuesta, acierto, puntos, examen, momento) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", intentos)
+        con.executemany("INSERT OR REPLACE INTO examenes VALUES (?, ?, ?, ?, ?, ?, ?)", examenes)
+        con.executemany(
+            "INSERT INTO resumen_tema VALUES (?, ?, ?, ?, ?) ON CONFLICT (tema, tipo, dia) DO UPDATE SET "
+            "intentos = intentos + excluded.intentos, aciertos = aciertos + excluded.aciertos",
+            [clave + valor for clave, valor in resumen.items()])
+
+
+def _bucle_escritor():
+    con = None
+    pendientes, marcadores, fallos = [], [], 0
+    while True:
+        # Con un lote fallido pendiente no se espera indefinidamente: se reintenta al cumplirse el intervalo
+        lote = [] if pendientes else [_cola.get()]
+        fin = time.monotonic() + INTERVALO_VOLCADO
+        while len(lote) < LOTE_MAX:
+            try:
+                lote.append(_cola.get(timeout=max(0.0, fin - time.monotonic())))
+            except queue.Empty:
+                break
+        # Los marcadores de `volcar` (Event) se liberan después de escribir lo anterior
+        marcadores.extend(e for e in lote if isinstance(e, threading.Event))
+        pendientes.extend(e for e in lote if not isinstance(e, threading.Event))
+        inicio = time.perf_counter()
+        try:
+            con = con or _conectar()
+            if pendientes:
+                _escribir(con, pendientes)
+            if pendientes:
+                with _lock:
+                    _stats["escritos"] += len(pendientes)
+                    _stats["lotes"] += 1
+                    _stats["lote_max"] = max(_stats["lote_max"], len(pendientes))
+                    _stats["ms_ultimo_lote"] = round((time.perf_counter() - inicio) * 1000, 2)
+            pendientes, fallos = [], 0
+        except (sqlite3.Error, OSError) as e:
+            # Base bloqueada o disco lleno: el lote se conserva y se reintenta con el siguiente
+            fallos += 1
+            with _lock:
+                _stats["errores"] += 1
+                if fallos >= REINTENTOS_LOTE:
+                    _stats["descartados"] += len(pendientes)
+            print(f"Aviso: no se pudo guardar el historial ({len(pendientes)} registros) {e}")
+            if fallos >= REINTENTOS_LOTE:
+                pendientes, fallos = [], 0
+        if not pendientes:
+            for marcador in marcadores:
+                marcador.set()
+            marcadores = []
+
+
+def _iniciar_escritor():
+    global _escritor
+    if _escritor is not None:
+        return
+    with _lock:
+        if _escritor is None:
+            _escritor = threading.Thread(target=_bucle_escritor, name="historial", daemon=True)
+            _escritor.start()
+            # Lo encolado en los últimos milisegundos no se pierde al cerrar el proceso
+            atexit.register(volcar)
+
+
+def volcar(espera=10.0):
+    """ Espera (como mucho `espera` s) a que lo encolado hasta ahora llegue a disco. """
+    if _escritor is None:
+        return True
+    marcador = threading.Event()
+    _cola.put(marcador)
+    return marcador.wait(espera)
+
+
+# --- Consultas ---
+
+def _consultar(sql, parametros=()):
+    global _lectura
+    try:
+        with _lock_lectura:
+            if _lectura is None:
+                _lectura = _conectar()
+            return _lectura.execute(sql, parametros).fetchall()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Aviso: historial no disponible {e}")
+        return []
+
+
+def examenes_de(estudiante, limite=10):
+    """ Últimos exámenes del estudiante, del más reciente al más antiguo. """
+    filas = _consultar(
+        "SELECT id, temas, preguntas, aciertos, nota, momento FROM examenes "
+        "WHERE estudiante = ? ORDER BY momento DESC LIMIT ?", (estudiante, limite))
+    return [{"examen": e, "temas": json.loads(t), "preguntas": p, "aciertos": a, "nota": n, "momento": m}
+            for e, t, p, a, n, m in filas]
+
+
+def intentos_de(estudiante, limite=50, tipo=None):
+    """ Últimos intentos del estudiante (opcionalmente de un solo tipo). """
+    sql = "SELECT tipo, tema, item, paso, respuesta, acierto, puntos, examen, momento FROM intentos WHERE estudiante = ?"
+    parametros = [estudiante]
+    if tipo:
+        sql += " AND tipo = ?"
+        parametros.append(tipo)
+    filas = _consultar(sql + " ORDER BY momento DESC LIMIT ?", parametros + [limite])
+    campos = ("tipo", "tema", "item", "paso", "respuesta", "acierto", "puntos", "examen", "momento")
+    return [dict(zip(campos, fila)) for fila in filas]
+
+
+def acierto_por_tema(dias=30, tipo="quiz"):
+    """ Tasa de acierto por tema en los últimos `dias` (todas las sesiones), desde el resumen diario. """
+    desde = int(time.time() // SEGUNDOS_DIA) - dias + 1
+    filas = _consultar(
+        "SELECT tema, SUM(intentos), SUM(aciertos) FROM resumen_tema WHERE tipo = ? AND dia >= ? "
+        "GROUP BY tema ORDER BY tema", (tipo, desde))
+    return [{"tema": t, "intentos": n, "aciertos": a, "tasa": round(a / n, 3) if n else None} for t, n, a in filas]
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_stats)
+    datos["pendientes"] = _cola.qsize()
+    return datos
@@ -0,0 +1,75 @@
+"""
+Parser JSON incremental para respuestas en streaming de la IA.
+
+Recibe los fragmentos según llegan y entrega cada campo de primer nivel
+del objeto en cuanto está completo (p. ej. `tema_detectado` antes de que
+termine `resultado_final`). Cada campo se decodifica con `limpiar_json`,
+así que hereda la reparación de barras invertidas de LaTeX.
+"""
+from modules.tutor_ia import limpiar_json
+
+
+class ParserIncremental:
+    """ Escáner de un solo paso: recuerda dónde quedó entre fragmentos. """
+
+    def __init__(self):
+        self.texto = ""
+        self.campos = {}
+        self.cerrado = False
+        self._pos = 0
+        self._profundidad = 0
+        self._en_cadena = False
+        self._escape = False
+        self._inicio_miembro = None
+
+    def alimentar(self, fragmento):
+        """ Añade texto y devuelve los campos que se completaron con él. """
+        self.texto += fragmento or ""
+        nuevos = {}
+        texto = self.texto
+        i = self._pos
+        while i < len(texto) and not self.cerrado:
+            c = texto[i]
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_cadena = False
+            elif self._profundidad == 0:
+                # Antes del objeto: ```json, prosa, espacios...
+                if c == "{":
+                    self._profundidad = 1
+                    self._inicio_miembro = i + 1
+            elif c == '"':
+                self._en_cadena = True
+            elif c in "{[":
+                self._profundidad += 1
+            elif c in "}]":
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._cerrar_miembro(i, nuevos)
+                    self.cerrado = True
+            elif c == "," and self._profundidad == 1:
+                self._cerrar_miembro(i, nuevos)
+                self._inicio_miembro = i + 1
+            i += 1
+        self._pos = i
+        return nuevos
+
+    def _cerrar_miembro(self, fin, nuevos):
+        miembro = self.texto[self._inicio_miembro:fin].strip()
+        if not miembro:
+            return
+        datos = limpiar_json("{" + miembro + "}")
+        if isinstance(datos, dict):
+            self.campos.update(datos)
+            nuevos.update(datos)
+
+    def finalizar(self):
+        """ Objeto completo: parseo final del texto entero, o los campos si el objeto cerró. """
+        datos = limpiar_json(self.texto)
+        if datos is not None:
+            return datos
+        return dict(self.campos) if self.cerrado and self.campos else None
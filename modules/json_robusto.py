@@ -0,0 +1,111 @@
+"""
+Extractor JSON tolerante para respuestas de la IA con LaTeX.
+
+Una sola pasada de reparación y un solo `json` decode:
+1. Quita cercas de código (```json ... ```).
+2. Localiza el objeto/arreglo más externo aunque haya prosa alrededor:
+   prueba a decodificar desde cada `{`/`[` y se queda con el que abarca
+   más texto, del tipo esperado si se indica ("[0, 1]" o "{importante}"
+   en la prosa no tapan al JSON de verdad).
+3. Repara en contexto las barras invertidas de LaTeX: `\\int` o `\\sqrt`
+   no son escapes JSON válidos, y `\\frac`, `\\theta`, `\\beta` o
+   `\\right` sí lo son pero significan LaTeX, no control (`\\f`, `\\t`...).
+
+`analizar_json` informa además qué reparaciones aplicó.
+"""
+import json
+import re
+
+_RE_CERCA = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+_RE_ESCAPE = re.compile(r'\\(?:(["\\/])|u([0-9a-fA-F]{4})|([A-Za-z]+)|(.)|$)', re.S)
+_RE_INICIO = re.compile(r"[{\[]")
+_DECODER = json.JSONDecoder()
+# Aperturas que se prueban como máximo (prosa con muchos corchetes)
+MAX_INTENTOS = 64
+
+# Comandos LaTeX que empiezan por n/t: ahí `\n`/`\t` + palabra es ambiguo
+# (salto de línea seguido de texto), así que solo se reparan los conocidos.
+# Con b/f/r + letra siempre es LaTeX: nadie escribe backspace o form feed.
+_COMANDOS_N_T = frozenset({
+    "nabla", "ne", "neq", "nu", "not", "ni", "nleq", "ngeq", "nless", "ngtr", "newline",
+    "nonumber", "nolimits", "neg", "nmid", "nexists", "natural",
+    "theta", "tan", "tanh", "times", "text", "textbf", "textit", "textrm", "tau", "to", "top",
+    "triangle", "tilde", "tfrac", "tag", "therefore", "tiny", "triangleq", "textstyle",
+})
+
+REPARACION_CERCAS = "cercas"
+REPARACION_PROSA = "prosa"
+REPARACION_LATEX = "escapes_latex"
+
+
+def _reparar_escape(coincidencia, contador):
+    literal, hexa, letras, otro = coincidencia.groups()
+    if literal is not None or hexa is not None:
+        return coincidencia.group(0)
+    if letras is not None:
+        primera = letras[0]
+        if primera in "bfnrt":
+            if len(letras) == 1:
+                return coincidencia.group(0)
+            if primera in "nt" and letras not in _COMANDOS_N_T:
+                return coincidencia.group(0)
+        contador[0] += 1
+        return "\\\\" + letras
+    contador[0] += 1
+    return "\\\\" + (otro or "")
+
+
+def _candidatos(texto):
+    """ (datos, inicio, fin) de cada JSON decodificable desde una `{`/`[` que no esté dentro de otro. """
+    encontrados, desde = [], 0
+    for _ in range(MAX_INTENTOS):
+        apertura = _RE_INICIO.search(texto, desde)
+        if apertura is None:
+            break
+        try:
+            datos, fin = _DECODER.raw_decode(texto, apertura.start())
+        except json.JSONDecodeError as e:
+            if e.pos >= len(texto.rstrip()) or e.msg.startswith("Unterminated string"):
+                # JSON cortado: lo que sigue es parte de él, no otro JSON
+                break
+            desde = apertura.start() + 1
+            continue
+        encontrados.append((datos, apertura.start(), fin))
+        desde = fin
+    return encontrados
+
+
+def analizar_json(texto, esperado=None):
+    """
+    Devuelve (datos, reparaciones). `datos` es None si no hay JSON
+    recuperable; `reparaciones` lista lo que se corrigió. Con `esperado`
+    (dict o list) se prefiere un JSON de ese tipo al resto.
+    """
+    reparaciones = []
+    if not texto:
+        return None, reparaciones
+
+    if "```" in texto:
+        cerca = _RE_CERCA.search(texto)
+        if cerca:
+            texto = cerca.group(1)
+            reparaciones.append(REPARACION_CERCAS)
+
+    if _RE_INICIO.search(texto) is None:
+        return None, reparaciones
+
+    if "\\" in texto:
+        contador = [0]
+        texto = _RE_ESCAPE.sub(lambda m: _reparar_escape(m, contador), texto)
+        if contador[0]:
+            reparaciones.append(REPARACION_LATEX)
+
+    candidatos = _candidatos(texto)
+    if esperado is not None and any(isinstance(c[0], esperado) for c in candidatos):
+        candidatos = [c for c in candidatos if isinstance(c[0], esperado)]
+    if not candidatos:
+        return None, reparaciones
+    datos, inicio, fin = max(candidatos, key=lambda c: c[2] - c[1])
+    if texto[:inicio].strip() or texto[fin:].strip():
+        reparaciones.append(REPARACION_PROSA)
+    return datos, reparaciones
@@ -0,0 +1,158 @@
+"""
+Conversión de LaTeX de cálculo (el que escribe la IA) a expresiones SymPy.
+
+No pretende cubrir todo LaTeX: solo lo habitual en Matemáticas III
+(fracciones, raíces, potencias, funciones elementales, valor absoluto,
+integrales y derivadas de y). Lo que no entiende lanza `ErrorLatex`.
+SymPy es opcional: sin él, `SYMPY_DISPONIBLE` es False.
+"""
+import importlib.util
+import re
+
+# SymPy tarda ~0,5 s en importarse: se carga en el primer `a_sympy`, no al arrancar.
+SYMPY_DISPONIBLE = importlib.util.find_spec("sympy") is not None
+
+
+class ErrorLatex(ValueError):
+    """ El LaTeX no se pudo convertir a una expresión. """
+
+
+_ELIMINAR = re.compile(r"\\(?:left|right|displaystyle|textstyle|quad|qquad|limits|bigl|bigr|Bigl|Bigr|big|Big)(?![a-zA-Z])|\\[,;:! ]|\$")
+_FUNCIONES = {
+    "sin": "sin", "cos": "cos", "tan": "tan", "cot": "cot", "sec": "sec", "csc": "csc",
+    "arcsin": "asin", "arccos": "acos", "arctan": "atan", "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+    "ln": "log", "log": "log", "exp": "exp",
+}
+_SIMBOLOS = {
+    "pi": "pi", "cdot": "*", "times": "*", "infty": "oo", "alpha": "alpha", "beta": "beta",
+    "theta": "theta", "lambda": "lamda", "mu": "mu", "omega": "omega", "sigma": "sigma",
+}
+# "e^x" y también "Ce^x" (constante mayúscula pegada a la exponencial).
+_RE_EXP_E = re.compile(r"(?:(?<![A-Za-z_])|(?<=[A-Z]))e\s*\^")
+_RE_ABS = re.compile(r"\|([^|]+)\|")
+_RE_ATOMO = re.compile(r"\s*([0-9.]*[A-Za-z](?![A-Za-z])|[0-9.]+)")
+_RE_CARACTERES_SEGUROS = re.compile(r"[A-Za-z0-9_ .+\-*/^(),]*")
+_RE_IDENTIFICADOR = re.compile(r"[A-Za-z_][A-Za-z_0-9]*")
+_RE_SIMBOLO_CORTO = re.compile(r"[A-Za-z]{1,2}(_[0-9])?")
+_NOMBRES_PERMITIDOS = frozenset(
+    set(_FUNCIONES.values()) | set(_SIMBOLOS.values()) | {"sqrt", "Abs", "E", "oo"}
+)
+
+
+def _leer_grupo(texto, i):
+    """ Lee un argumento {…} (o un solo carácter) desde i; devuelve (contenido, nueva_pos). """
+    while i < len(texto) and texto[i] == " ":
+        i += 1
+    if i >= len(texto):
+        raise ErrorLatex("Falta un argumento")
+    if texto[i] != "{":
+        return texto[i], i + 1
+    profundidad, j = 0, i
+    while j < len(texto):
+        if texto[j] == "{":
+            profundidad += 1
+        elif texto[j] == "}":
+            profundidad -= 1
+            if profundidad == 0:
+                return texto[i + 1:j], j + 1
+        j += 1
+    raise ErrorLatex("Llaves desbalanceadas")
+
+
+def _traducir(texto):
+    """ LaTeX -> sintaxis de SymPy (con ^ y multiplicación implícita). """
+    salida = []
+    i = 0
+    while i < len(texto):
+        c = texto[i]
+        if c == "\\":
+            m = re.match(r"\\([a-zA-Z]+)", texto[i:])
+            if not m:
+                raise ErrorLatex(f"Comando desconocido en {texto[i:i + 10]!r}")
+            comando = m.group(1)
+            i += len(m.group(0))
+            if comando in ("frac", "dfrac", "tfrac"):
+                num, i = _leer_grupo(texto, i)
+                den, i = _leer_grupo(texto, i)
+                salida.append(f"(({_traducir(num)})/({_traducir(den)}))")
+            elif comando == "sqrt":
+                indice = None
+                if i < len(texto) and texto[i] == "[":
+                    fin = texto.index("]", i)
+                    indice, i = texto[i + 1:fin], fin + 1
+                radicando, i = _leer_grupo(texto, i)
+                if indice:
+                    salida.append(f"(({_traducir(radicando)})**(1/({_traducir(indice)})))")
+                else:
+                    salida.append(f"sqrt({_traducir(radicando)})")
+            elif comando in _FUNCIONES:
+                # \sin x \cos x: el argumento sin paréntesis es solo el átomo siguiente.
+                atomo = _RE_ATOMO.match(texto, i)
+                if atomo and texto[i:].lstrip()[:1] not in ("(", "{", "^"):
+                    salida.append(f" {_FUNCIONES[comando]}({atomo.group(1)}) ")
+                    i = atomo.end()
+                else:
+                    salida.append(f" {_FUNCIONES[comando]} ")
+            elif comando in _SIMBOLOS:
+                salida.append(f" {_SIMBOLOS[comando]} ")
+            elif comando in ("mathrm", "text", "operatorname"):
+                contenido, i = _leer_grupo(texto, i)
+                salida.append(f" {contenido} ")
+            else:
+                raise ErrorLatex(f"Comando no soportado: \\{comando}")
+        elif c == "{":
+            salida.append("(")
+            i += 1
+        elif c == "}":
+            salida.append(")")
+            i += 1
+        else:
+            salida.append(c)
+            i += 1
+    return "".join(salida)
+
+
+def normalizar(latex):
+    """ Quita $, \\left/\\right y espacios de LaTeX; |x| pasa a Abs(x). """
+    texto = _ELIMINAR.sub(" ", latex or "")
+    texto = _RE_ABS.sub(r"\\operatorname{Abs}{(\1)}", texto)
+    return texto.strip()
+
+
+def _validar_seguro(traducido, extra=()):
+    """ parse_expr usa eval: solo se admiten operadores y nombres matemáticos conocidos. """
+    if not _RE_CARACTERES_SEGUROS.fullmatch(traducido) or "__" in traducido:
+        raise ErrorLatex(f"Caracteres no permitidos en {traducido!r}")
+    for nombre in _RE_IDENTIFICADOR.findall(traducido):
+        if nombre not in _NOMBRES_PERMITIDOS and nombre not in extra and not _RE_SIMBOLO_CORTO.fullmatch(nombre):
+            raise ErrorLatex(f"Nombre no permitido: {nombre}")
+
+
+def a_sympy(latex, simbolos=None):
+    """ Convierte una expresión LaTeX (sin '=') a SymPy. Lanza ErrorLatex. """
+    if not SYMPY_DISPONIBLE:
+        raise ErrorLatex("SymPy no está instalado")
+    texto = _RE_EXP_E.sub(" E^", normalizar(latex))
+    traducido = _traducir(texto)
+    # Funciones con potencia (\sin^2 x) no se soportan de forma fiable.
+    if re.search(r"(sin|cos|tan|log)\s*\^", traducido):
+        raise ErrorLatex("Potencia de función no soportada")
+    _validar_seguro(traducido, simbolos or ())
+    import sympy
+    from sympy.parsing.sympy_parser import (
+        convert_xor,
+        implicit_multiplication_application,
+        parse_expr,
+        standard_transformations,
+    )
+
+    locales = {"E": sympy.E, "pi": sympy.pi, "Abs": sympy.Abs, "lamda": sympy.Symbol("lamda")}
+    locales.update(simbolos or {})
+    try:
+        return parse_expr(
+            traducido,
+            local_dict=locales,
+            transformations=standard_transformations + (implicit_multiplication_application, convert_xor),
+        )
+    except Exception as e:
+        raise ErrorLatex(f"No se pudo interpretar {latex!r}: {e}") from e
@@ -0,0 +1,277 @@
+"""
+Fórmulas LaTeX dibujadas en el servidor (SVG con mathtext de matplotlib).
+
+Lo que escribe la IA se normaliza (sin $, sin \\displaystyle, \\dfrac como
+\\frac, \\le como \\leq, espacios colapsados) y cada fórmula se dibuja una
+sola vez: el SVG queda en un LRU del proceso, compartido por todas las
+sesiones, y en disco con el hash de la fórmula como nombre, así que
+sobrevive a reinicios y lo comparten los procesos (en disco también como
+LRU por fecha de uso, de unas MAX_FORMULAS entradas). Las preguntas se
+preparan al entrar al pool o al banco y la pantalla solo incrusta el
+resultado, sin volver a partir ni analizar nada en cada rerun. Lo que
+mathtext no entiende se deja como $…$ para que lo dibuje el navegador,
+como antes; el texto de fuera de las fórmulas se escapa como HTML.
+"""
+import hashlib
+import html
+import io
+import os
+import re
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+from modules import telemetria
+
+VERSION_RENDER = "mathtext-v1"
+RUTA_LATEX = os.environ.get("TUTOR_LATEX_RUTA", os.path.join(".cache", "latex"))
+MAX_FORMULAS = int(os.environ.get("TUTOR_LATEX_MAX", 4096))
+MAX_VISTAS = 2048
+# Cada cuántas fórmulas escritas en disco se recorre la carpeta para podarla
+PODAR_CADA = 256
+TAMANO_PUNTOS = 14
+COLOR = os.environ.get("TUTOR_LATEX_COLOR", "#31333F")
+
+_RE_FORMULA = re.compile(r"\$\$(.+?)\$\$|\$([^$]+?)\$", re.DOTALL)
+_RE_QUITAR = re.compile(r"\\(?:displaystyle|textstyle|limits)(?![a-zA-Z])|\$")
+_RE_TEXTO = re.compile(r"\\(?:text|textrm|operatorname)\{([^{}]*)\}")
+# Lo que el navegador no necesita: cabecera XML, metadatos, comentarios y el fondo blanco
+_RE_SOBRANTE = re.compile(r"\A.*?(?=<svg)|<metadata>.*?</metadata>|<!--.*?-->|<g id=\"patch_1\">.*?</g>", re.DOTALL)
+_RE_DECIMALES = re.compile(r"(\.\d\d)\d+")
+_RE_ESPACIOS = re.compile(r"\s*\n\s*")
+# Sinónimos: \\le y \\ge no existen en mathtext; \\dfrac y \\frac dibujan lo mismo
+_RE_SINONIMOS = re.compile(r"\\(dfrac|tfrac|le|ge|ne)(?![a-zA-Z])")
+_SINONIMOS = {"dfrac": "\\frac", "tfrac": "\\frac", "le": "\\leq", "ge": "\\geq", "ne": "\\neq"}
+
+_lock = threading.Lock()
+# mathtext guarda un parser por proceso que no es seguro entre hilos
+_lock_render = threading.Lock()
+_svgs = OrderedDict()
+_vistas = OrderedDict()
+_stats = {"hits": 0, "disco": 0, "renders": 0, "sin_render": 0, "vistas": 0, "podadas": 0}
+_escrituras = 0
+
+
+def normalizar(formula):
+    """ Forma canónica de la fórmula: la misma expresión escrita distinto comparte SVG. """
+    texto = _RE_QUITAR.sub("", formula or "")
+    texto = _RE_TEXTO.sub(lambda m: "\\mathrm{" + m.group(1).replace(" ", "\\ ") + "}", texto)
+    texto = _RE_SINONIMOS.sub(lambda m: _SINONIMOS[m.group(1)], texto)
+    return " ".join(texto.split())
+
+
+def clave_formula(normalizada):
+    return hashlib.sha1(f"{VERSION_RENDER}\x1f{TAMANO_PUNTOS}\x1f{COLOR}\x1f{normalizada}".encode("utf-8")).hexdigest()
+
+
+# --- Render y caché ---
+
+def _render(normalizada):
+    from matplotlib import mathtext
+    from matplotlib.font_manager import FontProperties
+
+    buffer = io.BytesIO()
+    with _lock_render:
+        mathtext.math_to_image(f"${normalizada}$", buffer, prop=FontProperties(size=TAMANO_PUNTOS),
+                               format="svg", color=COLOR)
+    return _compactar(buffer.getvalue().decode("utf-8"))
+
+
+def _compactar(dibujo):
+    """ ~35 % menos bytes: sin lo sobrante, coordenadas a 2 decimales y en una sola línea. """
+    dibujo = _RE_DECIMALES.sub(r"\1", _RE_SOBRANTE.sub("", dibujo))
+    return _RE_ESPACIOS.sub(" ", dibujo).replace("> <", "><").replace('"', "'")
+
+
+def _ruta(clave):
+    return os.path.join(RUTA_LATEX, f"{clave}.svg")
+
+
+def _leer_disco(clave):
+    try:
+        with open(_ruta(clave), encoding="utf-8") as f:
+            dibujo = f.read()
+    except OSError:
+        return None
+    try:
+        # La fecha de modificación es la del último uso: la poda expulsa primero lo que nadie pide
+        os.utime(_ruta(clave))
+    except OSError:
+        pass
+    return dibujo
+
+
+def _escribir_disco(clave, svg):
+    global _escrituras
+    try:
+        os.makedirs(RUTA_LATEX, exist_ok=True)
+        temporal = f"{_ruta(clave)}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(svg)
+        os.replace(temporal, _ruta(clave))
+    except OSError as e:
+        print(f"Aviso: no se pudo guardar la fórmula {e}")
+        return
+    with _lock:
+        _escrituras += 1
+        podar = _escrituras % PODAR_CADA == 0
+    if podar:
+        _podar_disco()
+
+
+def _podar_disco():
+    """ Deja en disco las MAX_FORMULAS fórmulas usadas más recientemente. """
+    entradas = []
+    try:
+        with os.scandir(RUTA_LATEX) as directorio:
+            for entrada in directorio:
+                if entrada.name.endswith(".svg"):
+                    try:
+                        entradas.append((entrada.stat().st_mtime, entrada.path))
+                    except OSError:
+                        continue
+    except OSError:
+        return
+    entradas.sort()
+    podadas = 0
+    for _, ruta in entradas[:max(len(entradas) - MAX_FORMULAS, 0)]:
+        try:
+            os.remove(ruta)
+            podadas += 1
+        except OSError:
+            pass
+    with _lock:
+        _stats["podadas"] += podadas
+
+
+def _recordar(cache, clave, valor, maximo):
+    with _lock:
+        cache[clave] = valor
+        cache.move_to_end(clave)
+        while len(cache) > maximo:
+            cache.popitem(last=False)
+
+
+def svg(formula):
+    """ SVG de la fórmula (del LRU, del disco o recién dibujado) o None si mathtext no la entiende. """
+    normalizada = normalizar(formula)
+    if not normalizada:
+        return None
+    clave = clave_formula(normalizada)
+    with _lock:
+        # "" marca una fórmula que mathtext no sabe dibujar: no se reintenta
+        resultado = _svgs.get(clave)
+        if resultado is not None:
+            _svgs.move_to_end(clave)
+            _stats["hits"] += 1
+    if resultado is not None:
+        telemetria.cache("latex", True)
+        return resultado or None
+    telemetria.cache("latex", False)
+    resultado = _leer_disco(clave)
+    if resultado is not None:
+        evento = "disco"
+    else:
+        try:
+            resultado = _render(normalizada)
+            evento = "renders"
+            _escribir_disco(clave, resultado)
+        except Exception:
+            resultado, evento = "", "sin_render"
+    with _lock:
+        _stats[evento] += 1
+    _recordar(_svgs, clave, resultado, MAX_FORMULAS)
+    return resultado or None
+
+
+def imagen_html(formula, bloque=False):
+    """ <img> con el SVG incrustado (listo para st.markdown con HTML) o None. """
+    dibujo = svg(formula)
+    if dibujo is None:
+        return None
+    # Texto escapado con % en vez de base64 (los espacios valen tal cual en una URL data:):
+    # ocupa menos y comprime mejor en el websocket
+    datos = urllib.parse.quote(dibujo, safe=" /=:;,.-'()_")
+    alt = html.escape(normalizar(formula), quote=True)
+    if bloque:
+        return (f'<div style="text-align:center;margin:0.4rem 0">'
+                f'<img src="data:image/svg+xml,{datos}" alt="{alt}"></div>')
+    return f'<img src="data:image/svg+xml,{datos}" alt="{alt}" style="vertical-align:middle">'
+
+
+def _formula_segura(formula):
+    """ Fórmula para el navegador dentro de HTML: sin "<" ni ">" que abran etiquetas (\\lt / \\gt). """
+    return formula.replace("<", "\\lt ").replace(">", "\\gt ")
+
+
+def markdown(texto):
+    """
+    Texto con fórmulas $…$ / $$…$$, listo para st.markdown con
+    unsafe_allow_html: las fórmulas que se pueden dibujar pasan a <img>, las
+    demás quedan para el navegador sin "<" ni ">", y todo el texto de
+    fuera se escapa (viene de la IA o del banco, no es HTML).
+    """
+    texto = texto or ""
+    partes, inicio = [], 0
+    for m in _RE_FORMULA.finditer(texto):
+        partes.append(html.escape(texto[inicio:m.start()], quote=False))
+        bloque = m.group(1) is not None
+        partes.append(imagen_html(m.group(1) if bloque else m.group(2), bloque) or _formula_segura(m.group(0)))
+        inicio = m.end()
+    partes.append(html.escape(texto[inicio:], quote=False))
+    return "".join(partes)
+
+
+# --- Preguntas y tutorías listas para mostrar ---
+
+def partir_opcion(opcion):
+    """ "A) texto" -> ("A", "texto"); sin letra, la opción entera hace de letra (como el selector). """
+    if ")" in opcion:
+        letra, resto = opcion.split(")", 1)
+        return letra, resto
+    return opcion, None
+
+
+def _clave_pregunta(pregunta):
+    contenido = "\x1e".join([pregunta.get('pregunta', '')] + list(pregunta.get('opciones', ())))
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+def preparar_pregunta(pregunta):
+    """
+    Vista de una pregunta del quiz: {"enunciado": markdown, "opciones":
+    [(letra, markdown)]}, con las fórmulas ya dibujadas. Se guarda en un LRU
+    por contenido: llamarla al entrar la pregunta al pool deja el trabajo
+    hecho para todas las sesiones que la reciban.
+    """
+    clave = _clave_pregunta(pregunta)
+    with _lock:
+        vista = _vistas.get(clave)
+        if vista is not None:
+            _vistas.move_to_end(clave)
+            return vista
+    opciones = []
+    for opcion in pregunta.get('opciones', ()):
+        letra, resto = partir_opcion(opcion)
+        opciones.append((letra, f"**{html.escape(letra, quote=False)})** {markdown(resto)}" if resto is not None
+                         else markdown(opcion)))
+    vista = {"enunciado": markdown(pregunta.get('pregunta', '')), "opciones": opciones}
+    with _lock:
+        _stats["vistas"] += 1
+    _recordar(_vistas, clave, vista, MAX_VISTAS)
+    return vista
+
+
+def preparar_tutor(tutor):
+    """ Dibuja por adelantado las fórmulas de una tutoría (paso intermedio y resultado). """
+    for campo in ('paso_intermedio', 'resultado_final'):
+        if isinstance(tutor, dict) and tutor.get(campo):
+            svg(tutor[campo])
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_stats)
+        datos["formulas"] = len(_svgs)
+        datos["preguntas_preparadas"] = len(_vistas)
+    return datos
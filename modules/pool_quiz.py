@@ -0,0 +1,233 @@
+"""
+Pool de preguntas IA ya validadas, por tema, para el modo Quiz.
+
+Un hilo de fondo repone cada tema cuando baja de la marca mínima, así que
+armar un examen no llama a la IA en la petición. Cada pregunta se sirve
+a varias sesiones (nunca dos veces a la misma) hasta agotar sus usos.
+
+Con estado compartido (TUTOR_ESTADO_COMPARTIDO) el pool es uno para todas
+las réplicas: cada una sirve de él, y un tema lo repone la réplica que
+tiene su turno; las demás solo consultan el nivel cada pocos segundos.
+"""
+import hashlib
+import threading
+import time
+from collections import deque
+
+from modules import estado_compartido, latex_render, telemetria, tutor_ia
+
+MARCA_MINIMA = 6
+CAPACIDAD = 20
+LOTE_REPOSICION = 5
+USOS_POR_PREGUNTA = 25
+VENTANA_TASA_SEGUNDOS = 600
+# Con estado compartido: cada cuánto se mira el nivel y cuánto dura como mucho un turno de reposición
+ESPERA_COMPARTIDO = 5
+TURNO_SEGUNDOS = 180
+
+_cond = threading.Condition()
+_pools = {}
+_usos = {}
+_reponiendo = set()
+_hilo = None
+_generador = None
+_stats = {"servidas": 0, "faltantes": 0, "reposiciones": 0, "generadas": 0, "descartadas": 0, "errores": 0}
+_eventos_reposicion = deque()
+
+
+def id_pregunta(pregunta):
+    """ Identificador estable de una pregunta (hash de su enunciado). """
+    texto = pregunta.get('pregunta', '') if isinstance(pregunta, dict) else str(pregunta)
+    return hashlib.sha1(texto.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def iniciar(generador, temas_precalentar=()):
+    """
+    Arranca (una sola vez por proceso) el hilo que mantiene el pool lleno.
+    `generador(tema, n)` debe devolver una lista de preguntas o None.
+    """
+    global _hilo, _generador
+    with _cond:
+        _generador = generador
+        for tema in temas_precalentar:
+            _pools.setdefault(tema, deque())
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle_reposicion, name="pool_quiz", daemon=True)
+            _hilo.start()
+        _cond.notify()
+
+
+def _tema_a_reponer(niveles):
+    """ Histéresis: un tema que cae bajo la marca mínima se rellena hasta la capacidad. """
+    for tema, nivel in niveles.items():
+        if nivel < MARCA_MINIMA:
+            _reponiendo.add(tema)
+        if tema in _reponiendo:
+            if nivel < CAPACIDAD:
+                return tema
+            _reponiendo.discard(tema)
+    return None
+
+
+def _niveles_compartidos():
+    """ Nivel de cada tema en el pool compartido (fuera del lock: es una consulta externa) o None. """
+    if not estado_compartido.activo():
+        return None
+    with _cond:
+        temas = list(_pools)
+    return estado_compartido.pool_niveles(temas)
+
+
+def _bucle_reposicion():
+    while True:
+        niveles = _niveles_compartidos()
+        compartido = niveles is not None
+        with _cond:
+            if not compartido:
+                niveles = {tema: len(pool) for tema, pool in _pools.items()}
+            tema = _tema_a_reponer(niveles)
+            if tema is None:
+                # Las sesiones de otras réplicas no despiertan este hilo: con pool compartido se vuelve a mirar
+                _cond.wait(ESPERA_COMPARTIDO if compartido else None)
+                continue
+            generador = _generador
+            faltan = min(LOTE_REPOSICION, CAPACIDAD - niveles[tema])
+        turno = f"pool_quiz:{tema}"
+        if compartido and not estado_compartido.tomar_turno(turno, TURNO_SEGUNDOS):
+            # Otra réplica ya lo está reponiendo
+            time.sleep(ESPERA_COMPARTIDO)
+            continue
+        try:
+            nuevas = generador(tema, faltan) or []
+        except Exception as e:
+            print(f"Aviso: reposición del pool de {tema} falló {e}")
+            nuevas = []
+        finally:
+            if compartido:
+                estado_compartido.soltar_turno(turno)
+        if not agregar(tema, nuevas):
+            with _cond:
+                _stats["errores"] += 1
+            # Sin cuota o IA caída: no martillar la API.
+            time.sleep(30)
+
+
+def agregar(tema, preguntas):
+    """ Valida y añade preguntas al pool del tema (descarta duplicadas e inválidas). """
+    # Las fórmulas se dibujan fuera del lock: `tomar` no espera al render
+    for pregunta in preguntas:
+        if tutor_ia.validar_pregunta_quiz(pregunta):
+            latex_render.preparar_pregunta(pregunta)
+    if estado_compartido.activo():
+        agregadas = _agregar_compartido(tema, preguntas)
+        if agregadas is not None:
+            return agregadas
+    agregadas = 0
+    with _cond:
+        pool = _pools.setdefault(tema, deque())
+        existentes = {id_pregunta(p) for p in pool}
+        for pregunta in preguntas:
+            if not tutor_ia.validar_pregunta_quiz(pregunta):
+                _stats["descartadas"] += 1
+                continue
+            pid = id_pregunta(pregunta)
+            if pid in existentes or len(pool) >= CAPACIDAD:
+                continue
+            pregunta.setdefault('tema', tema)
+            pool.append(pregunta)
+            _usos[pid] = 0
+            existentes.add(pid)
+            agregadas += 1
+        _stats["generadas"] += agregadas
+        _stats["reposiciones"] += 1
+        _eventos_reposicion.append((time.time(), agregadas))
+        _cond.notify()
+    return agregadas
+
+
+def _agregar_compartido(tema, preguntas):
+    validas = [dict(p, tema=p.get('tema', tema)) for p in preguntas if tutor_ia.validar_pregunta_quiz(p)]
+    agregadas = estado_compartido.pool_agregar(tema, [(id_pregunta(p), p) for p in validas], CAPACIDAD)
+    if agregadas is None:
+        return None
+    with _cond:
+        _pools.setdefault(tema, deque())
+        _stats["descartadas"] += len(preguntas) - len(validas)
+        _stats["generadas"] += agregadas
+        _stats["reposiciones"] += 1
+        _eventos_reposicion.append((time.time(), agregadas))
+    return agregadas
+
+
+def tomar(temas, n, vistas):
+    """
+    Devuelve hasta n preguntas repartidas entre los temas, sin repetir las
+    que la sesión ya vio (`vistas`: set de ids, se actualiza aquí).
+    Nunca llama a la IA: si el pool no alcanza, devuelve menos.
+    """
+    elegidas = _tomar_compartido(temas, n, vistas) if estado_compartido.activo() else None
+    if elegidas is not None:
+        telemetria.cache("pool_quiz", len(elegidas) >= n)
+        return elegidas
+    elegidas = []
+    with _cond:
+        for tema in temas:
+            _pools.setdefault(tema, deque())
+        pendientes = list(temas)
+        while len(elegidas) < n and pendientes:
+            for tema in list(pendientes):
+                if len(elegidas) >= n:
+                    break
+                pregunta = _siguiente_no_vista(_pools[tema], vistas)
+                if pregunta is None:
+                    pendientes.remove(tema)
+                    continue
+                elegidas.append(dict(pregunta))
+        _stats["servidas"] += len(elegidas)
+        _stats["faltantes"] += n - len(elegidas)
+        _cond.notify()
+    telemetria.cache("pool_quiz", len(elegidas) >= n)
+    return elegidas
+
+
+def _tomar_compartido(temas, n, vistas):
+    elegidas = estado_compartido.pool_tomar(temas, n, vistas, USOS_POR_PREGUNTA)
+    if elegidas is None:
+        return None
+    with _cond:
+        for tema in temas:
+            _pools.setdefault(tema, deque())
+        _stats["servidas"] += len(elegidas)
+        _stats["faltantes"] += n - len(elegidas)
+        _cond.notify()
+    return elegidas
+
+
+def _siguiente_no_vista(pool, vistas):
+    for pregunta in pool:
+        pid = id_pregunta(pregunta)
+        if pid in vistas:
+            continue
+        vistas.add(pid)
+        _usos[pid] = _usos.get(pid, 0) + 1
+        if _usos[pid] >= USOS_POR_PREGUNTA:
+            pool.remove(pregunta)
+            _usos.pop(pid, None)
+        return pregunta
+    return None
+
+
+def estadisticas():
+    """ Nivel de llenado por tema y tasa de reposición (preguntas/minuto). """
+    ahora = time.time()
+    with _cond:
+        while _eventos_reposicion and ahora - _eventos_reposicion[0][0] > VENTANA_TASA_SEGUNDOS:
+            _eventos_reposicion.popleft()
+        recientes = sum(n for _, n in _eventos_reposicion)
+        datos = dict(_stats)
+        niveles = {tema: len(pool) for tema, pool in _pools.items()}
+    niveles = _niveles_compartidos() or niveles
+    datos["nivel"] = niveles
+    datos["llenado"] = {tema: round(nivel / CAPACIDAD, 2) for tema, nivel in niveles.items()}
+    datos["tasa_reposicion_por_min"] = round(recientes * 60 / VENTANA_TASA_SEGUNDOS, 2)
+    return datos
@@ -0,0 +1,427 @@
+"""
+Telemetría local: spans de latencia y coste por llamada a la IA y por
+ejecución del script de Streamlit.
+
+- `span(nombre)` / `@instrumentar(nombre)` abren un span; los spans
+  anidados (la llamada "llm" dentro de `generar_tutor_paso_a_paso`)
+  heredan el llamador vía contextvars, también en hilos de fondo.
+- `anotar`, `sumar` y `cache` añaden al span actual reintentos, 429,
+  tamaños, tokens y aciertos/fallos de caché.
+- Para trabajo repartido entre yields (una respuesta en streaming),
+  `abrir`/`activo`/`cerrar`: el span dura hasta el final pero solo es el
+  actual en los tramos que corre el generador.
+- Los spans se vuelcan por lotes desde un hilo a SQLite (y a JSONL si se
+  configura), sin bloquear la interfaz. El mismo hilo borra cada pocos
+  minutos los de más de TUTOR_TELEMETRIA_DIAS días y, pasado
+  TUTOR_TELEMETRIA_MAX_SPANS, los más antiguos.
+- `metricas_prometheus()` expone contadores e histogramas en formato de
+  texto de Prometheus; `percentiles()` alimenta la página de administración.
+"""
+import contextvars
+import functools
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACTIVA = os.environ.get("TUTOR_TELEMETRIA", "1") != "0"
+RUTA_DB = os.environ.get("TUTOR_TELEMETRIA_RUTA", os.path.join(".cache", "telemetria.sqlite3"))
+RUTA_JSONL = os.environ.get("TUTOR_TELEMETRIA_JSONL", "")
+PUERTO_METRICAS = os.environ.get("TUTOR_METRICAS_PUERTO", "")
+RETENCION_DIAS = float(os.environ.get("TUTOR_TELEMETRIA_DIAS", 7))
+MAX_SPANS = int(os.environ.get("TUTOR_TELEMETRIA_MAX_SPANS", 200000))
+LOTE_MAX = 200
+INTERVALO_VOLCADO = 1.0
+INTERVALO_PODA = 300.0
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+_actual = contextvars.ContextVar("telemetria_span", default=None)
+_cola = queue.Queue()
+_lock = threading.Lock()
+_escritor = None
+_contadores = {}
+_histogramas = {}
+
+
+class Span:
+    __slots__ = ("id", "padre", "nombre", "llamador", "etiquetas", "atributos", "resultado", "inicio", "_t0", "duracion")
+
+    def __init__(self, nombre, padre=None, **etiquetas):
+        self.id = uuid.uuid4().hex[:16]
+        self.padre = padre
+        self.nombre = nombre
+        self.llamador = padre.nombre if padre else ""
+        self.etiquetas = etiquetas
+        self.atributos = {}
+        self.resultado = None
+        self.inicio = time.time()
+        self._t0 = time.perf_counter()
+        self.duracion = None
+
+    def anotar(self, **campos):
+        self.atributos.update(campos)
+
+    def sumar(self, campo, n=1):
+        self.atributos[campo] = self.atributos.get(campo, 0) + n
+
+    def fila(self):
+        return {
+            "id": self.id,
+            "padre": self.padre.id if self.padre else None,
+            "nombre": self.nombre,
+            "llamador": self.llamador,
+            "modelo": self.etiquetas.get("modelo", ""),
+            "inicio": round(self.inicio, 3),
+            "duracion_ms": round(self.duracion * 1000, 2),
+            "resultado": self.resultado,
+            "atributos": self.atributos,
+        }
+
+
+# --- API de instrumentación ---
+
+@contextmanager
+def span(nombre, **etiquetas):
+    """ Abre un span hijo del actual; registra duración y resultado al salir. """
+    s = Span(nombre, _actual.get(), **etiquetas)
+    token = _actual.set(s)
+    try:
+        yield s
+    except Exception:
+        s.resultado = s.resultado or "error"
+        raise
+    except BaseException:
+        # st.rerun()/st.stop() a mitad de la llamada
+        s.resultado = s.resultado or "interrumpido"
+        raise
+    finally:
+        _actual.reset(token)
+        s.duracion = time.perf_counter() - s._t0
+        s.resultado = s.resultado or "ok"
+        _registrar(s)
+
+
+def abrir(nombre, **etiquetas):
+    """ Span hijo del actual que no pasa a ser el actual; se cierra con `cerrar`. """
+    return Span(nombre, _actual.get(), **etiquetas)
+
+
+@contextmanager
+def activo(s):
+    """ Hace de `s` el span actual dentro del bloque (sin cruzar un yield). """
+    token = _actual.set(s)
+    try:
+        yield s
+    finally:
+        _actual.reset(token)
+
+
+def cerrar(s, resultado="ok"):
+    s.duracion = time.perf_counter() - s._t0
+    s.resultado = s.resultado or resultado
+    _registrar(s)
+
+
+def instrumentar(nombre):
+    """ Decorador: un span por llamada; devolver None o vacío cuenta como "vacio". """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with span(nombre) as s:
+                resultado = funcion(*args, **kwargs)
+                if not resultado:
+                    s.resultado = "vacio"
+                return resultado
+        return envoltura
+    return decorador
+
+
+def anotar(**campos):
+    s = _actual.get()
+    if s is not None:
+        s.anotar(**campos)
+
+
+def sumar(campo, n=1):
+    s = _actual.get()
+    if s is not None:
+        s.sumar(campo, n)
+
+
+def cache(nombre, acierto):
+    """ Acierto/fallo de una caché: contador global y marca en el span actual. """
+    _incrementar("tutor_cache_total", (("cache", nombre), ("resultado", "hit" if acierto else "miss")))
+    s = _actual.get()
+    if s is not None:
+        s.atributos.setdefault("caches", {})[nombre] = "hit" if acierto else "miss"
+
+
+def registrar_ejecucion(pantalla, segundos, desenlace):
+    """ Una ejecución del script (desenlace "rerun" o "fin") como span propio. """
+    s = Span("ejecucion_script", pantalla=pantalla)
+    s.llamador = pantalla
+    s.duracion = segundos
+    s.resultado = desenlace
+    _registrar(s)
+
+
+# --- Métricas en memoria ---
+
+def _incrementar(metrica, etiquetas, n=1):
+    with _lock:
+        _contadores[(metrica, etiquetas)] = _contadores.get((metrica, etiquetas), 0) + n
+
+
+def _observar(metrica, etiquetas, valor):
+    with _lock:
+        h = _histogramas.setdefault((metrica, etiquetas), [0] * len(BUCKETS) + [0.0, 0])
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                h[i] += 1
+        h[-2] += valor
+        h[-1] += 1
+
+
+def _registrar(s):
+    etiquetas = (("nombre", s.nombre), ("llamador", s.llamador))
+    _observar("tutor_span_segundos", etiquetas, s.duracion)
+    _incrementar("tutor_spans_total", etiquetas + (("resultado", s.resultado),))
+    if s.nombre == "llm":
+        etiquetas_llm = (("llamador", s.llamador), ("modelo", s.etiquetas.get("modelo", "")))
+        for campo in ("reintentos", "errores_429", "tokens_entrada", "tokens_salida", "bytes_prompt", "bytes_respuesta"):
+            if s.atributos.get(campo):
+                _incrementar(f"tutor_llm_{campo}_total", etiquetas_llm, s.atributos[campo])
+    elif s.nombre == "preprocesar_imagen":
+        for campo in ("bytes_originales", "bytes_finales"):
+            if s.atributos.get(campo):
+                _incrementar(f"tutor_imagen_{campo}_total", (), s.atributos[campo])
+    if ACTIVA:
+        _iniciar_escritor()
+        _cola.put(s.fila())
+
+
+def _formatear_etiquetas(etiquetas, extra=()):
+    pares = [f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in tuple(etiquetas) + tuple(extra)]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def metricas_prometheus():
+    """ Contadores e histogramas en el formato de texto de Prometheus. """
+    with _lock:
+        contadores = dict(_contadores)
+        histogramas = {k: list(v) for k, v in _histogramas.items()}
+    lineas = []
+    for metrica in sorted({m for m, _ in contadores}):
+        lineas.append(f"# TYPE {metrica} counter")
+        for (m, etiquetas), valor in sorted(contadores.items()):
+            if m == metrica:
+                lineas.append(f"{metrica}{_formatear_etiquetas(etiquetas)} {valor}")
+    for metrica in sorted({m for m, _ in histogramas}):
+        lineas.append(f"# TYPE {metrica} histogram")
+        for (m, etiquetas), h in sorted(histogramas.items()):
+            if m != metrica:
+                continue
+            for limite, cuenta in zip(BUCKETS, h):
+                le = "+Inf" if limite == float("inf") else f"{limite:g}"
+                lineas.append(f"{metrica}_bucket{_formatear_etiquetas(etiquetas, (('le', le),))} {cuenta}")
+            lineas.append(f"{metrica}_sum{_formatear_etiquetas(etiquetas)} {round(h[-2], 6)}")
+            lineas.append(f"{metrica}_count{_formatear_etiquetas(etiquetas)} {h[-1]}")
+    return "\n".join(lineas) + "\n"
+
+
+# --- Sumidero SQLite / JSONL (hilo de fondo, escritura por lotes) ---
+
+def _conectar():
+    carpeta = os.path.dirname(RUTA_DB)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    con = sqlite3.connect(RUTA_DB, check_same_thread=False, timeout=10)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS spans (
+            id TEXT PRIMARY KEY,
+            padre TEXT,
+            nombre TEXT NOT NULL,
+            llamador TEXT NOT NULL,
+            modelo TEXT NOT NULL,
+            inicio REAL NOT NULL,
+            duracion_ms REAL NOT NULL,
+            resultado TEXT NOT NULL,
+            atributos TEXT NOT NULL
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_spans_inicio ON spans(inicio)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_spans_ruta ON spans(nombre, llamador, duracion_ms)")
+    con.commit()
+    return con
+
+
+def _escribir(con, lote):
+    con.executemany(
+        "INSERT OR IGNORE INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (f["id"], f["padre"], f["nombre"], f["llamador"], f["modelo"], f["inicio"], f["duracion_ms"],
+             f["resultado"], json.dumps(f["atributos"], ensure_ascii=False))
+            for f in lote
+        ],
+    )
+    con.commit()
+    if RUTA_JSONL:
+        with open(RUTA_JSONL, "a", encoding="utf-8") as archivo:
+            archivo.writelines(json.dumps(f, ensure_ascii=False) + "\n" for f in lote)
+
+
+def podar(con):
+    """ Borra los spans fuera de la retención y, si aún sobran, los más antiguos. Devuelve cuántos. """
+    borrados = con.execute("DELETE FROM spans WHERE inicio < ?", (time.time() - RETENCION_DIAS * 86400,)).rowcount
+    corte = con.execute("SELECT inicio FROM spans ORDER BY inicio DESC LIMIT 1 OFFSET ?", (MAX_SPANS,)).fetchone()
+    if corte is not None:
+        borrados += con.execute("DELETE FROM spans WHERE inicio <= ?", corte).rowcount
+    con.commit()
+    return borrados
+
+
+def _bucle_escritor():
+    con = None
+    proxima_poda = 0.0
+    while True:
+        lote = [_cola.get()]
+        fin = time.monotonic() + INTERVALO_VOLCADO
+        while len(lote) < LOTE_MAX:
+            try:
+                lote.append(_cola.get(timeout=max(0.0, fin - time.monotonic())))
+            except queue.Empty:
+                break
+        pendientes = [f for f in lote if f is not None]
+        try:
+            con = con or _conectar()
+            if pendientes:
+                _escribir(con, pendientes)
+            if time.monotonic() >= proxima_poda:
+                proxima_poda = time.monotonic() + INTERVALO_PODA
+                podar(con)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Aviso: no se pudo volcar la telemetría {e}")
+        finally:
+            for _ in lote:
+                _cola.task_done()
+
+
+def _iniciar_escritor():
+    global _escritor
+    if _escritor is not None:
+        return
+    with _lock:
+        if _escritor is None:
+            _escritor = threading.Thread(target=_bucle_escritor, name="telemetria", daemon=True)
+            _escritor.start()
+
+
+def volcar():
+    """ Espera a que los spans en cola lleguen a disco. """
+    if _escritor is not None:
+        _cola.put(None)
+        _cola.join()
+
+
+# --- Consultas para la página de administración ---
+
+def _consultar(consulta):
+    """ consulta(con) con una conexión de lectura; [] si la base no está disponible. """
+    try:
+        con = _conectar()
+        try:
+            return consulta(con)
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Aviso: telemetría no disponible {e}")
+        return []
+
+
+def percentiles(ventana_segundos=3600):
+    """
+    p50/p95/p99 de duración por ruta (nombre del span + llamador) en la
+    ventana, por rango más cercano. Se calculan en SQLite: a Python solo
+    llegan los conteos y tres filas por ruta.
+    """
+    desde = time.time() - ventana_segundos
+
+    def consulta(con):
+        grupos = con.execute(
+            "SELECT nombre, llamador, COUNT(*), SUM(resultado IN ('error', 'vacio')) FROM spans"
+            " WHERE inicio >= ? GROUP BY nombre, llamador ORDER BY nombre, llamador", (desde,)
+        ).fetchall()
+        resumen = []
+        for nombre, llamador, n, errores in grupos:
+            fila = {"ruta": f"{nombre} ← {llamador}" if llamador else nombre, "n": n}
+            for p in (50, 95, 99):
+                (valor,) = con.execute(
+                    "SELECT duracion_ms FROM spans WHERE nombre = ? AND llamador = ? AND inicio >= ?"
+                    " ORDER BY duracion_ms LIMIT 1 OFFSET ?",
+                    (nombre, llamador, desde, max(0, math.ceil(n * p / 100) - 1)),
+                ).fetchone()
+                fila[f"p{p}_ms"] = round(float(valor), 1)
+            fila["errores"] = errores
+            resumen.append(fila)
+        return resumen
+    return _consultar(consulta)
+
+
+def resumen_llm(ventana_segundos=3600):
+    """ Totales de coste de la IA en la ventana: llamadas, reintentos, 429, tokens y bytes. """
+    campos = ("reintentos", "errores_429", "tokens_entrada", "tokens_salida", "bytes_prompt", "bytes_respuesta")
+    totales = dict.fromkeys(("llamadas",) + campos, 0)
+    sumas = ", ".join(f"COALESCE(SUM(json_extract(atributos, '$.{c}')), 0)" for c in campos)
+
+    def consulta(con):
+        return con.execute(f"SELECT COUNT(*), {sumas} FROM spans WHERE nombre = 'llm' AND inicio >= ?",
+                           (time.time() - ventana_segundos,)).fetchone()
+    fila = _consultar(consulta)
+    if fila:
+        totales.update(zip(totales, (int(v) for v in fila)))
+    return totales
+
+
+# --- Endpoint /metrics opcional ---
+
+_servidor = None
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = metricas_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor_metricas(puerto=None):
+    """ Sirve /metrics en un hilo (una sola vez por proceso); sin puerto configurado no hace nada. """
+    global _servidor
+    puerto = puerto or PUERTO_METRICAS
+    if not puerto:
+        return
+    with _lock:
+        if _servidor is not None:
+            return
+        try:
+            _servidor = ThreadingHTTPServer(("0.0.0.0", int(puerto)), _ManejadorMetricas)
+        except OSError as e:
+            print(f"Aviso: no se pudo abrir el puerto de métricas {puerto}: {e}")
+            return
+    threading.Thread(target=_servidor.serve_forever, name="metricas", daemon=True).start()
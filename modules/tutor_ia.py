@@ -0,0 +1,127 @@
+"""
+Prompts y utilidades del tutor IA compartidos por la app y los scripts batch.
+No depende de Streamlit para poder usarse fuera de `app.py`.
+"""
+import hashlib
+
+from modules import esquemas, json_robusto
+
+# Cambiar al modificar el prompt del tutor: invalida la caché persistente.
+VERSION_PROMPT_TUTOR = "tutor-v1"
+
+
+def construir_prompt_tutor(pregunta_texto, tema):
+    """ Prompt del modo Entrenamiento (Banco/IA) para un ejercicio. """
+    return f"""
+    Actúa como un profesor experto de cálculo. Para el siguiente ejercicio de {tema}:
+    "{pregunta_texto}"
+
+    Genera un objeto JSON estricto.
+    REGLAS LATEX (CRÍTICO):
+    1. Escribe la fórmula pura. NO incluyas signos "$$" dentro del JSON.
+    2. Usa DOBLE BARRA para comandos: \\\\frac, \\\\int.
+
+    Estructura JSON:
+    {{
+        "estrategias": ["Estrategia Correcta", "Estrategia Incorrecta 1", "Estrategia Incorrecta 2"],
+        "indice_correcta": 0,
+        "feedback_estrategia": "Explicación breve.",
+        "paso_intermedio": "Ecuación LaTeX PURA (sin $$) del hito",
+        "resultado_final": "Ecuación LaTeX PURA (sin $$) del resultado"
+    }}
+    Orden aleatorio en estrategias.
+    """
+
+
+def construir_prompt_transcripcion():
+    """ Prompt para solo transcribir el enunciado de una foto (reconocer una foto ya analizada). """
+    return """
+    Transcribe el enunciado del ejercicio de la imagen a LaTeX, sin resolverlo.
+    Escribe la fórmula pura, sin signos "$$". Usa DOBLE BARRA para comandos: \\\\frac, \\\\int.
+    Estructura JSON: {"enunciado_latex": "..."}
+    """
+
+
+def construir_prompt_tutor_lote(ejercicios):
+    """ Prompt para tutorizar varios ejercicios [(pregunta, tema), ...] en una sola llamada. """
+    listado = "\n".join(
+        f'    {i}. ({tema}) "{pregunta}"' for i, (pregunta, tema) in enumerate(ejercicios)
+    )
+    return f"""
+    Actúa como un profesor experto de cálculo. Para CADA uno de estos ejercicios:
+{listado}
+
+    Devuelve un ARRAY JSON con exactamente {len(ejercicios)} objetos, uno por ejercicio y en el mismo orden.
+    REGLAS LATEX (CRÍTICO):
+    1. Escribe la fórmula pura. NO incluyas signos "$$" dentro del JSON.
+    2. Usa DOBLE BARRA para comandos: \\\\frac, \\\\int.
+
+    Estructura de cada objeto:
+    {{
+        "id": 0,
+        "estrategias": ["Estrategia Correcta", "Estrategia Incorrecta 1", "Estrategia Incorrecta 2"],
+        "indice_correcta": 0,
+        "feedback_estrategia": "Explicación breve.",
+        "paso_intermedio": "Ecuación LaTeX PURA (sin $$) del hito",
+        "resultado_final": "Ecuación LaTeX PURA (sin $$) del resultado"
+    }}
+    "id" es el número del ejercicio. Orden aleatorio en estrategias.
+    """
+
+
+def separar_lote(datos, n):
+    """
+    Reparte la respuesta de un lote en n posiciones (dict o None).
+    Si algún objeto trae "id", manda el id: los que no lo traen, lo traen
+    fuera de rango o repetido quedan en None (van a los reintentos), y si
+    la numeración parece empezar en 1 (falta el 0 y sobra el n) no se
+    asigna ninguno. Solo sin ningún id se usa la posición en el array.
+    """
+    resultado = [None] * n
+    if isinstance(datos, dict):
+        datos = [datos]
+    if not isinstance(datos, list):
+        return resultado
+    items = [item for item in datos if isinstance(item, dict)]
+    if not any("id" in item for item in items):
+        for i, item in enumerate(items[:n]):
+            resultado[i] = item
+        return resultado
+    ids = [item.get("id") if type(item.get("id")) is int else None for item in items]
+    if 0 not in ids and any(i is not None and not 0 <= i < n for i in ids):
+        print("Aviso: lote con ids fuera de rango y sin el 0, no se asigna ninguno")
+        return resultado
+    for item, i in zip(items, ids):
+        if i is not None and 0 <= i < n and ids.count(i) == 1:
+            resultado[i] = {k: v for k, v in item.items() if k != "id"}
+    return resultado
+
+
+def hash_prompt_tutor():
+    """ Huella de la plantilla del prompt (detecta cambios aunque no se suba la versión). """
+    plantilla = construir_prompt_tutor("{pregunta}", "{tema}")
+    return hashlib.sha256(f"{VERSION_PROMPT_TUTOR}\n{plantilla}".encode("utf-8")).hexdigest()[:16]
+
+
+def limpiar_json(texto, esperado=None):
+    """
+    Limpieza quirúrgica para respuestas con LaTeX.
+    Una sola pasada (ver json_robusto); devuelve None si no hay JSON.
+    `esperado` (dict o list) elige ese tipo si la prosa trae otros.
+    """
+    return json_robusto.analizar_json(texto, esperado)[0]
+
+
+def validar_tutor(datos):
+    """ True si el JSON del tutor cumple el esquema que usa la pantalla del Dojo (ver `esquemas`). """
+    return esquemas.validar_tutor(datos)
+
+
+def validar_analisis(datos):
+    """ Igual que validar_tutor, para el análisis de Respuesta Guiada. """
+    return esquemas.validar_analisis(datos)
+
+
+def validar_pregunta_quiz(pregunta):
+    """ True si la pregunta tiene el esquema que consume la pantalla del Quiz. """
+    return esquemas.validar_pregunta_quiz(pregunta)
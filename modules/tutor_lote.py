@@ -0,0 +1,78 @@
+"""
+Tutorías de varios ejercicios en una sola llamada a la IA.
+
+Los ejercicios que ya están en el artefacto precalculado o en la caché no
+se piden. El resto va en un único prompt que devuelve un array JSON; cada
+elemento se valida (esquema y verificación simbólica) por separado, se
+guarda en la caché con la misma clave que la vía individual (la del
+modelo que lo respondió), y solo los
+que fallan se vuelven a pedir, en un lote más pequeño (con
+`llamar_reintento`, a otro modelo: el enrutador manda el lote al rápido y
+los reintentos al fuerte).
+"""
+from modules import cache_tutor, telemetria, tutor_ia, tutor_precalculado, verificador
+
+REINTENTOS = 1
+
+
+def _validas(ejercicios, elementos):
+    """ True/False por elemento: esquema y verificación simbólica, todo el lote con un único plazo. """
+    con_esquema = [tutor_ia.validar_tutor(datos) for datos in elementos]
+    pares = [(pregunta, datos) for (pregunta, _), datos, ok in zip(ejercicios, elementos, con_esquema) if ok]
+    veredictos = iter(verificador.verificar_tutores(pares))
+    validas = []
+    for (_, tema), ok in zip(ejercicios, con_esquema):
+        if ok and next(veredictos) == verificador.INVALIDO:
+            print(f"Aviso: tutoría de lote rechazada por verificación simbólica [{tema}]")
+            ok = False
+        validas.append(ok)
+    return validas
+
+
+@telemetria.instrumentar("tutor_lote")
+def generar(ejercicios, llamar, nombre_modelo, reintentos=REINTENTOS, llamar_reintento=None, nombre_reintento=None):
+    """
+    ejercicios: [(pregunta, tema), ...]; llamar(prompt) devuelve la
+    respuesta del modelo (con `.text`) o None. Devuelve una lista alineada
+    con `ejercicios`: el JSON del tutor o None para los que no se lograron
+    (la pantalla los genera luego por la vía individual).
+    `llamar_reintento`, si se da, sustituye a `llamar` a partir del segundo
+    intento; `nombre_reintento` es su modelo (por defecto, `nombre_modelo`).
+    """
+    resultado = [None] * len(ejercicios)
+    nombre_reintento = nombre_reintento or nombre_modelo
+    # Se busca primero la tutoría del modelo de los reintentos (el fuerte)
+    claves = [{nombre: cache_tutor.generar_clave(p, t, nombre, tutor_ia.VERSION_PROMPT_TUTOR)
+               for nombre in (nombre_reintento, nombre_modelo)} for p, t in ejercicios]
+    pendientes = []
+    for i, (pregunta, tema) in enumerate(ejercicios):
+        datos = tutor_precalculado.buscar(pregunta, tema)
+        if datos is None:
+            datos = cache_tutor.obtener_alguna(list(claves[i].values()))
+        if datos is None:
+            pendientes.append(i)
+        else:
+            resultado[i] = datos
+
+    for intento in range(1 + reintentos):
+        if not pendientes:
+            break
+        telemetria.sumar("tutor_lote_pedidos", len(pendientes))
+        reintento = bool(intento and llamar_reintento)
+        nombre = nombre_reintento if reintento else nombre_modelo
+        respuesta = (llamar_reintento if reintento else llamar)(tutor_ia.construir_prompt_tutor_lote([ejercicios[i] for i in pendientes]))
+        if respuesta is None:
+            break
+        elementos = tutor_ia.separar_lote(tutor_ia.limpiar_json(respuesta.text, list), len(pendientes))
+        fallidos = []
+        validas = _validas([ejercicios[i] for i in pendientes], elementos)
+        for i, datos, valida in zip(pendientes, elementos, validas):
+            if valida:
+                cache_tutor.guardar(claves[i][nombre], datos)
+                resultado[i] = datos
+            else:
+                fallidos.append(i)
+        telemetria.sumar("tutor_lote_fallidos", len(fallidos))
+        pendientes = fallidos
+    telemetria.anotar(ejercicios=len(ejercicios), sin_tutor=len(pendientes))
+    return resultado
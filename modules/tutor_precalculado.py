@@ -0,0 +1,82 @@
+"""
+Artefacto versionado con las tutorías pre-generadas del banco de preguntas.
+
+Lo produce `python -m scripts.precalcular_tutor` y la app lo carga al
+arrancar: los ejercicios del banco se sirven sin llamar a la IA.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from modules import telemetria, tutor_ia
+from modules.cache_tutor import normalizar_texto
+
+FORMATO_ARTEFACTO = 1
+RUTA_ARTEFACTO = os.environ.get("TUTOR_PRECALCULADO_RUTA", os.path.join("data", "tutor_precalculado.json"))
+
+_lock = threading.Lock()
+_estado = {"mtime": None, "items": {}}
+
+
+def clave_item(pregunta_texto, tema):
+    """ Identidad de un ejercicio del banco (independiente del modelo y del prompt). """
+    material = f"{normalizar_texto(tema)}\n{normalizar_texto(pregunta_texto)}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def leer_artefacto(ruta=RUTA_ARTEFACTO):
+    """ Lee el artefacto completo (o uno vacío si no existe). """
+    if not os.path.exists(ruta):
+        return {"formato": FORMATO_ARTEFACTO, "items": {}}
+    with open(ruta, encoding="utf-8") as f:
+        artefacto = json.load(f)
+    if artefacto.get("formato") != FORMATO_ARTEFACTO:
+        print(f"Aviso: formato de artefacto desconocido en {ruta}, se ignora")
+        return {"formato": FORMATO_ARTEFACTO, "items": {}}
+    return artefacto
+
+
+def escribir_artefacto(artefacto, ruta=RUTA_ARTEFACTO):
+    """ Escritura atómica: nunca deja un artefacto a medias si el proceso muere. """
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(artefacto, f, ensure_ascii=False, indent=1)
+    os.replace(temporal, ruta)
+
+
+def _items_vigentes():
+    """ Recarga el artefacto si cambió en disco; solo conserva entradas del prompt actual. """
+    try:
+        mtime = os.path.getmtime(RUTA_ARTEFACTO)
+    except OSError:
+        return {}
+    with _lock:
+        if _estado["mtime"] != mtime:
+            try:
+                artefacto = leer_artefacto()
+            except (OSError, ValueError) as e:
+                print(f"Aviso: artefacto precalculado no disponible {e}")
+                artefacto = {"items": {}}
+            hash_actual = tutor_ia.hash_prompt_tutor()
+            _estado["items"] = {
+                clave: item["datos"]
+                for clave, item in artefacto.get("items", {}).items()
+                if item.get("hash_prompt") == hash_actual
+            }
+            _estado["mtime"] = mtime
+        return _estado["items"]
+
+
+def buscar(pregunta_texto, tema):
+    """ Tutoría precalculada del ejercicio o None. """
+    datos = _items_vigentes().get(clave_item(pregunta_texto, tema))
+    telemetria.cache("precalculado", datos is not None)
+    return datos
+
+
+def total_items():
+    return len(_items_vigentes())
@@ -0,0 +1,369 @@
+"""
+Verificación simbólica local (SymPy) de las respuestas de la IA.
+
+Sin llamar a la IA comprueba que:
+- una primitiva, al derivarla, devuelve el integrando;
+- una integral definida coincide numéricamente con el resultado;
+- una solución y = g(x) satisface la EDO al sustituirla;
+- en un paso intermedio "∫f dx = ... ∫g dx", derivar ambos lados da lo mismo.
+
+Los veredictos son VALIDO, INVALIDO o INDETERMINADO (no se pudo
+interpretar o se agotó el tiempo). Solo INVALIDO rechaza un ítem.
+Cada verificación corre en un pool de procesos; las de un mismo lote se
+envían juntas y comparten un único plazo, así que un cálculo costoso
+nunca bloquea la interfaz más de unos segundos. Un proceso que se pasa
+del plazo se mata y el pool se recrea. Con verificar_tutor_en_fondo ni
+siquiera esos segundos: el veredicto llega en un Future.
+"""
+import multiprocessing
+import os
+import random
+import re
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, wait as esperar_futuros
+from concurrent.futures.process import BrokenProcessPool
+
+from modules import esquemas, latex_expr
+from modules.latex_expr import ErrorLatex, SYMPY_DISPONIBLE
+
+VALIDO = "valido"
+INVALIDO = "invalido"
+INDETERMINADO = "indeterminado"
+
+TIMEOUT_SEGUNDOS = float(os.environ.get("TUTOR_VERIFICACION_TIMEOUT", 3))
+MAX_PROCESOS = int(os.environ.get("TUTOR_VERIFICACION_PROCESOS", 2))
+PUNTOS_PRUEBA = (0.37, 0.81, 1.23, 1.67, 2.09)
+TOLERANCIA = 1e-6
+# Suelo absoluto: valores del orden del ruido de evaluación cuentan como iguales
+TOLERANCIA_ABSOLUTA = 1e-12
+
+_RE_MATES = re.compile(r"\$\$(.+?)\$\$|\$(.+?)\$|\\\((.+?)\\\)", re.S)
+_RE_INTEGRAL = re.compile(
+    r"\\int\s*(?:_\s*(\{[^{}]*\}|[^\s{}^])\s*\^\s*(\{[^{}]*\}|[^\s{}]))?(.+?)(?:\\[,;!]|\s)*d([a-z])(?![a-zA-Z])",
+    re.S,
+)
+_RE_DERIVADAS = (
+    (re.compile(r"\\frac\{d\^\{?2\}?\s*y\}\{d\s*x\^\{?2\}?\}"), " ypp "),
+    (re.compile(r"\\frac\{dy\}\{dx\}"), " yp "),
+    (re.compile(r"dy\s*/\s*dx"), " yp "),
+    (re.compile(r"y\s*''"), " ypp "),
+    (re.compile(r"y\s*'"), " yp "),
+    (re.compile(r"y\s*\(\s*x\s*\)"), " y "),
+)
+
+# En un enunciado sin $...$: palabras que no son prosa aunque sean solo letras
+_FUNCIONES_PROSA = {"sin", "sen", "cos", "tan", "cot", "sec", "csc", "ln", "log", "exp", "sqrt", "arctan", "arcsin",
+                    "arccos", "sinh", "cosh", "tanh", "dx", "dy", "dt"}
+_RE_PALABRA_PROSA = re.compile(r"[^\W\d_]{2,}[.,;:]?")
+
+_lock = threading.Lock()
+_pool = None
+# Hilos que esperan los veredictos pedidos en segundo plano (el cálculo sigue en el pool de procesos)
+_hilos = ThreadPoolExecutor(max_workers=MAX_PROCESOS, thread_name_prefix="verificador")
+_stats = {VALIDO: 0, INVALIDO: 0, INDETERMINADO: 0, "tiempo_agotado": 0}
+
+
+# --- Comprobaciones (se ejecutan dentro de los procesos del pool) ---
+
+def _ecuaciones_en_prosa(texto):
+    """
+    Tramos con "=" de un enunciado escrito sin $...$ ("Resuelva la EDO
+    y' + 2y = 4 con y(0) = 1" -> ["y' + 2y = 4", "y(0) = 1"]): se corta
+    en cada palabra de prosa.
+    """
+    tramos, actual = [], []
+    for palabra in (texto or "").split() + [""]:
+        if palabra and not (_RE_PALABRA_PROSA.fullmatch(palabra) and palabra.strip(".,;:").lower() not in _FUNCIONES_PROSA):
+            actual.append(palabra)
+            continue
+        tramo = " ".join(actual).rstrip(".,;:")
+        if "=" in tramo:
+            tramos.append(tramo)
+        actual = []
+    return tramos
+
+
+def _segmentos_matematicos(texto):
+    segmentos = [next(g for g in m.groups() if g is not None) for m in _RE_MATES.finditer(texto or "")]
+    return segmentos or _ecuaciones_en_prosa(texto) + [texto or ""]
+
+
+def _lado_derecho(latex):
+    return latex.split("=")[-1]
+
+
+def _a_sympy_real(latex, x, simbolos=None):
+    """ Como latex_expr.a_sympy, pero con la variable real (derivar |x| no da ramas complejas). """
+    import sympy
+
+    return latex_expr.a_sympy(latex, simbolos).subs(sympy.Symbol(x.name), x)
+
+
+def _combinar(veredictos):
+    if INVALIDO in veredictos:
+        return INVALIDO
+    return VALIDO if VALIDO in veredictos else INDETERMINADO
+
+
+def _comparar(a, b, x):
+    """ Compara numéricamente a y b en varios puntos (las constantes libres toman valores fijos). """
+    import sympy
+
+    libres = sorted((a.free_symbols | b.free_symbols) - {x}, key=str)
+    azar = random.Random(7)
+    valores = {s: azar.uniform(0.5, 1.5) for s in libres}
+    comparados = 0
+    for punto in PUNTOS_PRUEBA:
+        valores[x] = punto
+        try:
+            va = complex(sympy.N(a.subs(valores)))
+            vb = complex(sympy.N(b.subs(valores)))
+        except (TypeError, ValueError, ZeroDivisionError):
+            continue
+        if va != va or vb != vb or abs(va) == float("inf") or abs(vb) == float("inf"):
+            continue
+        comparados += 1
+        # Relativa: y = Ce^{-9x - 15} y su derivada son diminutas, pero no iguales
+        if abs(va - vb) > TOLERANCIA * max(abs(va), abs(vb)) + TOLERANCIA_ABSOLUTA:
+            return INVALIDO
+    return VALIDO if comparados >= 3 else INDETERMINADO
+
+
+def verificar_integral(enunciado, resultado):
+    import sympy
+
+    for segmento in _segmentos_matematicos(enunciado):
+        m = _RE_INTEGRAL.search(segmento)
+        if not m:
+            continue
+        inferior, superior, integrando, variable = m.groups()
+        x = sympy.Symbol(variable, real=True)
+        try:
+            f = _a_sympy_real(integrando, x)
+            F = _a_sympy_real(_lado_derecho(resultado), x)
+            if inferior is not None:
+                a = latex_expr.a_sympy(inferior.strip("{}"))
+                b = latex_expr.a_sympy(superior.strip("{}"))
+                return _comparar(sympy.Integral(f, (x, a, b)).evalf(), F, x)
+            return _comparar(sympy.diff(F, x), f, x)
+        except (ErrorLatex, ValueError, TypeError):
+            return INDETERMINADO
+    return INDETERMINADO
+
+
+def verificar_edo(enunciado, resultado):
+    import sympy
+
+    lados_solucion = resultado.split("=")
+    if len(lados_solucion) != 2 or lados_solucion[0].strip().replace(" ", "") not in ("y", "y(x)"):
+        # Soluciones implícitas: no se verifican.
+        return INDETERMINADO
+    for segmento in _segmentos_matematicos(enunciado):
+        ecuacion = segmento
+        for patron, reemplazo in _RE_DERIVADAS:
+            ecuacion = patron.sub(reemplazo, ecuacion)
+        if " yp" not in ecuacion or ecuacion.count("=") != 1:
+            continue
+        x = sympy.Symbol("x", real=True)
+        y, yp, ypp = sympy.symbols("y yp ypp")
+        simbolos = {"y": y, "yp": yp, "ypp": ypp}
+        try:
+            izquierda, derecha = (_a_sympy_real(lado, x, simbolos) for lado in ecuacion.split("="))
+            g = _a_sympy_real(lados_solucion[1], x)
+        except (ErrorLatex, ValueError, TypeError):
+            return INDETERMINADO
+        sustitucion = {ypp: sympy.diff(g, x, 2), yp: sympy.diff(g, x), y: g}
+        # Lado a lado, no el residuo contra 0: la tolerancia es relativa a su tamaño
+        return _comparar(izquierda.subs(sustitucion), derecha.subs(sustitucion), x)
+    return INDETERMINADO
+
+
+def verificar_paso_integral(latex):
+    """
+    Paso intermedio "∫f dx = ... ∫g dx ..." (partes, fracciones parciales...):
+    al derivar ambos lados (d/dx ∫g dx = g) deben coincidir. Una igualdad
+    sin integrales puede ser una ecuación a resolver, así que no se juzga.
+    """
+    import sympy
+
+    partes = latex.split("=")
+    if len(partes) != 2 or "\\int" not in latex:
+        return INDETERMINADO
+    x = sympy.Symbol("x", real=True)
+    derivadas = []
+    for lado in partes:
+        integrales = {}
+
+        def sustituir(m):
+            if m.group(1) is not None or m.group(4) != "x":
+                raise ErrorLatex("Solo integrales indefinidas en x")
+            nombre = "I" + "abcdefghij"[len(integrales)]
+            integrales[nombre] = m.group(3)
+            return f" {nombre} "
+
+        try:
+            texto = _RE_INTEGRAL.sub(sustituir, lado)
+            simbolos = {nombre: sympy.Symbol(nombre) for nombre in integrales}
+            expr = _a_sympy_real(texto, x, simbolos)
+            derivada = sympy.diff(expr, x)
+            for nombre, integrando in integrales.items():
+                derivada += sympy.diff(expr, simbolos[nombre]) * _a_sympy_real(integrando, x)
+        except (ErrorLatex, ValueError, TypeError, IndexError):
+            return INDETERMINADO
+        if simbolos and derivada.has(*simbolos.values()):
+            # No lineal en las integrales: no se puede derivar sin resolverlas.
+            return INDETERMINADO
+        derivadas.append(derivada)
+    return _comparar(derivadas[0], derivadas[1], x)
+
+
+def _verificar_resultado(enunciado, resultado):
+    veredicto = verificar_integral(enunciado, resultado)
+    if veredicto == INDETERMINADO:
+        veredicto = verificar_edo(enunciado, resultado)
+    return veredicto
+
+
+def _verificar_tutor_local(enunciado, paso_intermedio, resultado_final):
+    return _combinar([
+        _verificar_resultado(enunciado, resultado_final or ""),
+        verificar_paso_integral(paso_intermedio or ""),
+    ])
+
+
+def _verificar_quiz_local(pregunta):
+    carga = esquemas.PreguntaQuiz.desde_dict(pregunta)
+    if carga is None:
+        return INVALIDO
+    return _verificar_resultado(carga.pregunta, carga.textos[carga.indice_correcta].replace("$", ""))
+
+
+# --- Ejecución con pool de procesos y tiempo máximo ---
+
+def _importar_sympy():
+    # Al arrancar cada proceso: la importación no cuenta en el plazo de la primera verificación
+    import sympy  # noqa: F401
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_PROCESOS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_importar_sympy)
+        return _pool
+
+
+def _terminar_pool(pool):
+    """
+    Descarta el pool y mata sus procesos: `cancel()` no detiene un cálculo
+    de SymPy ya en curso, y sin matarlo el pool queda ocupado para siempre.
+    Lo que otras sesiones tuvieran en él queda INDETERMINADO.
+    """
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    for proceso in list((getattr(pool, "_processes", None) or {}).values()):
+        proceso.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _registrar(veredicto):
+    with _lock:
+        _stats[veredicto] += 1
+    return veredicto
+
+
+def _enviar(funcion, *args):
+    """ (pool, futuro) de la verificación o None si no se puede verificar. """
+    if not SYMPY_DISPONIBLE:
+        return None
+    pool = _obtener_pool()
+    try:
+        return pool, pool.submit(funcion, *args)
+    except (BrokenProcessPool, RuntimeError, OSError) as e:
+        print(f"Aviso: pool de verificación no disponible {e}")
+        _terminar_pool(pool)
+        return None
+
+
+def _esperar_todos(enviados, timeout=None):
+    """
+    Veredictos de [(pool, futuro) o None], en orden, con un único plazo
+    para todos. Si alguno se pasa de plazo, se mata su pool.
+    """
+    futuros = [enviado[1] for enviado in enviados if enviado]
+    if futuros:
+        esperar_futuros(futuros, timeout=TIMEOUT_SEGUNDOS if timeout is None else timeout)
+    veredictos, vencidos = [], []
+    for enviado in enviados:
+        if enviado is None:
+            veredictos.append(INDETERMINADO)
+            continue
+        pool, futuro = enviado
+        if not futuro.done():
+            with _lock:
+                _stats["tiempo_agotado"] += 1
+            if pool not in vencidos:
+                vencidos.append(pool)
+            veredictos.append(_registrar(INDETERMINADO))
+            continue
+        try:
+            veredictos.append(_registrar(futuro.result()))
+        except (BrokenProcessPool, CancelledError):
+            if pool not in vencidos:
+                vencidos.append(pool)
+            veredictos.append(_registrar(INDETERMINADO))
+        except Exception as e:
+            print(f"Aviso: verificación falló {e}")
+            veredictos.append(_registrar(INDETERMINADO))
+    for pool in vencidos:
+        _terminar_pool(pool)
+    return veredictos
+
+
+def verificar_tutores(pares, timeout=None):
+    """
+    Veredictos de [(enunciado, JSON de tutor/análisis)], verificados en
+    paralelo con un único plazo para todos.
+    """
+    enviados = [
+        _enviar(_verificar_tutor_local, enunciado, datos.get('paso_intermedio'), datos.get('resultado_final'))
+        if isinstance(datos, dict) else None
+        for enunciado, datos in pares
+    ]
+    return _esperar_todos(enviados, timeout)
+
+
+def verificar_tutor(enunciado, datos, timeout=None):
+    """ Veredicto para un JSON de tutor/análisis respecto de su enunciado. """
+    return verificar_tutores([(enunciado, datos)], timeout)[0]
+
+
+def verificar_tutor_en_fondo(enunciado, datos, timeout=None):
+    """ Future con el veredicto de verificar_tutor, sin esperar a SymPy en el hilo que lo pide. """
+    return _hilos.submit(verificar_tutor, enunciado, datos, timeout)
+
+
+def verificar_analisis(datos, timeout=None):
+    """ Igual que verificar_tutor usando el enunciado transcrito por la IA. """
+    if not isinstance(datos, dict):
+        return INDETERMINADO
+    return verificar_tutor(datos.get('enunciado_latex', ''), datos, timeout)
+
+
+def filtrar_preguntas_quiz(preguntas, timeout=None):
+    """
+    Devuelve las preguntas con el esquema del quiz cuya respuesta correcta
+    no resultó INVALIDA. Se envían todas a la vez y comparten un único
+    plazo; las mal formadas se descartan antes, sin ocupar el pool.
+    """
+    preguntas = [p for p in preguntas if esquemas.validar_pregunta_quiz(p)]
+    veredictos = _esperar_todos([_enviar(_verificar_quiz_local, p) for p in preguntas], timeout)
+    return [p for p, veredicto in zip(preguntas, veredictos) if veredicto != INVALIDO]
+
+
+def estadisticas():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,84 @@
+"""
+Página de administración: latencias por ruta (p50/p95/p99), coste de la IA
+y estado de cachés y colas del proceso. Pide la clave TUTOR_ADMIN_CLAVE
+antes de mostrar nada; sin ella configurada la página queda cerrada (está
+en la barra lateral de todos los estudiantes).
+"""
+import hmac
+import os
+
+import streamlit as st
+
+from modules import almacen_preguntas, banco_indexado, cache_fotos, cache_tutor, cliente_gemini, coalescencia, dominio, enrutador_modelos, estado_compartido, graficos, historial, latex_render, pool_quiz, telemetria, verificador
+
+VENTANAS = {"15 minutos": 15 * 60, "1 hora": 60 * 60, "24 horas": 24 * 60 * 60, "7 días": 7 * 24 * 60 * 60}
+
+st.set_page_config(page_title="Telemetría", page_icon="📊", layout="wide")
+st.markdown("### 📊 Telemetría del Tutor")
+
+clave = os.environ.get("TUTOR_ADMIN_CLAVE", "")
+if not clave:
+    st.warning("Página de administración desactivada: define TUTOR_ADMIN_CLAVE para abrirla.")
+    st.stop()
+if not hmac.compare_digest(st.text_input("Clave de administración", type="password").encode(), clave.encode()):
+    st.stop()
+
+ventana = st.selectbox("Ventana", list(VENTANAS), index=1)
+telemetria.volcar()
+
+st.markdown("#### ⏱️ Latencia por ruta")
+st.caption("`llm ← llamador` es la llamada a Gemini hecha desde esa función; `ejecucion_script ← pantalla` es cada rerun.")
+filas = telemetria.percentiles(VENTANAS[ventana])
+if filas:
+    st.dataframe(filas, use_container_width=True, hide_index=True)
+else:
+    st.info("Aún no hay spans registrados en esta ventana.")
+
+st.markdown("#### 💸 Coste de la IA")
+coste = telemetria.resumen_llm(VENTANAS[ventana])
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Llamadas", coste["llamadas"])
+c2.metric("Reintentos / 429", f"{coste['reintentos']} / {coste['errores_429']}")
+c3.metric("Tokens (entrada / salida)", f"{coste['tokens_entrada']} / {coste['tokens_salida']}")
+c4.metric("KB (prompt / respuesta)", f"{coste['bytes_prompt'] // 1024} / {coste['bytes_respuesta'] // 1024}")
+
+st.markdown("#### 🔀 Enrutado de modelos (este proceso)")
+st.caption("`escalado`: llamadas de ese nivel por cada llamada al primero de la ruta (la latencia por percentiles está arriba, como `ruta/nivel`).")
+rutas = enrutador_modelos.estadisticas()
+if rutas:
+    st.dataframe(rutas, use_container_width=True, hide_index=True)
+else:
+    st.info("Aún no hay llamadas enrutadas.")
+
+st.markdown("#### 🗄️ Cachés y colas (este proceso)")
+estado = {
+    "cliente_gemini": cliente_gemini.estadisticas(),
+    "coalescencia": coalescencia.estadisticas(),
+    "cache_tutor": cache_tutor.estadisticas(),
+    "cache_fotos": cache_fotos.estadisticas(),
+    "pool_quiz": pool_quiz.estadisticas(),
+    "verificador": verificador.estadisticas(),
+    "graficos": graficos.estadisticas(),
+    "latex_render": latex_render.estadisticas(),
+    "almacen_preguntas": almacen_preguntas.estadisticas(),
+    "banco_indexado": banco_indexado.estadisticas(),
+    "dominio": dominio.estadisticas(),
+    "historial": historial.estadisticas(),
+    "estado_compartido": estado_compartido.estadisticas(),
+}
+columnas = st.columns(len(estado) // 2 + len(estado) % 2)
+for i, (nombre, datos) in enumerate(estado.items()):
+    with columnas[i % len(columnas)]:
+        st.markdown(f"**{nombre}**")
+        st.json(datos, expanded=False)
+
+st.markdown("#### 🎯 Acierto por tema (todos los estudiantes, 30 días)")
+tipo_intento = st.radio("Origen", ["quiz", "dojo", "consulta"], horizontal=True)
+aciertos = historial.acierto_por_tema(30, tipo_intento)
+if aciertos:
+    st.dataframe(aciertos, use_container_width=True, hide_index=True)
+else:
+    st.info("Aún no hay intentos registrados.")
+
+with st.expander("Métricas en formato Prometheus"):
+    st.code(telemetria.metricas_prometheus(), language="text")
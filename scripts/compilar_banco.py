@@ -0,0 +1,71 @@
+"""
+Compila el banco de preguntas al formato indexado de `banco_indexado`.
+
+Uso:
+    python -m scripts.compilar_banco [--origen preguntas.jsonl] [--salida data/banco_indexado]
+
+Sin --origen enumera el banco actual por tema (`temario.LISTA_TEMAS` y
+`banco_preguntas.obtener_preguntas_fijas`). Con --origen lee un JSON
+(lista) o JSONL de preguntas. Publica la versión nueva de forma atómica:
+los servidores en marcha la recogen solos, sin reiniciar. Antes dibuja
+las fórmulas de todas las preguntas (`latex_render`) en la caché de disco,
+para que la primera sesión que las vea no pague el render.
+"""
+import argparse
+import json
+import time
+
+from modules import banco_indexado, latex_render
+from modules.cache_tutor import normalizar_texto
+
+N_POR_TEMA = 10_000
+
+
+def enumerar_banco(rondas=3):
+    """ Todas las preguntas del banco actual (deduplicadas por tema y enunciado). """
+    from modules import banco_preguntas, temario
+
+    encontradas = {}
+    for tema in temario.LISTA_TEMAS:
+        for _ in range(rondas):
+            try:
+                preguntas = banco_preguntas.obtener_preguntas_fijas([tema], N_POR_TEMA) or []
+            except Exception as e:
+                print(f"Aviso: Banco no disponible para {tema}: {e}")
+                break
+            for p in preguntas:
+                p = dict(p, tema=p.get('tema') or tema)
+                encontradas[(p['tema'], normalizar_texto(p['pregunta']))] = p
+    return list(encontradas.values())
+
+
+def leer_origen(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        if ruta.endswith(".jsonl"):
+            return [json.loads(linea) for linea in f if linea.strip()]
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--origen", default=None)
+    parser.add_argument("--salida", default=banco_indexado.RUTA_BANCO)
+    parser.add_argument("--sin-latex", action="store_true", help="no dibujar las fórmulas por adelantado")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    preguntas = leer_origen(args.origen) if args.origen else enumerar_banco()
+    preguntas = [p for p in preguntas if p.get('pregunta') and p.get('opciones')]
+    if not args.sin_latex:
+        for p in preguntas:
+            latex_render.preparar_pregunta(p)
+        latex = latex_render.estadisticas()
+        print(f"Fórmulas: {latex['renders']} dibujadas, {latex['disco']} ya en caché, "
+              f"{latex['sin_render']} quedan para el navegador -> {latex_render.RUTA_LATEX}")
+    manifiesto = banco_indexado.compilar(preguntas, args.salida)
+    print(f"Banco {manifiesto['version']}: {manifiesto['preguntas']} preguntas en {len(manifiesto['temas'])} temas "
+          f"({time.perf_counter() - inicio:.2f} s) -> {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
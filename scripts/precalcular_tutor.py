@@ -0,0 +1,132 @@
+"""
+Pre-tutoriza todo el banco de preguntas (batch, fuera de Streamlit).
+
+Uso:
+    GOOGLE_API_KEY=... python -m scripts.precalcular_tutor --modelo gemini-1.5-flash
+
+Recorre cada tema de `temario.LISTA_TEMAS`, genera la tutoría de cada
+pregunta del banco con un pool de hilos acotado y escribe el artefacto
+que la app carga al arrancar. Es incremental y reanudable: solo procesa
+las preguntas nuevas o cuyo prompt cambió, y guarda puntos de control.
+Las entradas de preguntas que ya no están en el banco se retiran (solo si
+el banco se pudo leer entero).
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from modules import banco_preguntas, cliente_gemini, temario, tutor_ia, tutor_precalculado, verificador
+
+# `obtener_preguntas_fijas` solo expone muestreo: se pide un n grande en
+# varias rondas para cubrir el banco completo de cada tema.
+N_POR_TEMA = 10_000
+
+
+def enumerar_banco(rondas=3):
+    """
+    Devuelve ({clave: (pregunta, tema)}, completo) con todas las preguntas
+    del banco; completo es False si algún tema no se pudo leer.
+    """
+    encontradas = {}
+    completo = True
+    for tema in temario.LISTA_TEMAS:
+        for _ in range(rondas):
+            try:
+                preguntas = banco_preguntas.obtener_preguntas_fijas([tema], N_POR_TEMA) or []
+            except Exception as e:
+                print(f"Aviso: Banco no disponible para {tema}: {e}")
+                completo = False
+                break
+            for ejercicio in preguntas:
+                # Mismo tema que usa el Dojo al llamar al tutor.
+                tema_ejercicio = ejercicio.get('tema', 'Cálculo')
+                clave = tutor_precalculado.clave_item(ejercicio['pregunta'], tema_ejercicio)
+                encontradas[clave] = (ejercicio['pregunta'], tema_ejercicio)
+    return encontradas, completo
+
+
+def tutorizar(model, pregunta_texto, tema, intentos_max=3):
+    """ Llama a la IA y devuelve un JSON de tutor válido o None. """
+    prompt = tutor_ia.construir_prompt_tutor(pregunta_texto, tema)
+    for _ in range(intentos_max):
+        try:
+            respuesta = cliente_gemini.generar(model, prompt)
+        except cliente_gemini.ErrorIA as e:
+            print(f"Aviso: IA no disponible para [{tema}] {e}")
+            return None
+        datos = tutor_ia.limpiar_json(respuesta.text)
+        if tutor_ia.validar_tutor(datos) and verificador.verificar_tutor(pregunta_texto, datos) != verificador.INVALIDO:
+            return datos
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default=os.environ.get("GEMINI_MODELO", "gemini-1.5-flash"))
+    parser.add_argument("--salida", default=tutor_precalculado.RUTA_ARTEFACTO)
+    parser.add_argument("--workers", type=int, default=4, help="Llamadas simultáneas a la IA")
+    parser.add_argument("--checkpoint", type=int, default=20, help="Guardar cada N tutorías nuevas")
+    parser.add_argument("--forzar", action="store_true", help="Regenerar aunque ya exista")
+    args = parser.parse_args()
+
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    model = genai.GenerativeModel(args.modelo)
+
+    artefacto = tutor_precalculado.leer_artefacto(args.salida)
+    items = artefacto.setdefault("items", {})
+    hash_actual = tutor_ia.hash_prompt_tutor()
+
+    banco, completo = enumerar_banco()
+    if completo and banco:
+        retiradas = [clave for clave in items if clave not in banco]
+        for clave in retiradas:
+            del items[clave]
+    else:
+        # Con el banco a medias, retirar borraría tutorías de preguntas vigentes
+        retiradas = []
+        print("Aviso: banco incompleto, no se retiran tutorías antiguas")
+    pendientes = {
+        clave: valor for clave, valor in banco.items()
+        if args.forzar or items.get(clave, {}).get("hash_prompt") != hash_actual
+    }
+    print(f"Banco: {len(banco)} preguntas | pendientes: {len(pendientes)} | retiradas: {len(retiradas)} "
+          f"| workers: {args.workers}")
+
+    def guardar():
+        artefacto.update({
+            "formato": tutor_precalculado.FORMATO_ARTEFACTO,
+            "version_prompt": tutor_ia.VERSION_PROMPT_TUTOR,
+            "hash_prompt": hash_actual,
+            "modelo": args.modelo,
+            "generado": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+        tutor_precalculado.escribir_artefacto(artefacto, args.salida)
+
+    nuevas, fallidas = 0, 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futuros = {
+            pool.submit(tutorizar, model, pregunta, tema): (clave, pregunta, tema)
+            for clave, (pregunta, tema) in pendientes.items()
+        }
+        for futuro in as_completed(futuros):
+            clave, pregunta, tema = futuros[futuro]
+            datos = futuro.result()
+            if datos is None:
+                fallidas += 1
+                print(f"❌ Sin tutoría válida: [{tema}] {pregunta[:60]}")
+                continue
+            items[clave] = {"tema": tema, "pregunta": pregunta, "hash_prompt": hash_actual, "datos": datos}
+            nuevas += 1
+            if nuevas % args.checkpoint == 0:
+                guardar()
+                print(f"💾 Checkpoint: {nuevas}/{len(pendientes)}")
+
+    guardar()
+    print(f"✅ Listo: {nuevas} nuevas, {fallidas} fallidas, {len(items)} en {args.salida}")
+    return 1 if fallidas else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())